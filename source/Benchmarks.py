@@ -0,0 +1,432 @@
+#-----------------------------------------------------------------------------#
+# Benchmarks functions:
+#    Timings of the parts of the model optimizations are judged by, swept
+#    over the number of electors N and of candidates K:
+#     - "electorUpdate": one iteration of Elector.calculateStrategicUtilities
+#       over a list of Elector objects, as the model was first written:
+#       every elector recounts the whole electorate and computes its own
+#       Skellam terms, so an iteration is O(N^2);
+#     - "electorUpdateCached": the same with a VoteTally and a
+#       PivotalityCache, i.e. the per-elector path at its fastest;
+#     - "countVoteIntentions": GlobalFuncs.countVoteIntentions over the same
+#       list of Elector objects;
+#     - "populationCount": the same count by ElectorPopulation;
+#     - "populationUpdate": one synchronous iteration of ElectorPopulation;
+#     - "populationSetup": building an ElectorPopulation and drawing its
+#       sincere utilities;
+#     - "fullRun": Cox1994Model.runSimulation from setup to convergence with
+#       DEFAULT_CONFIG (sequential update, linear space);
+#     - "fullRunSynchronousLogSpace": the same with the synchronous update in
+#       log space, the configuration large electorates are run with.
+#    Besides these, "startup" times importing the simulation entry point
+#    (Cox1994Model) in a fresh interpreter, which thousands of short runs pay
+#    once each, and checks that it leaves out the modules only some runs use
+#    (DEFERRED_MODULES: plotting, SciPy, Numba, the parallel backends and the
+#    profiler), which are imported on first use.
+#    The Elector object benchmarks are only run up to OBJECT_MAX_ELECTORS, the
+#    original update up to ORIGINAL_MAX_ELECTORS and the default full run up
+#    to DEFAULT_RUN_MAX_ELECTORS (an iteration of the original update takes
+#    3.6 s with 10^3 electors, a default run 21 s with 10^4).
+#    Each benchmark is repeated and both its best and its median time are
+#    kept; comparisons use the best one, the least disturbed by whatever
+#    else the machine was doing.
+#
+#    Results are written as JSON with the metadata of the machine they were
+#    measured on, can be plotted as log-log scaling curves (time against N,
+#    one curve per benchmark and K) along with the fitted exponent of each
+#    curve, and compared with a baseline: the comparison fails when any
+#    benchmark got slower than the baseline by more than the given budget.
+#
+# Usage as a script:
+#    python Benchmarks.py run results.json [quick]
+#    python Benchmarks.py plot results.json scaling.png
+#    python Benchmarks.py compare baseline.json results.json [budget]
+#    python Benchmarks.py startup [budget]
+#    where compare exits with status 1 if any benchmark regressed, and
+#    startup if importing the entry point took longer than budget seconds
+#    (default: STARTUP_BUDGET) or imported any of DEFERRED_MODULES.
+#-----------------------------------------------------------------------------#
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+import multiprocessing
+from timeit import default_timer as timer
+import numpy as np
+
+import Cox1994Model
+import GlobalFuncs
+import RandomStreams
+from Elector import Elector
+from Candidate import Candidate
+from VoteTally import VoteTally
+from PivotalityCache import PivotalityCache
+from ElectorPopulation import ElectorPopulation
+
+#Electorate sizes and numbers of candidates swept by default, and by a quick
+#run (e.g. to check a change before a full run):
+ELECTOR_COUNTS = [10**2, 10**3, 10**4, 10**5, 10**6]
+CANDIDATE_COUNTS = [3, 4, 6, 10]
+QUICK_ELECTOR_COUNTS = [10**2, 10**3, 10**4]
+QUICK_CANDIDATE_COUNTS = [4]
+
+#Largest electorate the Elector object benchmarks are run on, the original
+#(recounting) update of Elector objects and the full run of DEFAULT_CONFIG:
+OBJECT_MAX_ELECTORS = 10**4
+ORIGINAL_MAX_ELECTORS = 10**3
+DEFAULT_RUN_MAX_ELECTORS = 10**4
+
+#Times each benchmark is repeated:
+REPEATS = 5
+
+#Slowdown relative to the baseline that counts as a regression:
+REGRESSION_BUDGET = 0.10
+
+#Module whose import is timed by the startup benchmark, modules it must not
+#import, and the seconds it may take at most (the import takes about 0.14 s
+#on the machine the budget was set on, 0.37 s when it still loaded
+#scipy.special):
+STARTUP_MODULE = "Cox1994Model"
+DEFERRED_MODULES = ["matplotlib", "scipy", "numba", "ShardedPopulation",      \
+                    "ThreadedPopulation", "RunProfiler"]
+STARTUP_BUDGET = 0.3
+
+#Code run by each fresh interpreter of the startup benchmark, which prints the
+#seconds the import took and the deferred modules it imported anyway:
+STARTUP_CODE = "import sys, json\n"                                           \
+               "from timeit import default_timer as timer\n"                  \
+               "startTime = timer()\n"                                        \
+               "import %s\n"                                                  \
+               "seconds = timer() - startTime\n"                              \
+               "print(json.dumps([seconds, [name for name in %r "             \
+               "if name in sys.modules]]))\n"
+
+#Seed every benchmark draws its electorate from, so that runs of the suite
+#time the very same work:
+BENCHMARK_SEED = 20180315
+
+#Function that gives the metadata of the machine and libraries benchmarks
+#are measured with:
+def machineMetadata():
+    return {"platform": platform.platform(),                                  \
+            "processor": platform.processor(),                                \
+            "machine": platform.machine(),                                    \
+            "nCores": multiprocessing.cpu_count(),                            \
+            "python": platform.python_version(),                              \
+            "numpy": np.__version__,                                          \
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+#Function that times function() repeats times, calling setup() before each
+#call (untimed) and passing function what setup gave, and gives the best and
+#median time in seconds:
+def timeRepeats(setup, function, repeats=REPEATS):
+    times = []
+    for repeat in range(0, repeats):
+        state = setup()
+        startTime = timer()
+        function(state)
+        times.append(timer() - startTime)
+    return {"best": min(times), "median": float(np.median(times))}
+
+#Function that gives a list of Elector objects with drawn sincere utilities,
+#and the candidates they vote for:
+def electorObjects(nElectors, nCandidates):
+    allCandidates = [Candidate(candidateID)                                   \
+                     for candidateID in range(0, nCandidates)]
+    population = populationOf(nElectors, nCandidates)
+    allElectors = []
+    for electorID in range(0, nElectors):
+        elector = Elector(electorID, nCandidates)
+        elector.sincereUtilities = np.array(                                  \
+            population.sincereUtilities[electorID])
+        allElectors.append(elector)
+    return allElectors, allCandidates
+
+#Function that gives an ElectorPopulation with drawn sincere utilities:
+def populationOf(nElectors, nCandidates):
+    allCandidates = [Candidate(candidateID)                                   \
+                     for candidateID in range(0, nCandidates)]
+    population = ElectorPopulation(nElectors, nCandidates, logSpace=True)
+    population.calcSincereUtilities(allCandidates, 0, 100, "uniform",         \
+                                    RandomStreams.seedSequence(BENCHMARK_SEED))
+    return population
+
+#Benchmark of one iteration of Elector.calculateStrategicUtilities as first
+#written, without a VoteTally or a PivotalityCache:
+def benchElectorUpdate(nElectors, nCandidates, repeats):
+    def function(state):
+        allElectors, allCandidates = state
+        for elector in allElectors:
+            elector.calculateStrategicUtilities(allCandidates, allElectors,   \
+                                                Cox1994Model.MIN_UTIL, 0)
+    return timeRepeats(lambda: electorObjects(nElectors, nCandidates),        \
+                       function, repeats)
+
+#Benchmark of one iteration of Elector.calculateStrategicUtilities reading a
+#VoteTally and sharing a PivotalityCache:
+def benchElectorUpdateCached(nElectors, nCandidates, repeats):
+    def setup():
+        allElectors, allCandidates = electorObjects(nElectors, nCandidates)
+        tally = VoteTally(nCandidates)
+        tally.votes[:] = GlobalFuncs.countVoteIntentions(allElectors,         \
+                                                         allCandidates, 0)
+        return allElectors, allCandidates, tally, PivotalityCache()
+    def function(state):
+        allElectors, allCandidates, tally, cache = state
+        for elector in allElectors:
+            elector.calculateStrategicUtilities(allCandidates, allElectors,   \
+                                                Cox1994Model.MIN_UTIL, 0,     \
+                                                tally, cache)
+    return timeRepeats(setup, function, repeats)
+
+#Benchmark of GlobalFuncs.countVoteIntentions over Elector objects:
+def benchCountVoteIntentions(nElectors, nCandidates, repeats):
+    state = electorObjects(nElectors, nCandidates)
+    def function(state):
+        GlobalFuncs.countVoteIntentions(state[0], state[1], 0)
+    return timeRepeats(lambda: state, function, repeats)
+
+#Benchmark of the count of an ElectorPopulation:
+def benchPopulationCount(nElectors, nCandidates, repeats):
+    population = populationOf(nElectors, nCandidates)
+    def function(population):
+        population.chooseCandidates(0)
+    return timeRepeats(lambda: population, function, repeats)
+
+#Benchmark of one synchronous iteration of an ElectorPopulation:
+def benchPopulationUpdate(nElectors, nCandidates, repeats):
+    allCandidates = [Candidate(candidateID)                                   \
+                     for candidateID in range(0, nCandidates)]
+    def function(population):
+        population.calculateStrategicUtilities(allCandidates,                 \
+                                               Cox1994Model.MIN_UTIL, 0,      \
+                                               "synchronous")
+    return timeRepeats(lambda: populationOf(nElectors, nCandidates),          \
+                       function, repeats)
+
+#Benchmark of building and drawing an ElectorPopulation:
+def benchPopulationSetup(nElectors, nCandidates, repeats):
+    def function(state):
+        populationOf(nElectors, nCandidates)
+    return timeRepeats(lambda: None, function, repeats)
+
+#Benchmark of a full run of DEFAULT_CONFIG, from setup to convergence:
+def benchFullRun(nElectors, nCandidates, repeats):
+    config = {"nElectors": nElectors, "nCandidates": nCandidates,             \
+              "seed": BENCHMARK_SEED}
+    def function(state):
+        Cox1994Model.runSimulation(config)
+    return timeRepeats(lambda: None, function, repeats)
+
+#Benchmark of a full synchronous run in log space:
+def benchFullRunSynchronousLogSpace(nElectors, nCandidates, repeats):
+    config = {"nElectors": nElectors, "nCandidates": nCandidates,             \
+              "updateMode": "synchronous", "logSpace": True,                  \
+              "seed": BENCHMARK_SEED}
+    def function(state):
+        Cox1994Model.runSimulation(config)
+    return timeRepeats(lambda: None, function, repeats)
+
+#Benchmarks by name, with the largest electorate they are run on (None: any):
+BENCHMARKS = {
+    "electorUpdate": (benchElectorUpdate, ORIGINAL_MAX_ELECTORS),
+    "electorUpdateCached": (benchElectorUpdateCached, OBJECT_MAX_ELECTORS),
+    "countVoteIntentions": (benchCountVoteIntentions, OBJECT_MAX_ELECTORS),
+    "populationCount": (benchPopulationCount, None),
+    "populationUpdate": (benchPopulationUpdate, None),
+    "populationSetup": (benchPopulationSetup, None),
+    "fullRun": (benchFullRun, DEFAULT_RUN_MAX_ELECTORS),
+    "fullRunSynchronousLogSpace": (benchFullRunSynchronousLogSpace, None),
+}
+
+#Benchmark of importing the entry point in a fresh interpreter (run from this
+#file's directory), giving the best and median time and the deferred modules
+#that were imported:
+def benchStartup(repeats=REPEATS, module=STARTUP_MODULE):
+    code = STARTUP_CODE % (module, DEFERRED_MODULES)
+    times = []
+    deferredImported = set()
+    for repeat in range(0, repeats):
+        output = subprocess.check_output(                                     \
+            [sys.executable, "-c", code],                                     \
+            cwd=os.path.dirname(os.path.abspath(__file__)))
+        seconds, imported = json.loads(output.decode().strip().split("\n")[-1])
+        times.append(seconds)
+        deferredImported.update(imported)
+    return {"best": min(times), "median": float(np.median(times)),           \
+            "deferredImported": sorted(deferredImported)}
+
+#Function that gives what the startup benchmark failed on: its best time
+#being over budget seconds, and every deferred module it imported:
+def checkStartup(startup, budget=STARTUP_BUDGET):
+    failures = []
+    if startup["best"] > budget:
+        failures.append("import took %.3f s (budget: %.3f s)"                 \
+                        % (startup["best"], budget))
+    for name in startup["deferredImported"]:
+        failures.append("import loaded deferred module " + name)
+    return failures
+
+#Function that runs every benchmark (or the given ones) over every
+#combination of electorate size and number of candidates, and gives the
+#results with the machine's metadata:
+def runBenchmarks(electorCounts=ELECTOR_COUNTS,                               \
+                  candidateCounts=CANDIDATE_COUNTS, benchmarks=None,          \
+                  repeats=REPEATS, verbose=False):
+    if benchmarks is None:
+        benchmarks = sorted(BENCHMARKS)
+    results = []
+    for benchmark in benchmarks:
+        function, maxElectors = BENCHMARKS[benchmark]
+        for nCandidates in candidateCounts:
+            for nElectors in electorCounts:
+                if maxElectors is not None and nElectors > maxElectors:
+                    continue
+                result = {"benchmark": benchmark, "nElectors": nElectors,     \
+                          "nCandidates": nCandidates, "repeats": repeats}
+                result.update(function(nElectors, nCandidates, repeats))
+                results.append(result)
+                if verbose:
+                    print(json.dumps(result))
+    startup = benchStartup(repeats)
+    if verbose:
+        print(json.dumps({"benchmark": "startup", "startup": startup}))
+    return {"machine": machineMetadata(), "results": results,                \
+            "startup": startup}
+
+#Function that gives, for every benchmark and number of candidates, the
+#exponent of its scaling with the number of electors, i.e. the slope of the
+#least squares line through log(best time) against log(nElectors):
+def scalingExponents(benchmarkResults):
+    curves = scalingCurves(benchmarkResults)
+    exponents = {}
+    for key in curves:
+        electorCounts, times = curves[key]
+        if len(electorCounts) > 1:
+            exponents[key] = float(np.polyfit(np.log(electorCounts),          \
+                                              np.log(times), 1)[0])
+    return exponents
+
+#Function that gives the scaling curves of the results, as a dictionary from
+#"benchmark K=nCandidates" to the lists of electorate sizes and best times:
+def scalingCurves(benchmarkResults):
+    curves = {}
+    for result in benchmarkResults["results"]:
+        key = result["benchmark"] + " K=" + str(result["nCandidates"])
+        curves.setdefault(key, ([], []))
+        curves[key][0].append(result["nElectors"])
+        curves[key][1].append(result["best"])
+    return curves
+
+#Function that plots the scaling curves of the results on log-log axes, with
+#the fitted exponent of each curve in the legend, and saves them:
+def plotScaling(benchmarkResults, outputPath):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as pyplot
+    curves = scalingCurves(benchmarkResults)
+    exponents = scalingExponents(benchmarkResults)
+    figure, axes = pyplot.subplots(figsize=(8, 6))
+    for key in sorted(curves):
+        label = key
+        if key in exponents:
+            label += " (N^%.2f)" % exponents[key]
+        axes.loglog(curves[key][0], curves[key][1], marker="o", label=label)
+    axes.set_xlabel("number of electors")
+    axes.set_ylabel("best time (s)")
+    axes.set_title(benchmarkResults["machine"]["platform"])
+    axes.legend(fontsize="small")
+    figure.savefig(outputPath, bbox_inches="tight")
+    pyplot.close(figure)
+
+#Function that compares results with a baseline, benchmark by benchmark, and
+#gives the list of those whose best time grew by more than budget (as a
+#fraction of the baseline), with both times and their ratio:
+def compareResults(baselineResults, benchmarkResults,                         \
+                   budget=REGRESSION_BUDGET):
+    baselineTimes = {}
+    for result in baselineResults["results"]:
+        baselineTimes[(result["benchmark"], result["nElectors"],              \
+                       result["nCandidates"])] = result["best"]
+    regressions = []
+    for result in benchmarkResults["results"]:
+        key = (result["benchmark"], result["nElectors"],                      \
+               result["nCandidates"])
+        if key not in baselineTimes:
+            continue
+        ratio = result["best"] / baselineTimes[key]
+        if ratio > 1 + budget:
+            regressions.append({"benchmark": key[0], "nElectors": key[1],     \
+                                "nCandidates": key[2],                        \
+                                "baseline": baselineTimes[key],               \
+                                "best": result["best"], "ratio": ratio})
+    if "startup" in baselineResults and "startup" in benchmarkResults:
+        ratio = benchmarkResults["startup"]["best"]                           \
+                / baselineResults["startup"]["best"]
+        if ratio > 1 + budget:
+            regressions.append({"benchmark": "startup",                       \
+                                "baseline": baselineResults["startup"]["best"],\
+                                "best": benchmarkResults["startup"]["best"],  \
+                                "ratio": ratio})
+    return regressions
+
+
+#-----------------------------------------------------------------------------#
+# Running as a script:
+#-----------------------------------------------------------------------------#
+
+if __name__ == "__main__":
+    command = sys.argv[1]
+    if command == "run":
+        if len(sys.argv) > 3 and sys.argv[3] == "quick":
+            benchmarkResults = runBenchmarks(QUICK_ELECTOR_COUNTS,            \
+                                             QUICK_CANDIDATE_COUNTS,          \
+                                             verbose=True)
+        else:
+            benchmarkResults = runBenchmarks(verbose=True)
+        benchmarkResults["exponents"] = scalingExponents(benchmarkResults)
+        with open(sys.argv[2], "w") as outputFile:
+            json.dump(benchmarkResults, outputFile, indent=1)
+    elif command == "plot":
+        with open(sys.argv[2]) as inputFile:
+            plotScaling(json.load(inputFile), sys.argv[3])
+    elif command == "compare":
+        with open(sys.argv[2]) as baselineFile:
+            baselineResults = json.load(baselineFile)
+        with open(sys.argv[3]) as inputFile:
+            benchmarkResults = json.load(inputFile)
+        budget = REGRESSION_BUDGET
+        if len(sys.argv) > 4:
+            budget = float(sys.argv[4])
+        for key in ["platform", "processor", "nCores"]:
+            if baselineResults["machine"][key] !=                             \
+               benchmarkResults["machine"][key]:
+                print("Warning: baseline measured on another machine ("       \
+                      + key + ": " + str(baselineResults["machine"][key])     \
+                      + ")")
+        regressions = compareResults(baselineResults, benchmarkResults, budget)
+        for regression in regressions:
+            print("Regression: " + json.dumps(regression, sort_keys=True))
+        if len(regressions) > 0:
+            sys.exit(1)
+        print("No regression beyond " + str(budget))
+    elif command == "startup":
+        budget = STARTUP_BUDGET
+        if len(sys.argv) > 2:
+            budget = float(sys.argv[2])
+        startup = benchStartup()
+        print(json.dumps(startup, sort_keys=True))
+        failures = checkStartup(startup, budget)
+        for failure in failures:
+            print("Startup: " + failure)
+        if len(failures) > 0:
+            sys.exit(1)
+        print("Startup within " + str(budget) + " s")
+    else:
+        raise ValueError("Unknown benchmark command: " + str(command))
+
+#-----------------------------------------------------------------------------#
+# End of file
+#-----------------------------------------------------------------------------#
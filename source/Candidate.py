@@ -25,5 +25,5 @@ class Candidate:
      
     #function that prints the candidates winning probability for debugging:
     def printWinProb(self, nElectors):
-        print "Cand " + str(self.ID) + "'s winprob: "                         \
-                      + str(self.winProbability(nElectors))
\ No newline at end of file
+        print("Cand " + str(self.ID) + "'s winprob: "                         \
+                      + str(self.winProbability(nElectors)))
\ No newline at end of file
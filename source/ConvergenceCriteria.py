@@ -0,0 +1,135 @@
+#-----------------------------------------------------------------------------#
+# ConvergenceCriteria-owned Variables:
+#    tallyTolerance: largest change of any candidate's vote share between two
+#                    iterations that counts as converged (None: not used)
+#    utilityTolerance: largest change of any elector's strategic utilities,
+#                      each row divided by its largest (absolute) utility,
+#                      between two iterations that counts as converged (None:
+#                      not used)
+#    marginTolerance: relative argmax margin below which the electors still
+#                     switching candidates count as indifferent (None: not
+#                     used)
+#    MIN_UTIL: utility given to each elector's least preferred candidate,
+#              which is left out of the utility measures
+#    lastTally: tally of the previous iteration
+#    lastChosen: chosen candidates of the previous iteration
+#    lastUtilities: strategic utilities of the previous iteration, only kept
+#                   when utilityTolerance is used
+#    measures: dictionary with the value of every measure in use at the last
+#              check
+#
+# Besides the exact criterion of the main loop (the same tally twice in a
+# row), a run can be stopped by any of these, each computed for the whole
+# electorate with a few array operations per iteration:
+#  - "tallyShare": no candidate's vote share moved by more than
+#    tallyTolerance, i.e. the tally is within tallyTolerance * nElectors votes
+#    of the previous one for every candidate;
+#  - "utilityChange": no elector's utilities, divided by their largest one,
+#    moved by more than utilityTolerance, so choices can only change for
+#    electors whose margin is below that. Choices only depend on the ordering
+#    of each row, so the rows are compared up to their scale, which also
+#    makes the measure the same with and without logSpace (where the scale
+#    of a row can change by hundreds of orders of magnitude in an iteration);
+#  - "argmaxMargin": every elector that switched candidates in the iteration
+#    ended up with its best candidate less than marginTolerance (relative to
+#    its largest utility) ahead of the second one, i.e. the only votes still
+#    moving are those of electors indifferent within that margin. Electors
+#    whose utilities all underflowed to zero choose arbitrarily rather than
+#    out of indifference, so they never count as within the margin.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+
+#Measures of every criterion, in the order they are checked:
+CONVERGENCE_CRITERIA = ["tallyShare", "utilityChange", "argmaxMargin"]
+
+class ConvergenceCriteria(object):
+
+    #overload of class constructor, that initializes criteria-owned variables
+    def __init__(self, MIN_UTIL, tallyTolerance=None, utilityTolerance=None,  \
+                 marginTolerance=None):
+        self.MIN_UTIL = MIN_UTIL
+        self.tallyTolerance = tallyTolerance
+        self.utilityTolerance = utilityTolerance
+        self.marginTolerance = marginTolerance
+        self.lastTally = None
+        self.lastChosen = None
+        self.lastUtilities = None
+        self.measures = {}
+
+    #keep what the next check compares against, before the population is
+    #updated:
+    def snapshot(self, population):
+        if self.utilityTolerance is not None:
+            self.lastUtilities = np.array(population.strategicUtilities)
+        self.lastChosen = np.array(population.chosenCandidates)
+
+    #give the first criterion met by the population after the given iteration
+    #(see CONVERGENCE_CRITERIA), or None, and keep their measures:
+    def check(self, population, iteration, tally):
+        tally = np.array(tally)
+        lastTally = self.lastTally
+        self.lastTally = tally
+        self.measures = {}
+        if iteration < 1:
+            return None
+        if self.tallyTolerance is not None:
+            self.measures["tallyShare"] = tallyShareChange(lastTally, tally)
+        if self.utilityTolerance is not None:
+            self.measures["utilityChange"] = utilityChange(                   \
+                self.lastUtilities, population.strategicUtilities,            \
+                self.MIN_UTIL)
+        if self.marginTolerance is not None:
+            switched = self.lastChosen != population.chosenCandidates
+            self.measures["argmaxMargin"] = argmaxMargin(                     \
+                population.strategicUtilities[switched], self.MIN_UTIL)
+        if "tallyShare" in self.measures and                                  \
+           self.measures["tallyShare"] <= self.tallyTolerance:
+            return "tallyShare"
+        if "utilityChange" in self.measures and                               \
+           self.measures["utilityChange"] <= self.utilityTolerance:
+            return "utilityChange"
+        if "argmaxMargin" in self.measures and                                \
+           self.measures["argmaxMargin"] < self.marginTolerance:
+            return "argmaxMargin"
+        return None
+
+#Function that gives the largest change of any candidate's vote share:
+def tallyShareChange(lastTally, tally):
+    nElectors = max(np.sum(tally), 1)
+    return float(np.max(np.abs(tally - lastTally))) / nElectors
+
+#Function that gives the largest change of any elector's utilities, each row
+#divided by its largest (absolute) utility and leaving out the candidates set
+#to MIN_UTIL:
+def utilityChange(lastUtilities, utilities, MIN_UTIL):
+    if len(utilities) == 0:
+        return 0.0
+    kept = (utilities != MIN_UTIL) & (lastUtilities != MIN_UTIL)
+    lastUtilities = normalizeRows(np.where(kept, lastUtilities, 0))
+    utilities = normalizeRows(np.where(kept, utilities, 0))
+    return float(np.max(np.abs(utilities - lastUtilities)))
+
+#Function that divides each row by its largest absolute value (rows of zeros
+#are left as they are):
+def normalizeRows(utilities):
+    scales = np.max(np.abs(utilities), axis=1)
+    scales = np.where(scales > 0, scales, 1)
+    return utilities / scales[:,None]
+
+#Function that gives the largest margin, over the given electors, between
+#their best and second best candidates, relative to their largest (absolute)
+#utility and leaving out the candidates set to MIN_UTIL (0 for no electors,
+#infinite for electors whose utilities are all zero):
+def argmaxMargin(utilities, MIN_UTIL):
+    if len(utilities) == 0:
+        return 0.0
+    if utilities.shape[1] < 3:
+        return np.inf
+    kept = utilities != MIN_UTIL
+    ranked = np.sort(np.where(kept, utilities, -np.inf), axis=1)
+    scales = np.max(np.where(kept, np.abs(utilities), 0), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        margins = (ranked[:,-1] - ranked[:,-2]) / scales
+    margins = np.where(np.isnan(margins), np.inf, margins)
+    return float(np.max(margins))
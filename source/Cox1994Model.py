@@ -15,96 +15,325 @@
 # Import libraries:
 #-----------------------------------------------------------------------------#
 import sys
+from timeit import default_timer as timer
 import numpy as np
-from scipy.stats import skellam
 
-seed = np.random.randint(0,2**32 - 1)
-print "Seed: " + str(seed) + "\n"
-np.random.seed(seed)
-
-
-from Elector import Elector
+from ElectorPopulation import ElectorPopulation
 from Candidate import Candidate
+from SimulationResult import SimulationResult
+from TallyHistory import TallyHistory, CYCLE_REPEATS
+from ConvergenceCriteria import ConvergenceCriteria, CONVERGENCE_CRITERIA
+from UpdateSchedule import UpdateSchedule, UPDATE_FRACTION, DAMPING
+from PhaseTimers import PhaseTimers
 import GlobalFuncs
+import RandomStreams
 
 #-----------------------------------------------------------------------------#
 # Environmental or global variables
 #-----------------------------------------------------------------------------#
 
-#Initialize parameters:
-nElectors = 100 #Number of electors
-nCandidates = 4 #Number of candidates
-minPreference = 0 #min value of 1-D preference of electors and candidates
-maxPreference = 100 #max value of 1-D preference of electors and candidates
-allElectors = [None] * nElectors #list that stores the electors
-allCandidates = [None] * nCandidates #list that stores the candidates
-leastCandidates = [0] * nCandidates 
 MIN_UTIL = -10**10
 MAX_ITERATION = 100
 
+#Default parameters, any of which a config passed to runSimulation overrides:
+DEFAULT_CONFIG = {
+    "nElectors": 100, #Number of electors
+    "nCandidates": 4, #Number of candidates
+    "minPreference": 0, #min value of 1-D preference of electors and candidates
+    "maxPreference": 100, #max value of 1-D preference of electors and candidates
+    "distribution": "uniform", #sincere utility generator (the Dirichlet ones, written for 4 candidates, are interpolated to nCandidates), or {"alphas": ..., "weights": ...} with nCandidates alphas per component (see utilityGenerator)
+    "updateMode": "sequential", #"sequential" (the original dynamics), "synchronous" or a schedule (see UPDATE_MODES)
+    "updateFraction": UPDATE_FRACTION, #electors updating per iteration of "partial"
+    "damping": DAMPING, #previous utilities kept per iteration of "damped"
+    "logSpace": False, #compute pivotalities in log space (needed for large nElectors)
+    "approxThreshold": None, #vote count above which Skellam terms are approximated
+    "nShards": 1, #worker processes sharing the electorate (sequential modes update in the parent, unsplit)
+    "nThreads": 1, #worker threads updating the electorate (sequential modes split only long runs)
+    "kernel": "numpy", #"numpy" or "numba" per-elector loops (see KERNELS)
+    "precision": "float64", #storage precision of the utilities (see PRECISIONS)
+    "precisionReference": False, #count choices differing from a float64 run
+    "instrument": False, #record per-phase times and counters (see PhaseTimers)
+    "profilePath": None, #path prefix of cProfile/tracemalloc reports (see RunProfiler)
+    "maxIterations": MAX_ITERATION, #iterations after which the loop stops regardless
+    "cycleRepeats": CYCLE_REPEATS, #times a cycle of tallies goes round before stopping
+    "tallyTolerance": None, #vote share change counted as converged (see ConvergenceCriteria)
+    "utilityTolerance": None, #scale-free utility change counted as converged
+    "marginTolerance": None, #argmax margin under which switching electors count as indifferent
+    "seed": None, #root seed of the random streams (None: fresh entropy)
+    "spawnKey": (), #position of the run under the root seed (see RandomStreams)
+    "verbose": False #print the progress of the run as the script does
+}
+
+
 
 #-----------------------------------------------------------------------------#
-# Populating the world:
+# Simulation:
 #-----------------------------------------------------------------------------#
 
-#Generate candidates:
-for newCandidateID in range(0, nCandidates):
-    cand = Candidate(newCandidateID)
-    allCandidates[newCandidateID] = cand
+#fill the missing parameters of a config with their defaults, refusing the
+#ones runSimulation would not know what to do with:
+def completeConfig(config=None):
+    completedConfig = dict(DEFAULT_CONFIG)
+    if config is not None:
+        for key in config:
+            if key not in DEFAULT_CONFIG:
+                raise ValueError("Unknown config parameter: " + str(key))
+        completedConfig.update(config)
+    return completedConfig
+
+#run one simulation from populating the world to convergence, and give its
+#outcome as a SimulationResult. Nothing is printed unless config["verbose"].
+#With config["profilePath"], the run is profiled (see RunProfiler):
+def runSimulation(config=None):
+    config = completeConfig(config)
+    if config["profilePath"] is not None:
+        import RunProfiler
+        return RunProfiler.profileCall(config["profilePath"], runConfig, config)
+    return runConfig(config)
+
+#run one simulation with a complete config (see runSimulation):
+def runConfig(config):
+    verbose = config["verbose"]
+    nElectors = config["nElectors"]
+    nCandidates = config["nCandidates"]
+    startTime = timer()
+
+    #Every draw of the run comes from streams of this SeedSequence, never from
+    #the global NumPy state, so the run is the same wherever it executes:
+    sequence = RandomStreams.seedSequence(config["seed"], config["spawnKey"])
+    seed = sequence.entropy
+    if verbose:
+        print("Seed: " + str(seed) + "\n")
+
+    #Generate candidates:
+    allCandidates = [None] * nCandidates #list that stores the candidates
+    for newCandidateID in range(0, nCandidates):
+        cand = Candidate(newCandidateID)
+        allCandidates[newCandidateID] = cand
+
+    #Generate electors, stored as the arrays of a single population, split
+    #into shared memory shards or thread blocks if more than one worker is
+    #asked for (see ThreadedPopulation for when each pays off; neither
+    #backend is imported unless used):
+    if config["nShards"] > 1:
+        from ShardedPopulation import ShardedPopulation
+        population = ShardedPopulation(nElectors, nCandidates,                \
+                                       config["nShards"], config["logSpace"], \
+                                       config["approxThreshold"],             \
+                                       config["kernel"], config["precision"])
+    elif config["nThreads"] > 1:
+        from ThreadedPopulation import ThreadedPopulation
+        population = ThreadedPopulation(nElectors, nCandidates,               \
+                                        config["nThreads"], config["logSpace"],\
+                                        config["approxThreshold"],            \
+                                        config["kernel"],                     \
+                                        precision=config["precision"])
+    else:
+        population = ElectorPopulation(nElectors, nCandidates,                \
+                                       config["logSpace"],                    \
+                                       config["approxThreshold"],             \
+                                       config["kernel"], config["precision"])
+    try:
+        return runPopulation(config, population, allCandidates, sequence,     \
+                             startTime)
+    finally:
+        if config["nShards"] > 1 or config["nThreads"] > 1:
+            population.close()
+
+#keep a memory snapshot under the given label if the run is profiled (only
+#then is RunProfiler imported):
+def keepSnapshot(config, label):
+    if config["profilePath"] is not None:
+        import RunProfiler
+        RunProfiler.keepSnapshot(label)
+
+#populate the world and run the main simulation loop on the given population:
+def runPopulation(config, population, allCandidates, sequence, startTime):
+    verbose = config["verbose"]
+    nElectors = config["nElectors"]
+    nCandidates = config["nCandidates"]
+    population.calcSincereUtilities(allCandidates, config["minPreference"],   \
+                                    config["maxPreference"],                  \
+                                    config["distribution"], sequence)
+
+    #A float64 copy of the electorate, stepped alongside a compact one to
+    #count the electors whose choice the compact storage changed:
+    reference = None
+    choiceDifferences = None
+    if config["precisionReference"] and config["precision"] != "float64":
+        reference = ElectorPopulation(nElectors, nCandidates,                 \
+                                      config["logSpace"],                     \
+                                      config["approxThreshold"],              \
+                                      config["kernel"])
+        referenceCandidates = [Candidate(candidateID)                         \
+                               for candidateID in range(0, nCandidates)]
+        reference.calcSincereUtilities(referenceCandidates,                   \
+                                       config["minPreference"],               \
+                                       config["maxPreference"],               \
+                                       config["distribution"], sequence)
+        choiceDifferences = []
+
+    #print "Least preferred by: ",
+    #GlobalFuncs.plotLeastCandidates(leastCandidates, population.electors(),  \
+    #                                allCandidates)
+    #print "\n"
+
+    setupTime = timer()
+    keepSnapshot(config, "setup")
+    timers = PhaseTimers(config["instrument"])
+    timers.stop("setup", startTime)
+    population.cache.timers = timers
+    contextPhases = ["probabilities", "pivotalities"]
+
+    currentVoteIntentions = [None] * nCandidates
+    firstVoteIntentions = None
+    history = TallyHistory(config["cycleRepeats"])
+    criteria = ConvergenceCriteria(MIN_UTIL, config["tallyTolerance"],        \
+                                   config["utilityTolerance"],                \
+                                   config["marginTolerance"])
+    schedule = UpdateSchedule(config["updateFraction"], config["damping"],    \
+                              RandomStreams.childSequence(                    \
+                                  sequence, RandomStreams.SCHEDULE_STREAM))
+    useCriteria = config["tallyTolerance"] is not None                        \
+                  or config["utilityTolerance"] is not None                   \
+                  or config["marginTolerance"] is not None
+    stopReason = None
+    iter = 0 #iteration counter
 
-#Generate electors:
-for newElectorID in range(0, nElectors):
-    elector = Elector(newElectorID, nCandidates)
-    elector.calcSincereUtilities(allCandidates, minPreference,                \
-                                 maxPreference, "uniform")
-    allElectors[newElectorID] = elector
+    #Loop until convergence is met, i.e. in this simplistic version = when
+    #nothing changes from one iteration to the next, until the tallies went
+    #round a cycle of a longer period cycleRepeats times, or maxIterations.
+    #Tolerance criteria, if any, can stop it earlier:
+    while stopReason is None:
 
-#print "Least preferred by: ",
-#GlobalFuncs.plotLeastCandidates(leastCandidates, allElectors, allCandidates)
-#print "\n"
+        phaseStart = timers.start()
+        if useCriteria:
+            criteria.snapshot(population)
+        timers.stop("convergence", phaseStart)
+        if timers.enabled:
+            lastChosen = np.array(population.chosenCandidates)
+            lastHits = population.cache.nHits
+            lastMisses = population.cache.nMisses
+
+        #Update strategic utility considerations of electors, given the
+        #current winning probabilities of candidates (the contexts they need
+        #are timed by the cache on their own):
+        phaseStart = timers.start()
+        contextStart = timers.elapsed(contextPhases)
+        population.calculateStrategicUtilities(allCandidates, MIN_UTIL, iter, \
+                                               config["updateMode"], schedule)
+        timers.stopExcluding("update", phaseStart, contextPhases, contextStart)
+
+        #count the vote intention of all electors towards all candidates for
+        #the current iterations:
+        phaseStart = timers.start()
+        currentVoteIntentions = population.countVoteIntentions(allCandidates, \
+                                                               iter)
+        timers.stop("tally", phaseStart)
+        if timers.enabled:
+            timers.count("switches", int(np.count_nonzero(                    \
+                lastChosen != population.chosenCandidates)))
+            timers.count("cacheHits", population.cache.nHits - lastHits)
+            timers.count("cacheMisses", population.cache.nMisses - lastMisses)
+
+        #step the float64 reference the same way and compare the choices:
+        if reference is not None:
+            reference.calculateStrategicUtilities(referenceCandidates,        \
+                                                  MIN_UTIL, iter,             \
+                                                  config["updateMode"],       \
+                                                  schedule)
+            reference.countVoteIntentions(referenceCandidates, iter)
+            choiceDifferences.append(int(np.count_nonzero(                    \
+                reference.chosenCandidates != population.chosenCandidates)))
+
+        #Warn about electors whose choice float precision could not determine:
+        if verbose and population.nPrecisionFlags > 0:
+            print("Iteration " + str(iter) + ": "                             \
+                  + str(population.nPrecisionFlags) + " electors' choices "   \
+                  + "are below float precision")
+
+        #Show vote intention shares in the first iteration:
+        if iter == 0:
+            firstVoteIntentions = currentVoteIntentions
+            if verbose:
+                GlobalFuncs.printElectResultsAsOfNow(allCandidates, nElectors)
+
+        phaseStart = timers.start()
+        stopReason = history.record(iter, currentVoteIntentions)
+        if useCriteria:
+            criterion = criteria.check(population, iter,                      \
+                                       currentVoteIntentions)
+            if stopReason is None:
+                stopReason = criterion
+        timers.stop("convergence", phaseStart)
+        timers.endIteration(iter)
+        iter += 1
+        if stopReason is None and iter >= config["maxIterations"]:
+            stopReason = "maxIterations"
+
+    endTime = timer()
+    keepSnapshot(config, "loop")
+
+    if verbose:
+        #Show vote intention shares after convergence:
+        GlobalFuncs.printElectResultsAsOfNow(allCandidates, nElectors)
+
+        if stopReason == "converged":
+            print("Converged after " + str(iter - 1) + " iterations.")
+        elif stopReason in CONVERGENCE_CRITERIA:
+            print("Converged after " + str(iter - 1) + " iterations by "      \
+                  + stopReason + ": " + str(criteria.measures[stopReason]))
+        elif stopReason == "cycle":
+            print("Stopped after " + str(iter - 1) + " iterations in a cycle "\
+                  + "of period " + str(history.cyclePeriod) + ": "            \
+                  + str(history.cycleStates))
+        else:
+            print("Stopped after " + str(iter - 1) + " iterations without "   \
+                  + "converging.")
+
+        #Show how many choices the compact storage changed:
+        if choiceDifferences is not None:
+            print("Choices differing from float64: "                          \
+                  + str(choiceDifferences[-1]) + " at the end, "              \
+                  + str(max(choiceDifferences)) + " at most")
+
+        #Show which Skellam regime every pair of candidates used:
+        if config["approxThreshold"] is not None or config["logSpace"]:
+            regimes = population.cache.regimeReport()
+            print("Approximated evaluations per pair: "                       \
+                  + str(regimes["approxPairCounts"]))
+            print("Exact evaluations per pair: "                              \
+                  + str(regimes["exactPairCounts"]))
+            print("  of which with a saddle point tail: "                     \
+                  + str(regimes["tailPairCounts"]))
+            print("Max estimated approximation error: "                       \
+                  + str(regimes["maxApproxError"]))
+
+    timings = {"setup": setupTime - startTime,                                \
+               "iterations": endTime - setupTime,                             \
+               "total": endTime - startTime}
+    converged = stopReason == "converged"                                     \
+                or stopReason in CONVERGENCE_CRITERIA
+    return SimulationResult(config, int(sequence.entropy),                    \
+                            firstVoteIntentions, currentVoteIntentions,       \
+                            iter - 1, converged, stopReason,                  \
+                            history.cyclePeriod, history.cycleStates,         \
+                            criteria.measures, choiceDifferences,             \
+                            population.nPrecisionFlags,                       \
+                            population.cache.regimeReport(), timings,         \
+                            timers.asDict())
 
 
 #-----------------------------------------------------------------------------#
-# Main simulation loop:
+# Running as a script:
 #-----------------------------------------------------------------------------#
 
-lastVoteIntentions = [None] * nCandidates
-currentVoteIntentions = [None] * nCandidates
-iter = 0 #iteration counter
-
-#Loop until convergence is met, i.e. in this simplistic version = when nothing
-#changes from one iteration to the next:
-while not GlobalFuncs.areIdentical(lastVoteIntentions, currentVoteIntentions) \
-      or iter <= 1:
-
-    lastVoteIntentions = currentVoteIntentions
-    
-    #Update strategic utility considerations of electors, given the current
-    #winning probabilities of candidates:
-    for elector in allElectors:
-        elector.calculateStrategicUtilities(allCandidates,allElectors,MIN_UTIL,iter)
-
-    #count the vote intention of all electors towards all candidates for the
-    #current iterations:
-    currentVoteIntentions = GlobalFuncs.countVoteIntentions(allElectors,      \
-                                                        allCandidates,iter)            
-
-#    for elector in allElectors:
-#        if elector.ID == 0:
-#            print "iteration: " + str(iter)
-#            print "all votes: " + str(elector.allVotes)
-
-    #Show vote intention shares in the first iteration:
-    if iter == 0:
-        GlobalFuncs.printElectResultsAsOfNow(allCandidates, nElectors)
-    
-    iter += 1
-   
-#Show vote intention shares after convergence:
-GlobalFuncs.printElectResultsAsOfNow(allCandidates, nElectors)
-        
-print "Converged after " + str(iter - 1) + " iterations."
-                             
+if __name__ == "__main__":
+    profilePath = None
+    if len(sys.argv) > 1:
+        profilePath = sys.argv[1]
+    runSimulation({"verbose": True, "profilePath": profilePath})
+
 #-----------------------------------------------------------------------------#
 # End of file
 #-----------------------------------------------------------------------------#
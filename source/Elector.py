@@ -4,26 +4,63 @@
 #    preference: 1-D preference which represents a generic policy position
 #    strategicUtilities: a list with the elector's sincere expectation for each
 #                        candidate
+#    keepDiagnostics: whether the last update's intermediate values (tieProbs,
+#                     pivotalityProbs, winnerProbs, pivotalities, allVotes,
+#                     othersVotes, previousUtilities) are kept as attributes
+#    reference: whether the update computes the probability matrices and the
+#               pivotalities as the model was first written, i.e. with
+#               scipy.stats.skellam pair by pair and np.delete products
+#               (Pivotality's "scipy" backend and calcReferencePivotalities),
+#               without any PivotalityCache, for EquivalenceHarness to check
+#               the faster paths against
+#
+# Only the utilities persist from one iteration to the next. The K x K
+# probability matrices and the K-vectors the update goes through are scratch
+# space: they used to be allocated by every elector (4K^2 + 2K floats and six
+# array headers each, gigabytes for 10^6 electors and 10 candidates) and are
+# now local to the update, or rows of the module's shared Workspace. Electors
+# built with keepDiagnostics=True still keep the matrices of their last
+# update, for inspection.
 #-----------------------------------------------------------------------------#
 
 import GlobalFuncs
+import Pivotality
 import numpy as np
-from scipy.stats import skellam
 import math
 
-class Elector:
-    
+#Scratch K-vectors of the update, shared by every elector with the same number
+#of candidates (electors are updated one at a time):
+class Workspace(object):
+
+    #overload of class constructor, that allocates the scratch vectors
+    def __init__(self, nCandidates):
+        self.newUtilitySum = np.zeros(nCandidates)
+        self.newUtilDiff = np.zeros(nCandidates)
+
+#Workspaces in use, by number of candidates:
+WORKSPACES = {}
+
+#Function that gives the shared Workspace for the given number of candidates:
+def workspace(nCandidates):
+    if nCandidates not in WORKSPACES:
+        WORKSPACES[nCandidates] = Workspace(nCandidates)
+    return WORKSPACES[nCandidates]
+
+class Elector(object):
+
+    #electors (and views of electors) keep no diagnostics and use the fast
+    #paths unless asked otherwise:
+    keepDiagnostics = False
+    reference = False
+
     #overload of class constructor, that initializes elector-owned variables
-    def __init__(self, passedID, nCandidates):
+    def __init__(self, passedID, nCandidates, keepDiagnostics=False,          \
+                 reference=False):
         self.ID = passedID
         self.strategicUtilities = [None] * nCandidates
         self.sincereUtilities = [None] * nCandidates
-        self.tieProbs = np.zeros([nCandidates,nCandidates])
-        self.pivotalityProbs = np.zeros([nCandidates,nCandidates])
-        self.winnerProbs = np.zeros([nCandidates,nCandidates])
-        self.pivotalities = np.zeros([nCandidates,nCandidates])
-        self.newUtilitySum = np.zeros(nCandidates)
-        self.newUtilDiff = np.zeros(nCandidates)
+        self.keepDiagnostics = keepDiagnostics
+        self.reference = reference
 
     #calculate the sincere utility - that is, without/before strategic conside-
     #rations - that this elector assigns for all candidates and stores them:
@@ -39,60 +76,82 @@ class Elector:
                                   for x in self.sincereUtilities]
         #self.strategicUtilities = self.sincereUtilities
 
-    def calculateStrategicUtilities(self, passedCandidates, passedElectors, MIN_UTIL, iteration):
+    #calculate the strategic utilities given the vote intentions of the other
+    #electors. Without passedTally the whole electorate is recounted (O(N) per
+    #elector); with a VoteTally counted once per iteration the elector reads
+    #from it and moves its own vote in it in O(1) if it switches candidates.
+    #With a PivotalityCache the probability matrices are shared with every
+    #other elector facing the same othersVotes (reference electors compute
+    #their own, see reference). The new utilities are summed
+    #in the shared Workspace and then copied into strategicUtilities, in
+    #place once it is a writable array:
+    def calculateStrategicUtilities(self, passedCandidates, passedElectors,    \
+                                    MIN_UTIL, iteration, passedTally=None,     \
+                                    passedCache=None):
         electorID = self.ID
         nCandidates = len(passedCandidates)
-        self.allVotes = GlobalFuncs.countVoteIntentions(passedElectors,        \
-                                                    passedCandidates,iteration)
         self.chosenCandidate = self.chooseCandidate(passedCandidates, iteration)
-        self.othersVotes = self.allVotes
-        self.othersVotes[self.chosenCandidate.ID] =                            \
-                                   self.othersVotes[self.chosenCandidate.ID] - 1
-        for rowIndex in range(0,nCandidates):
-            for colIndex in range(0,nCandidates):
-                if rowIndex == colIndex:
-                    self.tieProbs[rowIndex,colIndex] = 1
-                    self.pivotalityProbs[rowIndex,colIndex] = 1
-                    self.winnerProbs[rowIndex,colIndex] = 1
-                else:
-                    skellamA = self.othersVotes[rowIndex]
-                    skellamB = self.othersVotes[colIndex]
-                    if skellamA == 0:
-                        skellamA = 10**-100
-                    if skellamB == 0:
-                        skellamB = 10**-100
-                    self.tieProbs[rowIndex,colIndex] = skellam.pmf(0,skellamA,skellamB)
-                    self.pivotalityProbs[rowIndex,colIndex] = skellam.pmf(-1,skellamA,skellamB)
-                    self.winnerProbs[rowIndex,colIndex] = 1 - skellam.cdf(-1,skellamA,skellamB)
+        if passedTally is None:
+            allVotes = GlobalFuncs.countVoteIntentions(passedElectors,        \
+                                                    passedCandidates,iteration)
+            othersVotes = allVotes
+            othersVotes[self.chosenCandidate.ID] =                            \
+                                   othersVotes[self.chosenCandidate.ID] - 1
+        else:
+            allVotes = passedTally.asList()
+            othersVotes = passedTally.othersVotes(self.chosenCandidate.ID)
+        if self.reference:
+            tieProbs, pivotalityProbs, winnerProbs =                          \
+                     Pivotality.calcProbabilityMatrices(othersVotes, "scipy")
+        elif passedCache is None:
+            tieProbs, pivotalityProbs, winnerProbs =                          \
+                     Pivotality.calcProbabilityMatrices(othersVotes)
+        else:
+            tieProbs, pivotalityProbs, winnerProbs, pivotalities =            \
+                passedCache.getContext(othersVotes)
         #UNCOMMENT ONLY IN CASE OF PROBLEMS WITH 0 ENTRIES###############
         #for rowIndex in range(0,nCandidates):
         #    for colIndex in range(0,nCandidates):
-        #        if math.isnan(self.tieProbs[rowIndex,colIndex]):
-        #            self.tieProbs[rowIndex,colIndex] = 0
-        #        if math.isnan(self.pivotalityProbs[rowIndex,colIndex]):
-        #            self.pivotalityProbs[rowIndex,colIndex] = 0
-        #        if math.isnan(self.winnerProbs[rowIndex,colIndex]):
-        #            self.winnerProbs[rowIndex,colIndex] = 0
+        #        if math.isnan(tieProbs[rowIndex,colIndex]):
+        #            tieProbs[rowIndex,colIndex] = 0
+        #        if math.isnan(pivotalityProbs[rowIndex,colIndex]):
+        #            pivotalityProbs[rowIndex,colIndex] = 0
+        #        if math.isnan(winnerProbs[rowIndex,colIndex]):
+        #            winnerProbs[rowIndex,colIndex] = 0
         #################################################################
-        for rowIndex in range(0,nCandidates):
-            for colIndex in range(0,nCandidates):
-                if rowIndex != colIndex:
-                    probsWoutPair = np.delete(self.winnerProbs,rowIndex,0)
-                    probsWOutPair = np.delete(probsWoutPair,colIndex,1)
-                    probsProd = np.prod(probsWOutPair)
-                    otherPivsSum = self.pivotalityProbs[rowIndex,colIndex] + self.winnerProbs[rowIndex,colIndex]
-                    self.pivotalities[rowIndex,colIndex] = probsProd * otherPivsSum
+        if self.reference:
+            pivotalities = Pivotality.calcReferencePivotalities(winnerProbs,  \
+                                                                pivotalityProbs)
+        elif passedCache is None:
+            pivotalities = Pivotality.calcPivotalities(winnerProbs,           \
+                                                       pivotalityProbs)
         if iteration == 0:
-            self.previousUtilities = self.sincereUtilities
+            previousUtilities = self.sincereUtilities
         else:
-            self.previousUtilities = self.strategicUtilities
+            previousUtilities = self.strategicUtilities
+        if self.keepDiagnostics:
+            self.allVotes, self.othersVotes = allVotes, othersVotes
+            self.tieProbs, self.pivotalityProbs = tieProbs, pivotalityProbs
+            self.winnerProbs, self.pivotalities = winnerProbs, pivotalities
+            self.previousUtilities = np.array(previousUtilities)
+        scratch = workspace(nCandidates)
         for cand in range(0,nCandidates):
             for otherCand in range(0,nCandidates):
-                utilityDiff = self.previousUtilities[cand] - self.sincereUtilities[otherCand]
-                self.newUtilDiff[otherCand] = utilityDiff * self.pivotalities[cand,otherCand]
-            self.newUtilitySum[cand] = np.sum(self.newUtilDiff)
-        self.newUtilitySum[np.argmin(self.sincereUtilities)] = MIN_UTIL
-        self.strategicUtilities = self.newUtilitySum
+                utilityDiff = previousUtilities[cand] - self.sincereUtilities[otherCand]
+                scratch.newUtilDiff[otherCand] = utilityDiff * pivotalities[cand,otherCand]
+            scratch.newUtilitySum[cand] = np.sum(scratch.newUtilDiff)
+        scratch.newUtilitySum[np.argmin(self.sincereUtilities)] = MIN_UTIL
+        if isinstance(self.strategicUtilities, np.ndarray)                    \
+           and self.strategicUtilities.flags.writeable:
+            self.strategicUtilities[:] = scratch.newUtilitySum
+        else:
+            self.strategicUtilities = np.array(scratch.newUtilitySum)
+        #at iteration 0 votes follow sincere utilities, so only later on can
+        #the new strategic utilities move this elector's vote:
+        if passedTally is not None and iteration > 0:
+            newChosenCandidate = self.chooseCandidate(passedCandidates, iteration)
+            if newChosenCandidate.ID != self.chosenCandidate.ID:
+                passedTally.switch(self.chosenCandidate.ID, newChosenCandidate.ID)
         return self.strategicUtilities
         
     
@@ -121,8 +180,8 @@ class Elector:
 
     #function that prints 
     def printPreference(self, passedCandidates):
-        print "Elec " + str(self.ID) \
+        print("Elec " + str(self.ID) \
               + ", preferedCand: " + str(self.chooseCandidate().ID) \
-              + ", leastCand: " + str(self.findLastCand(passedCandidates).ID)
+              + ", leastCand: " + str(self.findLastCand(passedCandidates).ID))
         if self.ID == nElectors - 1:
-            print "\n"
+            print("\n")
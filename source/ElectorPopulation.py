@@ -0,0 +1,485 @@
+#-----------------------------------------------------------------------------#
+# ElectorPopulation-owned Variables:
+#    nElectors: number of electors in the population
+#    nCandidates: number of candidates
+#    sincereUtilities: (nElectors, nCandidates) array with the sincere utility
+#                      each elector assigns to each candidate
+#    strategicUtilities: (nElectors, nCandidates) array with the strategic
+#                        utility each elector assigns to each candidate
+#    chosenCandidates: (nElectors,) array with the ID of the candidate each
+#                      elector currently intends to vote for
+#    tally: VoteTally with the vote intentions of the whole population
+#    cache: PivotalityCache shared by all electors within an iteration
+#    logSpace: whether pivotalities are computed in log space, which keeps
+#              them finite for tallies where they underflow (large electorates)
+#    approxThreshold: rate above which pairs of candidates use the saddle
+#                     point regime (see PivotalityCache; None: never)
+#    utilityLogScales: (nElectors,) array with the log of the factor each row
+#                      of strategicUtilities is scaled by (all 0 unless
+#                      logSpace), i.e. the true strategic utilities are
+#                      strategicUtilities * exp(utilityLogScales)
+#    nPrecisionFlags: number of electors, in the last update, whose two best
+#                     candidates were closer than floating point rounding can
+#                     tell apart
+#    kernel: implementation of the per-elector loops (see KERNELS)
+#    countBlockFunction, updateBlockFunction: block functions of that kernel
+#    precision: storage precision of the utility arrays (see PRECISIONS)
+#
+# The population holds the state of all electors as arrays, so that a whole
+# iteration is carried out by a handful of NumPy operations instead of one
+# Elector.calculateStrategicUtilities call per elector. ElectorView gives back
+# the per-elector Elector API on top of those arrays.
+#
+# With precision="float32" the utilities are stored in single precision and
+# the chosen candidates in the smallest unsigned integer that holds them
+# (uint8 up to 256 candidates, uint16 up to 65536), which halves the memory
+# per elector (41 instead of 80 bytes with 4 candidates). Only storage is
+# compact: pivotalities and the utility update are still computed in float64.
+# Each update shrinks the utilities by the pivotalities, past the float32
+# range within a few iterations, so compact rows are stored divided by their
+# largest absolute utility, their scale going to utilityLogScales (kept in
+# float64), whether or not logSpace is on. Choices can then only differ from
+# the float64 ones for electors whose two best candidates are within float32
+# rounding (see Cox1994Model's precisionReference to count them).
+#-----------------------------------------------------------------------------#
+
+import GlobalFuncs
+import Pivotality
+import numpy as np
+from Elector import Elector
+from VoteTally import VoteTally
+from PivotalityCache import PivotalityCache
+from UpdateSchedule import scheduleBlock, BLOCK_SCHEDULES
+
+#Ways of updating the electorate within one iteration: "synchronous" (Jacobi)
+#has every elector react to the tally counted at the start of the iteration;
+#"sequential" (Gauss-Seidel) goes elector by elector, each one reacting to
+#the votes already moved by the electors before it, as the loop over Elector
+#objects does. "partial", "damped" and "randomSequential" are the schedules of
+#UpdateSchedule, on top of the synchronous and the sequential update:
+UPDATE_MODES = ["synchronous", "sequential", "partial", "damped",             \
+                "randomSequential"]
+
+#Electors the sequential update starts each run with (see updateSequential):
+SEQUENTIAL_RUN = 64
+
+#Implementations of the per-elector loops of the synchronous update: "numpy"
+#runs whole-array operations, "numba" the compiled kernels of NumbaKernels
+#(falling back to "numpy" when Numba is not installed). NumbaKernels is only
+#imported by populations using it, as importing Numba takes a quarter second:
+KERNELS = ["numpy", "numba"]
+
+#Storage precisions of the utility arrays: "float64" (with int64 chosen
+#candidates) or "float32" (with uint8/uint16 chosen candidates):
+PRECISIONS = ["float64", "float32"]
+
+#Function that gives the dtypes of the utilities and of the chosen candidates
+#of a population with the given precision:
+def populationDtypes(nCandidates, precision="float64"):
+    if precision == "float64":
+        return np.dtype(np.float64), np.dtype(np.int64)
+    elif precision == "float32":
+        if nCandidates <= 2**8:
+            return np.dtype(np.float32), np.dtype(np.uint8)
+        elif nCandidates <= 2**16:
+            return np.dtype(np.float32), np.dtype(np.uint16)
+        return np.dtype(np.float32), np.dtype(np.int64)
+    else:
+        raise ValueError("Unknown precision: " + str(precision))
+
+class ElectorPopulation:
+
+    #overload of class constructor, that initializes population-owned arrays
+    def __init__(self, nElectors, nCandidates, logSpace=False,                \
+                 approxThreshold=None, kernel="numpy", precision="float64"):
+        self.nElectors = nElectors
+        self.nCandidates = nCandidates
+        utilityDtype, choiceDtype = populationDtypes(nCandidates, precision)
+        self.precision = precision
+        self.sincereUtilities = np.zeros([nElectors,nCandidates],             \
+                                         dtype=utilityDtype)
+        self.strategicUtilities = np.zeros([nElectors,nCandidates],           \
+                                           dtype=utilityDtype)
+        self.chosenCandidates = np.zeros(nElectors, dtype=choiceDtype)
+        self.tally = VoteTally(nCandidates)
+        if kernel not in KERNELS:
+            raise ValueError("Unknown kernel: " + str(kernel))
+        if kernel == "numba":
+            import NumbaKernels
+            if not NumbaKernels.HAVE_NUMBA:
+                kernel = "numpy"
+        self.kernel = kernel
+        if kernel == "numba":
+            self.countBlockFunction = NumbaKernels.countBlock
+            self.updateBlockFunction = NumbaKernels.updateBlock
+        else:
+            self.countBlockFunction = countBlock
+            self.updateBlockFunction = updateBlock
+        self.cache = PivotalityCache(approxThreshold=approxThreshold,         \
+                                     kernel=kernel)
+        self.logSpace = logSpace
+        self.approxThreshold = approxThreshold
+        self.utilityLogScales = np.zeros(nElectors)
+        self.nPrecisionFlags = 0
+
+    #calculate the sincere utilities of all electors with a single draw of
+    #the whole (nElectors, nCandidates) matrix from the global NumPy state or,
+    #given a SeedSequence, block by block from its streams (see RandomStreams):
+    def calcSincereUtilities(self, passedCandidates, minPreference,           \
+                             maxPreference, distribution, seedSequence=None):
+        nCandidates = len(passedCandidates)
+        if seedSequence is None:
+            self.sincereUtilities[:] = GlobalFuncs.normalizeUtilities(        \
+                GlobalFuncs.randUtilityMatrix(minPreference, maxPreference,   \
+                                              self.nElectors, nCandidates,    \
+                                              distribution))
+            self.strategicUtilities[:] = self.sincereUtilities
+            self.utilityLogScales[:] = 0
+        else:
+            self.mapBlocks(drawBlock, (self.nElectors, minPreference,         \
+                                       maxPreference, distribution,           \
+                                       seedSequence), self.drawBlocks())
+        self.chooseCandidates(0)
+
+    #give the population arrays that block functions (see mapBlocks) work on:
+    def populationArrays(self):
+        return {"sincereUtilities": self.sincereUtilities,                    \
+                "strategicUtilities": self.strategicUtilities,                \
+                "utilityLogScales": self.utilityLogScales,                    \
+                "chosenCandidates": self.chosenCandidates}
+
+    #give the (first, last + 1) elector of every block the electorate is
+    #split into: a single one, here, as the population is updated serially:
+    def blocks(self):
+        return [(0, self.nElectors)]
+
+    #give the blocks sincere utilities are drawn in:
+    def drawBlocks(self):
+        return self.blocks()
+
+    #apply a block function, i.e. function(arrays, bounds, *arguments), to
+    #every block (or to the given ones) and give the list of what it gave.
+    #Backends that split the electorate only need to change how this map is
+    #carried out:
+    def mapBlocks(self, blockFunction, blockArguments, blockBounds=None):
+        if blockBounds is None:
+            blockBounds = self.blocks()
+        arrays = self.populationArrays()
+        return [blockFunction(arrays, bounds, *blockArguments)                \
+                for bounds in blockBounds]
+
+    #find who is the currently chosen candidate of every elector, considering
+    #current strategic utility calculation, and count the tally they give:
+    def chooseCandidates(self, iteration):
+        blockTallies = self.mapBlocks(self.countBlockFunction, (iteration,))
+        self.tally.votes[:] = np.sum(blockTallies, axis=0)
+        return self.chosenCandidates
+
+    #count the vote intention of all candidates in the current moment, storing
+    #them in the candidates as GlobalFuncs.countVoteIntentions does:
+    def countVoteIntentions(self, passedCandidates, iteration):
+        self.chooseCandidates(iteration)
+        newVoteIntentions = self.tally.asList()
+        for candidate in passedCandidates:
+            candidate.voteIntention = newVoteIntentions[candidate.ID]
+        return newVoteIntentions
+
+    #update the strategic utilities of the whole electorate, either all at
+    #once or elector by elector (see UPDATE_MODES), by default sequentially,
+    #as the loop over Elector objects does, since the synchronous update
+    #settles on different equilibria. The schedules other than "synchronous"
+    #and "sequential" take their parameters and random draws from an
+    #UpdateSchedule:
+    def calculateStrategicUtilities(self, passedCandidates, MIN_UTIL,         \
+                                    iteration, update="sequential",           \
+                                    schedule=None):
+        self.cache.newIteration()
+        self.nPrecisionFlags = 0
+        if update == "synchronous" or update in BLOCK_SCHEDULES:
+            return self.updateSynchronous(passedCandidates, MIN_UTIL,         \
+                                          iteration, update, schedule)
+        elif update == "sequential":
+            return self.updateSequential(passedCandidates, MIN_UTIL, iteration)
+        elif update == "randomSequential":
+            return self.updateSequential(passedCandidates, MIN_UTIL,          \
+                                         iteration,                           \
+                                         schedule.electorOrder(iteration,     \
+                                                               self.nElectors))
+        else:
+            raise ValueError("Unknown update mode: " + str(update))
+
+    #electors intending to vote for the same candidate face the same
+    #othersVotes, so the pivotalities of each chosen candidate are computed
+    #once and applied to all of its electors of a block in a single matrix
+    #product. Every elector only reads its own row, so blocks are updated in
+    #place and in any order. The "partial" and "damped" schedules wrap the
+    #block update in UpdateSchedule.scheduleBlock:
+    def updateSynchronous(self, passedCandidates, MIN_UTIL, iteration,        \
+                          update="synchronous", schedule=None):
+        self.countVoteIntentions(passedCandidates, iteration)
+        contexts = {}
+        for chosenID in np.flatnonzero(self.tally.votes):
+            contexts[chosenID] = self.calcContextPivotalities(                \
+                self.tally.othersVotes(chosenID))
+        if update in BLOCK_SCHEDULES:
+            blockFlags = self.mapBlocks(scheduleBlock,                        \
+                                        (self.updateBlockFunction, update,    \
+                                         schedule, contexts, MIN_UTIL,        \
+                                         iteration, self.logSpace))
+        else:
+            blockFlags = self.mapBlocks(self.updateBlockFunction,             \
+                                        (contexts, MIN_UTIL, iteration,       \
+                                         self.logSpace))
+        self.nPrecisionFlags += int(np.sum(blockFlags))
+        return self.strategicUtilities
+
+    #electors are updated in order and whoever switches candidates moves its
+    #vote in the tally right away, so the next elector already sees it. Until
+    #somebody switches, the tally, and so the context of every chosen
+    #candidate, stays the same, so electors are updated a run at a time: the
+    #whole run against the current tally, context by context as in the
+    #synchronous update, keeping everybody up to the first elector who
+    #switches, whose vote then moves before the next run starts after it.
+    #Runs start at SEQUENTIAL_RUN electors, double while nobody switches and
+    #go back to twice the electors kept when somebody does, so an iteration
+    #costs a few vectorized steps per switch rather than one per elector.
+    #Early iterations, where many electors switch, still pay the pivotalities
+    #of a context for every switch: the first 3 iterations with 4 candidates
+    #take 7 s with 10^4 electors and 55 s with 10^5 on one core, against well
+    #under a second with the synchronous update. Electors go by ID unless
+    #another order is given:
+    def updateSequential(self, passedCandidates, MIN_UTIL, iteration,         \
+                         order=None):
+        self.countVoteIntentions(passedCandidates, iteration)
+        if order is None:
+            order = np.arange(self.nElectors)
+        order = np.asarray(order)
+        position = 0
+        runLength = SEQUENTIAL_RUN
+        while position < len(order):
+            electorIDs = order[position:position + runLength]
+            newUtilities, newLogScales, precisionFlags =                      \
+                self.calcRunUtilities(electorIDs, MIN_UTIL, iteration)
+            nKept = len(electorIDs)
+            switched = np.zeros(0, dtype=int)
+            if iteration > 0:
+                chosenIDs = self.chosenCandidates[electorIDs]
+                newChosenIDs = np.argmax(newUtilities, axis=1)
+                switched = np.flatnonzero(newChosenIDs != chosenIDs)
+            if len(switched) > 0:
+                nKept = switched[0] + 1
+            keptIDs = electorIDs[:nKept]
+            self.strategicUtilities[keptIDs] = newUtilities[:nKept]
+            self.utilityLogScales[keptIDs] = newLogScales[:nKept]
+            self.nPrecisionFlags += int(np.sum(precisionFlags[:nKept]))
+            if len(switched) > 0:
+                self.tally.switch(chosenIDs[nKept - 1], newChosenIDs[nKept - 1])
+                self.chosenCandidates[keptIDs[-1]] = newChosenIDs[nKept - 1]
+                runLength = max(SEQUENTIAL_RUN, 2 * nKept)
+            else:
+                runLength = 2 * runLength
+            position += nKept
+        return self.strategicUtilities
+
+    #give the new strategic utilities (stored as the population stores them),
+    #their log scales and their precision flags, for the given electors, all
+    #facing the current tally:
+    def calcRunUtilities(self, electorIDs, MIN_UTIL, iteration):
+        return calcRunBlock(self.populationArrays(), electorIDs,              \
+                            self.runContexts(electorIDs), MIN_UTIL, iteration,\
+                            self.logSpace)
+
+    #give the (scaled) pivotalities and log scale of the context of every
+    #candidate chosen by the given electors, by candidate:
+    def runContexts(self, electorIDs):
+        return {chosenID: self.calcContextPivotalities(                       \
+                              self.tally.othersVotes(chosenID))               \
+                for chosenID in np.unique(self.chosenCandidates[electorIDs])}
+
+    #give the pivotalities of the given othersVotes and their log scale. In
+    #log space the pivotalities are divided by their largest value before
+    #leaving log space, which scales every utility of the electors facing them
+    #by the same positive factor and so leaves their choices untouched:
+    def calcContextPivotalities(self, othersVotes):
+        if self.logSpace:
+            logPivotalities = self.cache.getLogPivotalities(othersVotes)
+            logScale = np.max(logPivotalities)
+            return np.exp(logPivotalities - logScale), logScale
+        return self.cache.getPivotalities(othersVotes), 0
+
+    #give the Elector-like view of a single elector:
+    def elector(self, electorID):
+        return ElectorView(self, electorID)
+
+    #give the Elector-like views of all electors, e.g. to pass them to code
+    #written for a list of Elector objects:
+    def electors(self):
+        return [ElectorView(self, electorID)                                  \
+                for electorID in range(0,self.nElectors)]
+
+
+#Function that gives the new strategic utilities of the given electors, all
+#facing the same (scaled) pivotalities, and which of them have a choice
+#below float precision. It only reads the population arrays it is given, so
+#it works the same on a whole population and on a shard of one. Compact
+#(float32) rows are always scaled by their log scales (see compactRows):
+def calcGroupUtilities(sincereUtilities, strategicUtilities, utilityLogScales,\
+                       electorIDs, pivotalities, MIN_UTIL, iteration, logSpace):
+    groupSincere = sincereUtilities[electorIDs]
+    if iteration == 0:
+        previousUtilities = groupSincere
+    elif logSpace or strategicUtilities.dtype != np.float64:
+        previousUtilities = strategicUtilities[electorIDs]                    \
+            * np.exp(utilityLogScales[electorIDs])[:,None]
+    else:
+        previousUtilities = strategicUtilities[electorIDs]
+    ownTerms, sincereTerms = Pivotality.calcUtilityTerms(previousUtilities,   \
+                                                         groupSincere,        \
+                                                         pivotalities)
+    newUtilities = ownTerms - sincereTerms
+    leastCandidates = np.argmin(groupSincere, axis=1)
+    newUtilities[np.arange(len(newUtilities)), leastCandidates] = MIN_UTIL
+    precisionFlags = Pivotality.precisionLossFlags(pivotalities, newUtilities,\
+                                                   ownTerms, sincereTerms,    \
+                                                   np.finfo(strategicUtilities\
+                                                            .dtype).eps)
+    return newUtilities, precisionFlags
+
+#Function that gives the new strategic utilities (in the stored dtype), log
+#scales and precision flags of a run of electors of the sequential update,
+#each facing the context of its chosen candidate. Like calcGroupUtilities it
+#only reads the arrays, so slices of a run can be computed in parallel:
+def calcRunBlock(arrays, electorIDs, contexts, MIN_UTIL, iteration, logSpace):
+    strategicUtilities = arrays["strategicUtilities"]
+    newUtilities = np.empty([len(electorIDs),strategicUtilities.shape[1]])
+    newLogScales = np.empty(len(electorIDs))
+    precisionFlags = np.empty(len(electorIDs), dtype=bool)
+    chosenIDs = arrays["chosenCandidates"][electorIDs]
+    for chosenID in np.unique(chosenIDs):
+        rows = np.flatnonzero(chosenIDs == chosenID)
+        pivotalities, logScale = contexts[chosenID]
+        utilities, flags = calcGroupUtilities(arrays["sincereUtilities"],     \
+                                              strategicUtilities,             \
+                                              arrays["utilityLogScales"],     \
+                                              electorIDs[rows], pivotalities, \
+                                              MIN_UTIL, iteration, logSpace)
+        if strategicUtilities.dtype != np.float64:
+            utilities, logScale = compactRows(utilities, logScale, MIN_UTIL)
+        newUtilities[rows] = utilities
+        newLogScales[rows] = logScale
+        precisionFlags[rows] = flags
+    return newUtilities.astype(strategicUtilities.dtype), newLogScales,       \
+           precisionFlags
+
+#Function that divides each row of new utilities, facing pivotalities of the
+#given log scale, by its largest absolute utility (leaving out MIN_UTIL) and
+#gives them with the log scale of each row, so that float32 storage keeps
+#their true value up to its rounding:
+def compactRows(newUtilities, logScale, MIN_UTIL):
+    kept = newUtilities != MIN_UTIL
+    scales = np.max(np.where(kept, np.abs(newUtilities), 0), axis=1)
+    scales = np.where(scales > 0, scales, 1)
+    newUtilities = np.where(kept, newUtilities, 0) / scales[:,None]
+    newUtilities[~kept] = MIN_UTIL
+    return newUtilities, logScale + np.log(scales)
+
+
+#Block function (see ElectorPopulation.mapBlocks) that draws the sincere
+#utilities of a block from the streams of a SeedSequence, the same rows a
+#draw of the whole electorate gives:
+def drawBlock(arrays, bounds, nElectors, minPreference, maxPreference,        \
+              distribution, seedSequence):
+    if bounds[1] <= bounds[0]:
+        return
+    block = slice(bounds[0], bounds[1])
+    nCandidates = arrays["sincereUtilities"].shape[1]
+    arrays["sincereUtilities"][block] = GlobalFuncs.normalizeUtilities(       \
+        GlobalFuncs.randUtilityRows(minPreference, maxPreference, nElectors,  \
+                                    nCandidates, distribution, seedSequence,  \
+                                    bounds[0], bounds[1]))
+    arrays["strategicUtilities"][block] = arrays["sincereUtilities"][block]
+    arrays["utilityLogScales"][block] = 0
+
+#Block function that chooses the candidate of every elector of a block and
+#gives the block's tally:
+def countBlock(arrays, bounds, iteration):
+    block = slice(bounds[0], bounds[1])
+    if iteration == 0:
+        utilities = arrays["sincereUtilities"][block]
+    else:
+        utilities = arrays["strategicUtilities"][block]
+    chosenCandidates = np.argmax(utilities, axis=1)
+    arrays["chosenCandidates"][block] = chosenCandidates
+    return np.bincount(chosenCandidates, minlength=utilities.shape[1])
+
+#Block function that updates the strategic utilities of a block in place,
+#given the pivotalities and log scale of each chosen candidate's context, and
+#gives how many of its electors have a choice below float precision:
+def updateBlock(arrays, bounds, contexts, MIN_UTIL, iteration, logSpace):
+    chosenCandidates = arrays["chosenCandidates"][bounds[0]:bounds[1]]
+    nPrecisionFlags = 0
+    for chosenID in np.unique(chosenCandidates):
+        electorIDs = bounds[0] + np.flatnonzero(chosenCandidates == chosenID)
+        pivotalities, logScale = contexts[chosenID]
+        newUtilities, precisionFlags = calcGroupUtilities(                            \
+            arrays["sincereUtilities"], arrays["strategicUtilities"],         \
+            arrays["utilityLogScales"], electorIDs, pivotalities, MIN_UTIL,   \
+            iteration, logSpace)
+        if arrays["strategicUtilities"].dtype != np.float64:
+            newUtilities, logScale = compactRows(newUtilities, logScale,      \
+                                                 MIN_UTIL)
+        arrays["strategicUtilities"][electorIDs] = newUtilities
+        arrays["utilityLogScales"][electorIDs] = logScale
+        nPrecisionFlags += int(np.sum(precisionFlags))
+    return nPrecisionFlags
+
+#-----------------------------------------------------------------------------#
+# ElectorView: thin Elector whose utilities are rows of an ElectorPopulation,
+# so reading or writing them reads or writes the population arrays. Strategic
+# utilities are read as their true values, i.e. scaled by the row's log scale
+# (all but the column of the least preferred candidate, which holds MIN_UTIL),
+# and a row written is stored with a log scale of 0, or compacted as the
+# update does for float32 populations. The row itself is given, so that it
+# can be written in place, only where its log scale is 0 in float64; scaled
+# rows come as read-only copies, so that writing into them fails instead of
+# being lost.
+#-----------------------------------------------------------------------------#
+
+class ElectorView(Elector):
+
+    #overload of class constructor, that only binds the view to its row
+    def __init__(self, passedPopulation, passedID):
+        self.population = passedPopulation
+        self.ID = passedID
+
+    @property
+    def sincereUtilities(self):
+        return self.population.sincereUtilities[self.ID]
+
+    @sincereUtilities.setter
+    def sincereUtilities(self, passedUtilities):
+        self.population.sincereUtilities[self.ID] = np.ravel(passedUtilities)
+
+    @property
+    def strategicUtilities(self):
+        storedUtilities = self.population.strategicUtilities[self.ID]
+        logScale = self.population.utilityLogScales[self.ID]
+        if storedUtilities.dtype == np.float64 and logScale == 0:
+            return storedUtilities
+        utilities = storedUtilities.astype(float) * np.exp(logScale)
+        leastCandidate = np.argmin(self.sincereUtilities)
+        utilities[leastCandidate] = storedUtilities[leastCandidate]
+        utilities.setflags(write=False)
+        return utilities
+
+    @strategicUtilities.setter
+    def strategicUtilities(self, passedUtilities):
+        utilities = np.array(np.ravel(passedUtilities), dtype=float)
+        logScale = 0.0
+        if self.population.strategicUtilities.dtype != np.float64:
+            leastCandidate = np.argmin(self.sincereUtilities)
+            rows, logScales = compactRows(utilities[None], logScale,          \
+                                          utilities[leastCandidate])
+            utilities, logScale = rows[0], logScales[0]
+        self.population.strategicUtilities[self.ID] = utilities
+        self.population.utilityLogScales[self.ID] = logScale
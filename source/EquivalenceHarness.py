@@ -0,0 +1,495 @@
+#-----------------------------------------------------------------------------#
+# EquivalenceHarness functions:
+#    Checks that an accelerated engine reproduces the reference path, i.e.
+#    the loop over Elector objects calling Elector.calculateStrategicUtilities
+#    as the model was first written: without PivotalityCache, and with
+#    reference electors (see Elector.reference), which compute the Skellam
+#    terms with scipy.stats.skellam pair by pair and the pivotalities with
+#    np.delete products, so errors in the Bessel, log-space, saddle point or
+#    prefix/suffix product paths show up. Both run on the same seeded
+#    electorate, over a grid of (N, K, distribution), and after every
+#    iteration they are compared on:
+#     - the tally;
+#     - every elector's chosen candidate;
+#     - every elector's strategic utilities, each row relative to its largest
+#       absolute utility (leaving out MIN_UTIL), within the utility tolerance
+#       (FLOAT32_TOLERANCE for engines storing float32) or the error bound of
+#       the elector, if larger (see below).
+#    Each case reports the first point of divergence (iteration, what
+#    diverged and, for choices and utilities, the first elector), the largest
+#    utility difference seen among the electors held to the utility tolerance
+#    itself (see below) and the speedup of the engine over the reference.
+#
+#    The reference follows the update of the engine (see ENGINES):
+#     - "sequential" and "randomSequential": electors one at a time, each
+#       recounting the electorate and so seeing the votes moved before it
+#       (in the order of the engine's UpdateSchedule for the latter);
+#     - "synchronous": every elector reading a tally frozen at the start of
+#       the iteration (FrozenTally);
+#     - "partial" and "damped": the synchronous one, then the electors the
+#       engine's UpdateSchedule leaves out get their utilities back, or every
+#       row is blended with UpdateSchedule.dampUtilities.
+#
+#    Neither side is exact everywhere: the reference computes winnerProbs as
+#    1 - cdf, which cancels in the deep tails, so its pivotalities are only
+#    known to about REFERENCE_ERROR in absolute terms, and engines in log
+#    space (or with an approxThreshold) approximate some pairs themselves,
+#    e.g. the balanced deep tails of the Skellam module, each pivotality to
+#    about nCandidates times the largest error Skellam.approximationErrors
+#    estimates for the pairs of its context. Each elector is therefore
+#    compared within the largest of the utility tolerance and a bound of
+#    those errors carried through its utility update (see
+#    utilityErrorBounds), which also carries the bound of the previous
+#    iteration, as the utilities build on the previous ones. Electors whose
+#    two best candidates are within twice that tolerance have no determined
+#    choice (nAmbiguous counts them, at the iteration with the most), and once
+#    the choices of such electors only differ, the case stops there
+#    (ambiguousFrom), as the two dynamics legitimately part. Such a case was
+#    only verified up to that iteration, so the summary counts it apart from
+#    the ones that ran to the end, and a case where more than
+#    MAX_AMBIGUOUS_FRACTION of the electors were ambiguous at once verified
+#    too little of the electorate to count as passed (see unverifiedCase).
+#    That happens as soon as a tally turns lopsided: the pivotalities of its
+#    contexts fall far below REFERENCE_ERROR (4.6e-24 at most after the first
+#    iteration of 100 electors and 5 candidates), so the reference no longer
+#    tells any two candidates apart. On the default grid, 13 of the 18 cases
+#    of the "population" engine are in that situation.
+#
+# Usage as a script:
+#    python EquivalenceHarness.py [engine] [maxIterations]
+#    runs the default grid with the given engine (default: "population", or
+#    "all" for every engine) and exits with status 1 if any case diverged,
+#    or else 2 if any case had too many ambiguous electors.
+#-----------------------------------------------------------------------------#
+import sys
+import json
+from timeit import default_timer as timer
+import numpy as np
+
+import Cox1994Model
+import GlobalFuncs
+import RandomStreams
+import Skellam
+from Elector import Elector
+from Candidate import Candidate
+from VoteTally import VoteTally
+from ElectorPopulation import ElectorPopulation
+from ThreadedPopulation import ThreadedPopulation
+from ShardedPopulation import ShardedPopulation
+from ReplicationBatch import ReplicationBatch
+from UpdateSchedule import UpdateSchedule, dampUtilities
+
+#Default grid of electorate sizes, numbers of candidates and distributions:
+ELECTOR_COUNTS = [30, 100, 300]
+CANDIDATE_COUNTS = [3, 4, 5]
+DISTRIBUTIONS = ["uniform", "stdnormal"]
+
+#Largest relative difference of strategic utilities counted as equivalent,
+#for float64 engines and for engines storing float32:
+UTILITY_TOLERANCE = 1e-9
+FLOAT32_TOLERANCE = 1e-5
+
+#Absolute error of the pivotalities of the reference (see the header):
+REFERENCE_ERROR = 1e-15
+
+#Largest fraction of a case's electors that can be ambiguous at once with the
+#case still counted as verified:
+MAX_AMBIGUOUS_FRACTION = 0.1
+
+#Iterations each case is run for at most (it stops earlier once the
+#reference tally stops changing):
+MAX_ITERATIONS = 20
+
+#Seed of the electorates of the grid:
+HARNESS_SEED = 19940901
+
+#Engines checked against the reference, as the update mode they run, the
+#class they are built with ("population", "threaded", "sharded" or "batch")
+#and the arguments they are built with:
+ENGINES = {
+    "population": ("sequential", "population", {}),
+    "populationLogSpace": ("sequential", "population", {"logSpace": True}),
+    "populationFloat32": ("sequential", "population", {"precision": "float32"}),
+    "randomSequential": ("randomSequential", "population", {}),
+    "synchronous": ("synchronous", "population", {}),
+    "synchronousLogSpace": ("synchronous", "population", {"logSpace": True}),
+    "synchronousFloat32": ("synchronous", "population",                       \
+                           {"precision": "float32"}),
+    "numba": ("synchronous", "population", {"kernel": "numba"}),
+    "numbaFloat32": ("synchronous", "population",                             \
+                     {"kernel": "numba", "precision": "float32"}),
+    "threaded": ("synchronous", "threaded", {"nThreads": 2, "blockSize": 7}),
+    "threadedSequential": ("sequential", "threaded",                          \
+                           {"nThreads": 2, "blockSize": 7}),
+    "sharded": ("synchronous", "sharded", {"nShards": 2}),
+    "partial": ("partial", "population", {}),
+    "damped": ("damped", "population", {}),
+    "replicationBatch": ("synchronous", "batch", {}),
+    "replicationBatchLogSpace": ("synchronous", "batch", {"logSpace": True}),
+}
+
+#-----------------------------------------------------------------------------#
+# FrozenTally: VoteTally that electors read but do not move their votes in,
+# so that every elector of the synchronous reference reacts to the tally
+# counted at the start of the iteration.
+#-----------------------------------------------------------------------------#
+
+class FrozenTally(VoteTally):
+
+    #leave the tally as it was counted:
+    def switch(self, fromCandidateID, toCandidateID):
+        pass
+
+#Function that builds the engine, draws its electorate and gives it:
+def buildEngine(engine, nElectors, nCandidates, allCandidates, distribution,  \
+                seed):
+    update, engineClass, arguments = ENGINES[engine]
+    if engineClass == "threaded":
+        population = ThreadedPopulation(nElectors, nCandidates, **arguments)
+    elif engineClass == "sharded":
+        population = ShardedPopulation(nElectors, nCandidates, **arguments)
+    else:
+        population = ElectorPopulation(nElectors, nCandidates, **arguments)
+    population.calcSincereUtilities(allCandidates, 0, 100, distribution,      \
+                                    RandomStreams.seedSequence(seed))
+    if engineClass != "batch":
+        return population
+    batch = ReplicationBatch(1, nElectors, nCandidates, **arguments)
+    batch.sincereUtilities[0] = population.sincereUtilities
+    batch.strategicUtilities[0] = population.strategicUtilities
+    batch.chosenCandidates[0] = population.chosenCandidates
+    return batch
+
+#Function that runs one iteration of the engine and gives its tally, the
+#chosen candidates and the true strategic utilities of its electors:
+def stepEngine(engine, population, allCandidates, iteration, schedule):
+    update, engineClass, arguments = ENGINES[engine]
+    if engineClass == "batch":
+        population.calculateStrategicUtilities(Cox1994Model.MIN_UTIL,        \
+                                               iteration)
+        tally = population.countVoteIntentions(np.array([0]), iteration)[0]
+        return list(tally), population.chosenCandidates[0],                   \
+               scaledUtilities(population.strategicUtilities[0],              \
+                               population.utilityLogScales[0])
+    population.calculateStrategicUtilities(allCandidates,                     \
+                                           Cox1994Model.MIN_UTIL, iteration,  \
+                                           update, schedule)
+    tally = population.countVoteIntentions(allCandidates, iteration)
+    return list(tally), population.chosenCandidates,                          \
+           populationUtilities(population)
+
+#Function that runs one iteration of the reference with the update of the
+#engine (see the header):
+def stepReference(update, allElectors, allCandidates, iteration, schedule):
+    MIN_UTIL = Cox1994Model.MIN_UTIL
+    lastUtilities = np.array([elector.strategicUtilities                      \
+                              for elector in allElectors], dtype=float)
+    if update in ["sequential", "randomSequential"]:
+        order = range(0, len(allElectors))
+        if update == "randomSequential":
+            order = schedule.electorOrder(iteration, len(allElectors))
+        for electorID in order:
+            allElectors[electorID].calculateStrategicUtilities(              \
+                allCandidates, allElectors, MIN_UTIL, iteration)
+        return
+    tally = FrozenTally(len(allCandidates))
+    tally.recountElectors(allElectors, allCandidates, iteration)
+    for elector in allElectors:
+        elector.calculateStrategicUtilities(allCandidates, allElectors,       \
+                                            MIN_UTIL, iteration, tally)
+    if update == "partial":
+        kept = ~schedule.updatingElectors(iteration, len(allElectors), 0,     \
+                                          len(allElectors))
+        for electorID in np.flatnonzero(kept):
+            allElectors[electorID].strategicUtilities[:] =                    \
+                lastUtilities[electorID]
+    elif update == "damped" and iteration > 0:
+        utilities = dampUtilities(lastUtilities,                              \
+                                  np.array([elector.strategicUtilities        \
+                                            for elector in allElectors]),     \
+                                  schedule.damping, MIN_UTIL)
+        for electorID in range(0, len(allElectors)):
+            allElectors[electorID].strategicUtilities[:] = utilities[electorID]
+    elif update not in ["synchronous", "damped"]:
+        raise ValueError("Unknown update mode: " + str(update))
+
+#Function that gives rows of utilities scaled back by their log scales
+#(MIN_UTIL left as it is):
+def scaledUtilities(utilities, logScales):
+    utilities = np.array(utilities, dtype=float)
+    kept = utilities != Cox1994Model.MIN_UTIL
+    return np.where(kept, utilities * np.exp(logScales)[:,None], utilities)
+
+#Function that gives the true strategic utilities of a population:
+def populationUtilities(population):
+    return scaledUtilities(population.strategicUtilities,                     \
+                           population.utilityLogScales)
+
+#Function that gives, for every elector, the gap between its two best
+#utilities relative to its largest absolute utility, leaving out MIN_UTIL:
+def choiceMargins(referenceUtilities):
+    kept = referenceUtilities != Cox1994Model.MIN_UTIL
+    bestTwo = -np.sort(-np.where(kept, referenceUtilities, -np.inf),         \
+                       axis=1)[:,:2]
+    scales = np.max(np.where(kept, np.abs(referenceUtilities), 0), axis=1)
+    scales = np.where(scales > 0, scales, 1)
+    return (bestTwo[:,0] - bestTwo[:,1]) / scales
+
+#Function that gives, for every elector, the largest difference between two
+#(nElectors, nCandidates) arrays of utilities, relative to the largest
+#absolute utility of the reference row, leaving out MIN_UTIL:
+def utilityDifferences(referenceUtilities, utilities):
+    kept = (referenceUtilities != Cox1994Model.MIN_UTIL)                      \
+           & (utilities != Cox1994Model.MIN_UTIL)
+    changes = np.where(kept, np.abs(referenceUtilities - utilities), 0)
+    scales = np.max(np.where(kept, np.abs(referenceUtilities), 0), axis=1)
+    scales = np.where(scales > 0, scales, 1)
+    return np.max(changes, axis=1) / scales
+
+#Function that runs one case of the grid: the reference and the engine on
+#the same electorate, compared after every iteration, and gives the report:
+def runCase(nElectors, nCandidates, distribution, engine="population",        \
+            maxIterations=MAX_ITERATIONS, utilityTolerance=None,              \
+            seed=HARNESS_SEED):
+    update, engineClass, arguments = ENGINES[engine]
+    if utilityTolerance is None:
+        utilityTolerance = UTILITY_TOLERANCE
+        if arguments.get("precision") == "float32":
+            utilityTolerance = FLOAT32_TOLERANCE
+    allCandidates = [Candidate(candidateID)                                   \
+                     for candidateID in range(0, nCandidates)]
+    referenceCandidates = [Candidate(candidateID)                             \
+                           for candidateID in range(0, nCandidates)]
+    schedule = UpdateSchedule(seedSequence=RandomStreams.childSequence(       \
+        RandomStreams.seedSequence(seed), RandomStreams.SCHEDULE_STREAM))
+    population = buildEngine(engine, nElectors, nCandidates, allCandidates,   \
+                             distribution, seed)
+    try:
+        sincereUtilities = np.array(population.sincereUtilities, dtype=float)
+        if engineClass == "batch":
+            sincereUtilities = sincereUtilities[0]
+        allElectors = []
+        for electorID in range(0, nElectors):
+            elector = Elector(electorID, nCandidates, keepDiagnostics=True,   \
+                              reference=True)
+            elector.sincereUtilities = sincereUtilities[electorID]
+            elector.strategicUtilities = np.array(sincereUtilities[electorID])
+            allElectors.append(elector)
+        return compareRuns(engine, population, allElectors, allCandidates,    \
+                           referenceCandidates, schedule, maxIterations,      \
+                           utilityTolerance)
+    finally:
+        if engineClass in ["threaded", "sharded"]:
+            population.close()
+
+#Function that steps the reference and the engine side by side and gives the
+#report of the case (see runCase):
+def compareRuns(engine, population, allElectors, allCandidates,               \
+                referenceCandidates, schedule, maxIterations,                 \
+                utilityTolerance):
+    update = ENGINES[engine][0]
+    report = {"nElectors": len(allElectors),                                  \
+              "nCandidates": len(allCandidates),                              \
+              "engine": engine, "nIterations": 0, "divergence": None,         \
+              "ambiguousFrom": None, "nAmbiguous": 0,                         \
+              "maxUtilityDifference": 0.0}
+    bounds = np.zeros(len(allElectors))
+    referenceTime = 0.0
+    engineTime = 0.0
+    lastTally = None
+    for iteration in range(0, maxIterations):
+        startTime = timer()
+        stepReference(update, allElectors, referenceCandidates, iteration,    \
+                      schedule)
+        referenceTally = GlobalFuncs.countVoteIntentions(allElectors,         \
+                                                         referenceCandidates, \
+                                                         iteration)
+        referenceTime += timer() - startTime
+
+        startTime = timer()
+        tally, choices, utilities = stepEngine(engine, population,            \
+                                               allCandidates, iteration,      \
+                                               schedule)
+        engineTime += timer() - startTime
+        report["nIterations"] = iteration + 1
+
+        bounds = np.maximum(bounds, utilityErrorBounds(engine, allElectors,   \
+                                                       bounds))
+        tolerances = np.maximum(bounds, utilityTolerance)
+        referenceUtilities = np.array([elector.strategicUtilities             \
+                                       for elector in allElectors],           \
+                                      dtype=float)
+        referenceChoices = np.array([elector.chooseCandidate(                 \
+                                        referenceCandidates, iteration).ID    \
+                                     for elector in allElectors])
+        ambiguous = choiceMargins(referenceUtilities) / 2 <= tolerances
+        report["nAmbiguous"] = max(report["nAmbiguous"],                      \
+                                   int(np.count_nonzero(ambiguous)))
+        differences = utilityDifferences(referenceUtilities, utilities)
+        report["maxUtilityDifference"] = max(report["maxUtilityDifference"], \
+            float(np.max(np.where(bounds <= utilityTolerance, differences, 0))))
+        differentChoices = referenceChoices != choices
+        if np.any(differentChoices) and                                       \
+           not np.any(differentChoices & ~ambiguous):
+            report["ambiguousFrom"] = iteration
+            break
+        report["divergence"] = findDivergence(iteration, referenceTally,      \
+                                              tally, referenceChoices,        \
+                                              choices, differences,           \
+                                              tolerances)
+        if report["divergence"] is not None or referenceTally == lastTally:
+            break
+        lastTally = referenceTally
+
+    report["referenceSeconds"] = referenceTime
+    report["engineSeconds"] = engineTime
+    report["speedup"] = referenceTime / max(engineTime, 1e-12)
+    return report
+
+#Function that gives, for every reference elector, a bound of the relative
+#difference its last update allows between the reference and the engine,
+#given the bounds of the previous iteration. For u_c = sum_j P_cj
+#(previous_c - sincere_j), each pivotality is off by REFERENCE_ERROR plus
+#its relative engine error (see engineErrors) and each previous utility by
+#its own bound, all relative to the largest absolute utility of the row
+#(leaving out MIN_UTIL):
+def utilityErrorBounds(engine, allElectors, lastBounds):
+    relativeErrors = engineErrors(engine, allElectors)
+    bounds = np.zeros(len(allElectors))
+    for electorID in range(0, len(allElectors)):
+        elector = allElectors[electorID]
+        if not np.isfinite(lastBounds[electorID]):
+            bounds[electorID] = np.inf
+            continue
+        pivotalities = np.abs(np.asarray(elector.pivotalities))
+        previousUtilities = np.asarray(elector.previousUtilities, dtype=float)
+        utilities = np.asarray(elector.strategicUtilities, dtype=float)
+        kept = utilities != Cox1994Model.MIN_UTIL
+        previousScale = np.max(np.abs(previousUtilities[kept]))
+        scale = np.max(np.abs(utilities[kept]))
+        differences = np.abs(previousUtilities[:,None]                        \
+                             - np.asarray(elector.sincereUtilities)[None,:])
+        errors = np.sum((relativeErrors[electorID] * pivotalities             \
+                         + REFERENCE_ERROR) * differences, axis=1)            \
+                 + np.sum(pivotalities, axis=1) * lastBounds[electorID]       \
+                   * previousScale
+        bounds[electorID] = np.max(errors[kept]) / scale if scale > 0         \
+                            else np.inf
+    return bounds
+
+#Function that gives, for every reference elector, the estimated relative
+#error of the pivotalities the engine computes for its context, from the
+#pairs the engine approximates (see the header), zero for engines
+#approximating none:
+def engineErrors(engine, allElectors):
+    arguments = ENGINES[engine][2]
+    approxThreshold = arguments.get("approxThreshold")
+    logSpace = arguments.get("logSpace", False)
+    errors = np.zeros(len(allElectors))
+    if approxThreshold is None and not logSpace:
+        return errors
+    contextErrors = {}
+    for electorID in range(0, len(allElectors)):
+        key = tuple(allElectors[electorID].othersVotes)
+        if key not in contextErrors:
+            ratesA, ratesB = Skellam.rateMatrices(key)
+            contextErrors[key] = len(key) * np.max(                           \
+                Skellam.approximationErrors(ratesA, ratesB, approxThreshold,  \
+                                            logSpace))
+        errors[electorID] = contextErrors[key]
+    return errors
+
+#Function that gives the first divergence of an iteration, checking the
+#tally, then the choices, then the utilities (each elector within its own
+#tolerance), or None if there is none:
+def findDivergence(iteration, referenceTally, tally, referenceChoices,        \
+                   choices, differences, tolerances):
+    if list(referenceTally) != list(tally):
+        return {"iteration": iteration, "kind": "tally",                      \
+                "reference": list(referenceTally), "engine": list(tally)}
+    differentChoices = np.flatnonzero(referenceChoices != choices)
+    if len(differentChoices) > 0:
+        electorID = int(differentChoices[0])
+        return {"iteration": iteration, "kind": "choices",                    \
+                "electorID": electorID,                                       \
+                "nElectors": len(differentChoices),                           \
+                "reference": int(referenceChoices[electorID]),                \
+                "engine": int(choices[electorID])}
+    differentUtilities = np.flatnonzero(differences > tolerances)
+    if len(differentUtilities) > 0:
+        electorID = int(differentUtilities[0])
+        return {"iteration": iteration, "kind": "utilities",                  \
+                "electorID": electorID,                                       \
+                "nElectors": len(differentUtilities),                         \
+                "difference": float(differences[electorID]),                  \
+                "tolerance": float(tolerances[electorID])}
+    return None
+
+#Function that tells whether a case had too many ambiguous electors to count
+#as verified, whether or not it stopped on them:
+def unverifiedCase(report):
+    return report["nAmbiguous"]                                               \
+           > MAX_AMBIGUOUS_FRACTION * report["nElectors"]
+
+#Function that gives the summary line of the reports of a grid:
+def summarize(reports):
+    nDiverged = sum(report["divergence"] is not None for report in reports)
+    nStoppedAmbiguous = sum(report["ambiguousFrom"] is not None               \
+                            for report in reports)
+    nUnverified = sum(unverifiedCase(report) for report in reports)
+    nVerified = sum(report["divergence"] is None                              \
+                    and report["ambiguousFrom"] is None                       \
+                    and not unverifiedCase(report) for report in reports)
+    return str(nVerified) + " of " + str(len(reports)) + " cases verified "   \
+           + "to the end, " + str(nDiverged) + " diverged, "                  \
+           + str(nStoppedAmbiguous) + " stopped on ambiguous choices, "       \
+           + str(nUnverified) + " with more than "                            \
+           + str(int(100 * MAX_AMBIGUOUS_FRACTION))                           \
+           + "% of their electors ambiguous"
+
+#Function that runs every case of a grid with the given engine and gives
+#their reports:
+def runGrid(engine="population", electorCounts=ELECTOR_COUNTS,               \
+            candidateCounts=CANDIDATE_COUNTS, distributions=DISTRIBUTIONS,    \
+            maxIterations=MAX_ITERATIONS, utilityTolerance=None,              \
+            verbose=False):
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine: " + str(engine))
+    reports = []
+    for distribution in distributions:
+        for nCandidates in candidateCounts:
+            for nElectors in electorCounts:
+                report = runCase(nElectors, nCandidates, distribution,        \
+                                 engine, maxIterations, utilityTolerance)
+                report["distribution"] = distribution
+                reports.append(report)
+                if verbose:
+                    print(json.dumps(report, sort_keys=True))
+    return reports
+
+
+#-----------------------------------------------------------------------------#
+# Running as a script:
+#-----------------------------------------------------------------------------#
+
+if __name__ == "__main__":
+    engines = ["population"]
+    maxIterations = MAX_ITERATIONS
+    if len(sys.argv) > 1:
+        engines = [sys.argv[1]]
+        if sys.argv[1] == "all":
+            engines = sorted(ENGINES)
+    if len(sys.argv) > 2:
+        maxIterations = int(sys.argv[2])
+    reports = []
+    for engine in engines:
+        reports += runGrid(engine, maxIterations=maxIterations, verbose=True)
+    print(summarize(reports))
+    if any(report["divergence"] is not None for report in reports):
+        sys.exit(1)
+    if any(unverifiedCase(report) for report in reports):
+        sys.exit(2)
+
+#-----------------------------------------------------------------------------#
+# End of file
+#-----------------------------------------------------------------------------#
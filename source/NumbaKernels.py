@@ -0,0 +1,230 @@
+#-----------------------------------------------------------------------------#
+# NumbaKernels functions:
+#    Optional compiled versions of the per-elector loops of the strategic
+#    utility update, for populations created with kernel="numba". Numba is
+#    only an optional dependency: without it HAVE_NUMBA is False and
+#    populations fall back to the NumPy block functions of ElectorPopulation.
+#
+#    The update of an elector is a handful of K x K loops. The NumPy path runs
+#    them as whole-array operations, which allocate temporaries (the rows of
+#    each group, their two terms, the argsort of the flags) several times the
+#    size of the block; the kernels below walk the block once, elector by
+#    elector, keeping a single row of scratch. They compute the same terms
+#    with the same formulas, so the results agree with NumPy up to rounding
+#    (BLAS may sum the products in another order).
+#
+#    The Skellam terms are not compiled: they need SciPy's Bessel and
+#    non-central chi-square functions, which Numba cannot call, and they are
+#    evaluated once per context rather than once per elector (see
+#    PivotalityCache). What is compiled is everything downstream of them: the
+#    leave-two-out products of the pivotalities and the utility accumulation.
+#
+#    Kernels are compiled with cache=True, so only the first process ever
+#    compiles them and later ones load the machine code from __pycache__.
+#    warmUp compiles (or loads) all of them at once; SweepRunner calls it in
+#    the parent before starting its workers, so no worker compiles.
+#-----------------------------------------------------------------------------#
+import numpy as np
+
+try:
+    import numba
+    HAVE_NUMBA = True
+except ImportError:
+    numba = None
+    HAVE_NUMBA = False
+
+#Function that compiles the given function with Numba (nopython mode, cached
+#on disk, releasing the GIL so ThreadedPopulation runs blocks in parallel),
+#or gives it back untouched when Numba is missing:
+def compiled(function):
+    if not HAVE_NUMBA:
+        return function
+    return numba.njit(cache=True, nogil=True)(function)
+
+#Kernel of Pivotality.calcPivotalities for a single (K, K) context: the
+#product of winnerProbs without the pair's row and column, times the
+#probability of the pair being decisive:
+@compiled
+def pivotalitiesKernel(winnerProbs, pivotalityProbs):
+    nCandidates = winnerProbs.shape[0]
+    rowProdsWoutCol = np.ones((nCandidates, nCandidates))
+    for rowIndex in range(nCandidates):
+        for colIndex in range(nCandidates):
+            for otherCol in range(nCandidates):
+                if otherCol != colIndex:
+                    rowProdsWoutCol[rowIndex,colIndex] *=                     \
+                        winnerProbs[rowIndex,otherCol]
+    pivotalities = np.zeros((nCandidates, nCandidates))
+    for rowIndex in range(nCandidates):
+        for colIndex in range(nCandidates):
+            if rowIndex == colIndex:
+                continue
+            probsProd = 1.0
+            for otherRow in range(nCandidates):
+                if otherRow != rowIndex:
+                    probsProd *= rowProdsWoutCol[otherRow,colIndex]
+            pivotalities[rowIndex,colIndex] = probsProd                       \
+                * (pivotalityProbs[rowIndex,colIndex]                         \
+                   + winnerProbs[rowIndex,colIndex])
+    return pivotalities
+
+#Kernel of ElectorPopulation.countBlock: choose the candidate of every elector
+#from firstElector to lastElector (excluded) and give their tally:
+@compiled
+def countKernel(utilities, chosenCandidates, firstElector, lastElector):
+    nCandidates = utilities.shape[1]
+    tally = np.zeros(nCandidates, dtype=np.int64)
+    for electorID in range(firstElector, lastElector):
+        bestID = 0
+        for candidateID in range(1, nCandidates):
+            if utilities[electorID,candidateID] > utilities[electorID,bestID]:
+                bestID = candidateID
+        chosenCandidates[electorID] = bestID
+        tally[bestID] += 1
+    return tally
+
+#Kernel of ElectorPopulation.updateBlock: update in place the strategic
+#utilities of every elector from firstElector to lastElector (excluded),
+#given the (K, K, K) stack of context pivotalities, their log scales and
+#whether each has underflowed pivotalities, and give how many of them have
+#a choice below the precision (machine epsilon eps) utilities are stored in.
+#Compact rows are stored as ElectorPopulation.compactRows does:
+@compiled
+def updateKernel(sincereUtilities, strategicUtilities, utilityLogScales,      \
+                 chosenCandidates, firstElector, lastElector,                 \
+                 contextPivotalities, contextLogScales, contextUnderflowed,   \
+                 MIN_UTIL, iteration, logSpace, eps, compact):
+    nCandidates = sincereUtilities.shape[1]
+    scaled = logSpace or compact
+    roundingFactor = 4 * eps
+    ownTerms = np.empty(nCandidates)
+    sincereTerms = np.empty(nCandidates)
+    newUtilities = np.empty(nCandidates)
+    nPrecisionFlags = 0
+    for electorID in range(firstElector, lastElector):
+        chosenID = chosenCandidates[electorID]
+        pivotalities = contextPivotalities[chosenID]
+        utilityScale = 1.0
+        if scaled and iteration > 0:
+            utilityScale = np.exp(utilityLogScales[electorID])
+        leastID = 0
+        for candidateID in range(1, nCandidates):
+            if sincereUtilities[electorID,candidateID]                        \
+               < sincereUtilities[electorID,leastID]:
+                leastID = candidateID
+        for candidateID in range(nCandidates):
+            if iteration == 0:
+                previousUtility = sincereUtilities[electorID,candidateID]
+            elif scaled:
+                previousUtility = strategicUtilities[electorID,candidateID]   \
+                                  * utilityScale
+            else:
+                previousUtility = strategicUtilities[electorID,candidateID]
+            pivotalitySum = 0.0
+            sincereTerm = 0.0
+            for otherID in range(nCandidates):
+                pivotalitySum += pivotalities[candidateID,otherID]
+                sincereTerm += sincereUtilities[electorID,otherID]            \
+                               * pivotalities[candidateID,otherID]
+            ownTerms[candidateID] = previousUtility * pivotalitySum
+            sincereTerms[candidateID] = sincereTerm
+            newUtilities[candidateID] = ownTerms[candidateID] - sincereTerm
+        newUtilities[leastID] = MIN_UTIL
+        if contextUnderflowed[chosenID]:
+            nPrecisionFlags += 1
+        elif nCandidates > 1:
+            bestID = 0
+            for candidateID in range(1, nCandidates):
+                if newUtilities[candidateID] >= newUtilities[bestID]:
+                    bestID = candidateID
+            secondID = -1
+            for candidateID in range(nCandidates):
+                if candidateID != bestID and (secondID < 0 or                 \
+                   newUtilities[candidateID] >= newUtilities[secondID]):
+                    secondID = candidateID
+            margin = newUtilities[bestID] - newUtilities[secondID]
+            roundingError = roundingFactor                                    \
+                * (abs(ownTerms[bestID]) + abs(sincereTerms[bestID])          \
+                   + abs(ownTerms[secondID]) + abs(sincereTerms[secondID]))
+            if margin <= roundingError:
+                nPrecisionFlags += 1
+        rowScale = 1.0
+        if compact:
+            rowScale = 0.0
+            for candidateID in range(nCandidates):
+                if candidateID != leastID and                                 \
+                   abs(newUtilities[candidateID]) > rowScale:
+                    rowScale = abs(newUtilities[candidateID])
+            if rowScale == 0:
+                rowScale = 1.0
+        for candidateID in range(nCandidates):
+            if candidateID == leastID:
+                strategicUtilities[electorID,candidateID] = MIN_UTIL
+            else:
+                strategicUtilities[electorID,candidateID] =                   \
+                    newUtilities[candidateID] / rowScale
+        utilityLogScales[electorID] = contextLogScales[chosenID]              \
+                                      + np.log(rowScale)
+    return nPrecisionFlags
+
+#Same as Pivotality.calcPivotalities, for a single (K, K) context:
+def calcPivotalities(winnerProbs, pivotalityProbs):
+    return pivotalitiesKernel(np.ascontiguousarray(winnerProbs, dtype=float), \
+                              np.ascontiguousarray(pivotalityProbs,           \
+                                                   dtype=float))
+
+#Block function with the signature of ElectorPopulation.countBlock:
+def countBlock(arrays, bounds, iteration):
+    if iteration == 0:
+        utilities = arrays["sincereUtilities"]
+    else:
+        utilities = arrays["strategicUtilities"]
+    return countKernel(utilities, arrays["chosenCandidates"], bounds[0],      \
+                       bounds[1])
+
+#Block function with the signature of ElectorPopulation.updateBlock, packing
+#the contexts of the chosen candidates into the arrays the kernel takes:
+def updateBlock(arrays, bounds, contexts, MIN_UTIL, iteration, logSpace):
+    nCandidates = arrays["sincereUtilities"].shape[1]
+    contextPivotalities = np.zeros((nCandidates, nCandidates, nCandidates))
+    contextLogScales = np.zeros(nCandidates)
+    contextUnderflowed = np.zeros(nCandidates, dtype=np.bool_)
+    for chosenID in contexts:
+        pivotalities, logScale = contexts[chosenID]
+        contextPivotalities[chosenID] = pivotalities
+        contextLogScales[chosenID] = logScale
+        contextUnderflowed[chosenID] =                                        \
+            np.count_nonzero(pivotalities == 0) > nCandidates
+    return updateKernel(arrays["sincereUtilities"],                           \
+                        arrays["strategicUtilities"],                         \
+                        arrays["utilityLogScales"], arrays["chosenCandidates"],\
+                        bounds[0], bounds[1], contextPivotalities,            \
+                        contextLogScales, contextUnderflowed, float(MIN_UTIL),\
+                        iteration, logSpace,                                  \
+                        float(np.finfo(arrays["strategicUtilities"].dtype).eps),\
+                        arrays["strategicUtilities"].dtype != np.float64)
+
+#Numbers of candidates whose population arrays get each of the dtypes of
+#ElectorPopulation.populationDtypes (uint8, uint16 and int64 chosen
+#candidates with float32 utilities):
+WARM_UP_CANDIDATE_COUNTS = [2, 2**8 + 1, 2**16 + 1]
+
+#Compile (or load from the disk cache) every kernel, for every combination of
+#dtypes a population can store its arrays in (see populationDtypes), by
+#running each of them once on a tiny population of each:
+def warmUp():
+    if not HAVE_NUMBA:
+        return
+    from ElectorPopulation import populationDtypes, PRECISIONS
+    dtypes = set()
+    for precision in PRECISIONS:
+        for nCandidates in WARM_UP_CANDIDATE_COUNTS:
+            dtypes.add(populationDtypes(nCandidates, precision))
+    pivotalities = calcPivotalities(np.ones((2,2)), np.ones((2,2)))
+    for utilityDtype, choiceDtype in sorted(dtypes, key=str):
+        arrays = {"sincereUtilities": np.eye(2, dtype=utilityDtype),          \
+                  "strategicUtilities": np.eye(2, dtype=utilityDtype),        \
+                  "utilityLogScales": np.zeros(2),                            \
+                  "chosenCandidates": np.zeros(2, dtype=choiceDtype)}
+        countBlock(arrays, (0, 2), 0)
+        updateBlock(arrays, (0, 2), {0: (pivotalities, 0.0)}, -1.0, 1, True)
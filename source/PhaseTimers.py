@@ -0,0 +1,103 @@
+#-----------------------------------------------------------------------------#
+# PhaseTimers-owned Variables:
+#    enabled: whether anything is recorded at all
+#    totals: dictionary with the seconds spent in every phase (see PHASES)
+#            and the value of every counter (see COUNTERS) over the whole run
+#    current: same as totals, for the iteration being run
+#    iterations: list with the record of every iteration run so far
+#
+# Instrumentation of the main loop. Every phase of an iteration is timed
+# between start() and stop(), and the counters are added to with count();
+# the loop closes each iteration with endIteration(), which keeps its record.
+# The phases are:
+#  - "setup": building the population and drawing its sincere utilities
+#    (once per run, so only in the record of iteration 0);
+#  - "probabilities": the Skellam probability matrices of new contexts;
+#  - "pivotalities": the pivotalities of new contexts;
+#  - "update": the rest of the strategic utility update;
+#  - "tally": counting the vote intentions;
+#  - "convergence": the stop checks (TallyHistory and ConvergenceCriteria).
+# The counters are:
+#  - "skellamEvaluations": ordered pairs of candidates whose Skellam terms
+#    were evaluated, K * (K - 1) for every new context;
+#  - "cacheHits", "cacheMisses": lookups of the PivotalityCache answered from
+#    it, and that computed a new context;
+#  - "switches": electors whose chosen candidate changed in the iteration.
+# The timers are only called a handful of times per iteration (per context,
+# not per elector), and do nothing when disabled, so leaving them in the loop
+# costs nothing measurable.
+#-----------------------------------------------------------------------------#
+
+from timeit import default_timer as timer
+
+#Phases of an iteration that are timed:
+PHASES = ["setup", "probabilities", "pivotalities", "update", "tally",        \
+          "convergence"]
+
+#Counters kept for every iteration:
+COUNTERS = ["skellamEvaluations", "cacheHits", "cacheMisses", "switches"]
+
+class PhaseTimers(object):
+
+    #overload of class constructor, that initializes timer-owned variables
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.totals = emptyRecord()
+        self.current = emptyRecord()
+        self.iterations = []
+
+    #give the time a phase starts at (0 when disabled):
+    def start(self):
+        if not self.enabled:
+            return 0.0
+        return timer()
+
+    #add the time since startTime to a phase of the current iteration:
+    def stop(self, phase, startTime):
+        if self.enabled:
+            self.current[phase] += timer() - startTime
+
+    #same as stop, leaving out what the given phases took meanwhile (i.e. the
+    #phases nested in this one), which were timed on their own:
+    def stopExcluding(self, phase, startTime, nestedPhases, nestedStart):
+        if self.enabled:
+            nestedTime = sum(self.current[nestedPhase]                        \
+                             for nestedPhase in nestedPhases) - nestedStart
+            self.current[phase] += timer() - startTime - nestedTime
+
+    #give the seconds the given phases took so far in the current iteration,
+    #to be passed to stopExcluding:
+    def elapsed(self, phases):
+        return sum(self.current[phase] for phase in phases)
+
+    #add n to a counter of the current iteration:
+    def count(self, counter, n):
+        if self.enabled:
+            self.current[counter] += n
+
+    #keep the record of the current iteration and start a new one:
+    def endIteration(self, iteration):
+        if not self.enabled:
+            return
+        record = dict(self.current)
+        record["iteration"] = iteration
+        self.iterations.append(record)
+        for key in self.current:
+            self.totals[key] += self.current[key]
+        self.current = emptyRecord()
+
+    #give the totals and the record of every iteration as plain values, or
+    #None when disabled:
+    def asDict(self):
+        if not self.enabled:
+            return None
+        return {"totals": dict(self.totals), "iterations": list(self.iterations)}
+
+#Function that gives a record with every phase and counter at zero:
+def emptyRecord():
+    record = {}
+    for phase in PHASES:
+        record[phase] = 0.0
+    for counter in COUNTERS:
+        record[counter] = 0
+    return record
@@ -0,0 +1,160 @@
+#-----------------------------------------------------------------------------#
+# Pivotality functions:
+#    Probability computations shared by the Elector and ElectorPopulation
+#    strategic utility updates. All of them depend only on the vote intentions
+#    of the other electors (othersVotes), never on the elector itself.
+#-----------------------------------------------------------------------------#
+import numpy as np
+import Skellam
+
+#Backends for the Skellam terms: "bessel" evaluates whole matrices at once
+#through the Skellam module, "scipy" calls scipy.stats.skellam pair by pair:
+PROBABILITY_BACKENDS = ["bessel", "scipy"]
+
+#Function that computes, for every ordered pair of candidates, the probability
+#that they tie (tieProbs), that the first falls exactly one vote behind the
+#second (pivotalityProbs) and that the first gets at least as many votes as
+#the second (winnerProbs), given the vote intentions of the other electors:
+#Pairs whose two rates are at least approxThreshold use the saddle point
+#regime of the Skellam module (only with the "bessel" backend):
+def calcProbabilityMatrices(othersVotes, backend="bessel", approxThreshold=None):
+    if backend == "bessel":
+        return Skellam.probabilityMatrices(othersVotes, approxThreshold)
+    elif backend == "scipy":
+        return calcScipyProbabilityMatrices(othersVotes)
+    else:
+        raise ValueError("Unknown probability backend: " + str(backend))
+
+#Same as calcProbabilityMatrices, one scipy.stats.skellam call per entry
+#(scipy.stats is only imported here, as importing it takes most of a second):
+def calcScipyProbabilityMatrices(othersVotes):
+    from scipy.stats import skellam
+    nCandidates = len(othersVotes)
+    tieProbs = np.zeros([nCandidates,nCandidates])
+    pivotalityProbs = np.zeros([nCandidates,nCandidates])
+    winnerProbs = np.zeros([nCandidates,nCandidates])
+    for rowIndex in range(0,nCandidates):
+        for colIndex in range(0,nCandidates):
+            if rowIndex == colIndex:
+                tieProbs[rowIndex,colIndex] = 1
+                pivotalityProbs[rowIndex,colIndex] = 1
+                winnerProbs[rowIndex,colIndex] = 1
+            else:
+                skellamA = othersVotes[rowIndex]
+                skellamB = othersVotes[colIndex]
+                if skellamA == 0:
+                    skellamA = Skellam.MIN_RATE
+                if skellamB == 0:
+                    skellamB = Skellam.MIN_RATE
+                tieProbs[rowIndex,colIndex] = skellam.pmf(0,skellamA,skellamB)
+                pivotalityProbs[rowIndex,colIndex] = skellam.pmf(-1,skellamA,skellamB)
+                winnerProbs[rowIndex,colIndex] = 1 - skellam.cdf(-1,skellamA,skellamB)
+    return tieProbs, pivotalityProbs, winnerProbs
+
+#Function that gives, for every position along the given axis, the product of
+#all the other entries along that axis. It multiplies an exclusive prefix
+#product by an exclusive suffix product, so it needs no division and is exact
+#even when some entries are zero:
+def leaveOneOutProducts(matrix, axis):
+    matrix = np.moveaxis(matrix, axis, -1)
+    ones = np.ones(matrix.shape[:-1] + (1,))
+    prefixProds = np.concatenate([ones, np.cumprod(matrix[...,:-1], axis=-1)],\
+                                 axis=-1)
+    suffixProds = np.concatenate([np.cumprod(matrix[...,:0:-1], axis=-1)[...,::-1],\
+                                  ones], axis=-1)
+    return np.moveaxis(prefixProds * suffixProds, -1, axis)
+
+#Same as leaveOneOutProducts for sums, used in log space. Infinite entries
+#(log 0) are fine, as they are never subtracted:
+def leaveOneOutSums(matrix, axis):
+    matrix = np.moveaxis(matrix, axis, -1)
+    zeros = np.zeros(matrix.shape[:-1] + (1,))
+    prefixSums = np.concatenate([zeros, np.cumsum(matrix[...,:-1], axis=-1)], \
+                                axis=-1)
+    suffixSums = np.concatenate([np.cumsum(matrix[...,:0:-1], axis=-1)[...,::-1],\
+                                 zeros], axis=-1)
+    return np.moveaxis(prefixSums + suffixSums, -1, axis)
+
+#Function that computes the pivotality of every ordered pair of candidates,
+#that is, the probability of the pair being decisive times the probability of
+#all the remaining pairs going the way that makes it decisive. The product of
+#winnerProbs without the pair's row and column is a leave-one-out product over
+#columns followed by one over rows, so all pairs take O(K^2) work in total.
+#Works on a single (K, K) matrix or on a stack of them (..., K, K):
+def calcPivotalities(winnerProbs, pivotalityProbs):
+    nCandidates = winnerProbs.shape[-1]
+    rowProdsWoutCol = leaveOneOutProducts(winnerProbs, -1)
+    probsProds = leaveOneOutProducts(rowProdsWoutCol, -2)
+    pivotalities = probsProds * (pivotalityProbs + winnerProbs)
+    diagonal = np.arange(nCandidates)
+    pivotalities[...,diagonal,diagonal] = 0
+    return pivotalities
+
+#Same as calcPivotalities, the way the model was first written: one pair at a
+#time, multiplying winnerProbs with the pair's row and column deleted (O(K^4)
+#in total). Kept as the reference the faster paths are checked against (see
+#EquivalenceHarness):
+def calcReferencePivotalities(winnerProbs, pivotalityProbs):
+    nCandidates = winnerProbs.shape[0]
+    pivotalities = np.zeros([nCandidates,nCandidates])
+    for rowIndex in range(0,nCandidates):
+        for colIndex in range(0,nCandidates):
+            if rowIndex != colIndex:
+                probsWoutPair = np.delete(winnerProbs,rowIndex,0)
+                probsWOutPair = np.delete(probsWoutPair,colIndex,1)
+                probsProd = np.prod(probsWOutPair)
+                otherPivsSum = pivotalityProbs[rowIndex,colIndex] + winnerProbs[rowIndex,colIndex]
+                pivotalities[rowIndex,colIndex] = probsProd * otherPivsSum
+    return pivotalities
+
+#Same as calcProbabilityMatrices, in log space (see Skellam.logWinnerProbs for
+#how the tails that would underflow are handled, and for withTailPairs):
+def calcLogProbabilityMatrices(othersVotes, approxThreshold=None,             \
+                               withTailPairs=False):
+    return Skellam.logProbabilityMatrices(othersVotes, approxThreshold,       \
+                                          withTailPairs)
+
+#Same as calcPivotalities, in log space, with -inf (log 0) on the diagonal:
+def calcLogPivotalities(logWinnerProbs, logPivotalityProbs):
+    nCandidates = logWinnerProbs.shape[-1]
+    rowSumsWoutCol = leaveOneOutSums(logWinnerProbs, -1)
+    logProbsProds = leaveOneOutSums(rowSumsWoutCol, -2)
+    logPivotalities = logProbsProds + np.logaddexp(logPivotalityProbs,        \
+                                                   logWinnerProbs)
+    diagonal = np.arange(nCandidates)
+    logPivotalities[...,diagonal,diagonal] = -np.inf
+    return logPivotalities
+
+#Function that gives the two terms whose difference is the new strategic
+#utilities of a group of electors: their previous utility of each candidate
+#times the candidate's total pivotality (ownTerms), and their sincere
+#utilities weighted by the candidate's pivotality against each other one
+#(sincereTerms). pivotalities is a single (K, K) matrix shared by all of them
+#or a (M, K, K) stack with one matrix per elector:
+def calcUtilityTerms(previousUtilities, sincereUtilities, pivotalities):
+    ownTerms = previousUtilities * pivotalities.sum(axis=-1)
+    if pivotalities.ndim == 2:
+        sincereTerms = np.dot(sincereUtilities, pivotalities.T)
+    else:
+        sincereTerms = np.einsum("mo,mjo->mj", sincereUtilities, pivotalities)
+    return ownTerms, sincereTerms
+
+#Function that tells which electors' choice is not determined at float
+#precision: all of them if some pivotality of their context underflowed to
+#zero, otherwise those whose best and second best candidates are closer than
+#the rounding error of the two terms their utilities are the difference of,
+#at the machine epsilon of the precision the utilities are stored in.
+#pivotalities is shaped as in calcUtilityTerms:
+def precisionLossFlags(pivotalities, newUtilities, ownTerms, sincereTerms,    \
+                       eps=np.finfo(float).eps):
+    nCandidates = newUtilities.shape[-1]
+    underflowed = np.count_nonzero(pivotalities == 0, axis=(-2,-1)) > nCandidates
+    roundingErrors = 4 * eps                                                  \
+                     * (np.abs(ownTerms) + np.abs(sincereTerms))
+    order = np.argsort(newUtilities, axis=1)
+    rows = np.arange(len(newUtilities))
+    best = order[:,-1]
+    second = order[:,-2]
+    margins = newUtilities[rows,best] - newUtilities[rows,second]
+    return underflowed | (margins <= roundingErrors[rows,best]                \
+                                     + roundingErrors[rows,second])
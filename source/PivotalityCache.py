@@ -0,0 +1,161 @@
+#-----------------------------------------------------------------------------#
+# PivotalityCache-owned Variables:
+#    contexts: dictionary from othersVotes (as a tuple) to the probability
+#              matrices and pivotalities computed for it
+#    logContexts: same as contexts, in log space
+#    nHits: number of lookups answered from the cache
+#    nMisses: number of lookups that had to compute a new context
+#    backend: probability backend used to compute new contexts (see
+#             Pivotality.PROBABILITY_BACKENDS)
+#    approxThreshold: rate above which pairs of candidates use the saddle
+#                     point regime of the Skellam module (None: never)
+#    exactPairCounts: (K, K) array with how many computed contexts used the
+#                     exact regime for each ordered pair of candidates
+#    approxPairCounts: same as exactPairCounts, for the saddle point regime
+#    tailPairCounts: (K, K) array with how many computed log-space contexts
+#                    took the winner probability of a pair of the exact
+#                    regime from the saddle point tail (see the Skellam
+#                    header), also counted in exactPairCounts
+#    maxApproxError: largest estimated relative error of an approximated pair
+#                    or of one of those tails
+#    kernel: "numba" to compute the pivotalities of new contexts with the
+#            compiled kernel of NumbaKernels, "numpy" otherwise
+#    pivotalitiesFunction: function computing those pivotalities (NumbaKernels,
+#                          and Numba with it, is only imported for "numba")
+#    timers: PhaseTimers the computation of new contexts is timed and counted
+#            in (disabled unless the main loop passes its own)
+#
+# The Skellam matrices only depend on othersVotes, i.e. the tally minus the
+# elector's own vote, so within one iteration there are at most as many
+# distinct contexts as (tally, chosen candidate) pairs. The cache computes
+# each context once and hands the same arrays to every elector facing it,
+# which therefore must treat them as read-only.
+#-----------------------------------------------------------------------------#
+
+import Pivotality
+import Skellam
+import numpy as np
+from PhaseTimers import PhaseTimers
+
+class PivotalityCache(object):
+
+    #overload of class constructor, that initializes cache-owned variables
+    def __init__(self, backend="bessel", approxThreshold=None, kernel="numpy"):
+        self.contexts = {}
+        self.logContexts = {}
+        self.nHits = 0
+        self.nMisses = 0
+        self.backend = backend
+        self.approxThreshold = approxThreshold
+        self.exactPairCounts = None
+        self.approxPairCounts = None
+        self.tailPairCounts = None
+        self.maxApproxError = 0.0
+        self.kernel = kernel
+        self.pivotalitiesFunction = Pivotality.calcPivotalities
+        if kernel == "numba":
+            import NumbaKernels
+            self.pivotalitiesFunction = NumbaKernels.calcPivotalities
+        self.timers = PhaseTimers()
+
+    #forget the contexts of the previous iteration, so the cache never grows
+    #beyond what a single iteration needs:
+    def newIteration(self):
+        self.contexts.clear()
+        self.logContexts.clear()
+
+    #give tieProbs, pivotalityProbs, winnerProbs and pivotalities for the
+    #given othersVotes, computing them only the first time they are asked for:
+    def getContext(self, othersVotes):
+        key = tuple(othersVotes)
+        context = self.contexts.get(key)
+        if context is None:
+            self.nMisses += 1
+            self.recordRegimes(othersVotes)
+            startTime = self.timers.start()
+            tieProbs, pivotalityProbs, winnerProbs =                          \
+                Pivotality.calcProbabilityMatrices(othersVotes, self.backend, \
+                                                   self.approxThreshold)
+            self.timers.stop("probabilities", startTime)
+            startTime = self.timers.start()
+            pivotalities = self.pivotalitiesFunction(winnerProbs,             \
+                                                     pivotalityProbs)
+            self.timers.stop("pivotalities", startTime)
+            context = (tieProbs, pivotalityProbs, winnerProbs, pivotalities)
+            self.contexts[key] = context
+        else:
+            self.nHits += 1
+        return context
+
+    #give only the pivotalities for the given othersVotes:
+    def getPivotalities(self, othersVotes):
+        return self.getContext(othersVotes)[3]
+
+    #same as getContext, in log space:
+    def getLogContext(self, othersVotes):
+        key = tuple(othersVotes)
+        context = self.logContexts.get(key)
+        if context is None:
+            self.nMisses += 1
+            startTime = self.timers.start()
+            logTieProbs, logPivotalityProbs, logWinnerProbs, tailPairs =      \
+                Pivotality.calcLogProbabilityMatrices(othersVotes,            \
+                                                      self.approxThreshold,   \
+                                                      withTailPairs=True)
+            self.timers.stop("probabilities", startTime)
+            self.recordRegimes(othersVotes, logSpace=True, tailPairs=tailPairs)
+            startTime = self.timers.start()
+            logPivotalities = Pivotality.calcLogPivotalities(logWinnerProbs,  \
+                                                             logPivotalityProbs)
+            self.timers.stop("pivotalities", startTime)
+            context = (logTieProbs, logPivotalityProbs, logWinnerProbs,       \
+                       logPivotalities)
+            self.logContexts[key] = context
+        else:
+            self.nHits += 1
+        return context
+
+    #give only the log pivotalities for the given othersVotes:
+    def getLogPivotalities(self, othersVotes):
+        return self.getLogContext(othersVotes)[3]
+
+    #add the regime each pair of candidates uses for othersVotes to the counts
+    #and keep track of the largest estimated approximation error (with
+    #logSpace, the saddle point tails of the exact regime count too, given as
+    #tailPairs by the log probability matrices so that chndtr is not
+    #evaluated again):
+    def recordRegimes(self, othersVotes, logSpace=False, tailPairs=None):
+        nCandidates = len(othersVotes)
+        self.timers.count("skellamEvaluations", nCandidates * (nCandidates - 1))
+        if self.exactPairCounts is None:
+            self.exactPairCounts = np.zeros([nCandidates,nCandidates], dtype=int)
+            self.approxPairCounts = np.zeros([nCandidates,nCandidates], dtype=int)
+            self.tailPairCounts = np.zeros([nCandidates,nCandidates], dtype=int)
+        ratesA, ratesB = Skellam.rateMatrices(othersVotes)
+        approximated = Skellam.approximatedPairs(ratesA, ratesB,              \
+                                                 self.approxThreshold)
+        offDiagonal = ~np.eye(nCandidates, dtype=bool)
+        self.exactPairCounts += ~approximated & offDiagonal
+        self.approxPairCounts += approximated & offDiagonal
+        if logSpace and tailPairs is None:
+            tailPairs = Skellam.tailApproximatedPairs(ratesA, ratesB,         \
+                                                      self.approxThreshold)
+        if logSpace:
+            self.tailPairCounts += tailPairs & offDiagonal
+        if self.approxThreshold is not None or logSpace:
+            errors = Skellam.approximationErrors(ratesA, ratesB,              \
+                                                 self.approxThreshold,        \
+                                                 logSpace, tailPairs)
+            self.maxApproxError = max(self.maxApproxError, float(np.max(errors)))
+
+    #give the regimes used so far, as a dictionary of plain values:
+    def regimeReport(self):
+        report = {"approxThreshold": self.approxThreshold,                    \
+                  "maxApproxError": self.maxApproxError,                      \
+                  "exactPairCounts": None, "approxPairCounts": None,          \
+                  "tailPairCounts": None}
+        if self.exactPairCounts is not None:
+            report["exactPairCounts"] = self.exactPairCounts.tolist()
+            report["approxPairCounts"] = self.approxPairCounts.tolist()
+            report["tailPairCounts"] = self.tailPairCounts.tolist()
+        return report
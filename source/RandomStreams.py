@@ -0,0 +1,55 @@
+#-----------------------------------------------------------------------------#
+# RandomStreams functions:
+#    Random number streams derived from a root numpy SeedSequence, so that
+#    what any part of a run draws depends only on the root seed and on where
+#    that part sits in the run, never on how many workers there are or in
+#    which order they are scheduled:
+#     - a sweep gives run i the spawn key (i,) of its root seed,
+#     - a replication batch gives replication r the child (r,) of its seed,
+#     - an electorate is drawn in blocks of ELECTOR_BLOCK electors, block b
+#       from the child (b,) of the electorate's seed, so any shard of electors
+#       gets the very same rows the whole electorate would,
+#     - the update schedule of a run draws from the child (SCHEDULE_STREAM,)
+#       of the run's seed, out of the way of the electorate's blocks.
+#-----------------------------------------------------------------------------#
+import numpy as np
+
+#Number of electors drawn from each stream of an electorate:
+ELECTOR_BLOCK = 2**16
+
+#Child of a run's seed the update schedule draws from:
+SCHEDULE_STREAM = 2**32 - 1
+
+#Function that gives the SeedSequence of the given seed (None: fresh entropy,
+#which can be read back from its .entropy) and spawn key:
+def seedSequence(seed=None, spawnKey=()):
+    return np.random.SeedSequence(seed, spawn_key=tuple(spawnKey))
+
+#Function that gives the index-th child of a SeedSequence. Unlike
+#SeedSequence.spawn, it does not depend on how many children were spawned
+#before, so children can be derived independently in any process:
+def childSequence(parentSequence, index):
+    return np.random.SeedSequence(parentSequence.entropy,                     \
+                                  spawn_key=parentSequence.spawn_key + (index,),\
+                                  pool_size=parentSequence.pool_size)
+
+#Function that gives the Generator of the index-th child of a SeedSequence:
+def childGenerator(parentSequence, index):
+    return np.random.default_rng(childSequence(parentSequence, index))
+
+#Function that draws the rows firstRow to lastRow (excluded) of a matrix of
+#nRows rows whose blocks of ELECTOR_BLOCK rows are drawn each from its own
+#child of the sequence. drawBlock(randomState, nBlockRows) draws one block:
+def drawRowBlocks(sequence, nRows, drawBlock, firstRow=0, lastRow=None):
+    if lastRow is None:
+        lastRow = nRows
+    blocks = []
+    firstBlock = firstRow // ELECTOR_BLOCK
+    lastBlock = (lastRow - 1) // ELECTOR_BLOCK
+    for blockID in range(firstBlock, lastBlock + 1):
+        blockStart = blockID * ELECTOR_BLOCK
+        nBlockRows = min(ELECTOR_BLOCK, nRows - blockStart)
+        block = drawBlock(childGenerator(sequence, blockID), nBlockRows)
+        blocks.append(block[max(firstRow - blockStart, 0):                    \
+                            lastRow - blockStart])
+    return np.concatenate(blocks)
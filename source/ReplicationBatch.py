@@ -0,0 +1,244 @@
+#-----------------------------------------------------------------------------#
+# ReplicationBatch-owned Variables:
+#    nReplications: number of independent elections run together
+#    nElectors: number of electors in each replication
+#    nCandidates: number of candidates in each replication
+#    sincereUtilities: (nReplications, nElectors, nCandidates) array with the
+#                      sincere utility each elector assigns to each candidate
+#    strategicUtilities: (nReplications, nElectors, nCandidates) array with
+#                        the strategic utility each elector assigns to each
+#                        candidate
+#    chosenCandidates: (nReplications, nElectors) array with the ID of the
+#                      candidate each elector currently intends to vote for
+#    tallies: (nReplications, nCandidates) array with the vote intentions of
+#             each replication, as counted at the end of its last iteration
+#    lastTallies: same as tallies, one iteration earlier
+#    active: (nReplications,) boolean mask of the replications still running
+#    converged: (nReplications,) boolean mask of the replications whose tally
+#               stopped changing
+#    histories: list with the TallyHistory of each replication
+#    stopReasons: list with the reason each replication stopped for, as
+#                 reported by the main simulation loop ("converged", "cycle"
+#                 or "maxIterations"), None while it runs
+#    nIterations: (nReplications,) array with the last iteration each
+#                 replication ran, as reported by the main simulation loop
+#    maxIterations: number of iterations after which a replication stops even
+#                   if it has not converged
+#    cycleRepeats: as in TallyHistory
+#    logSpace, approxThreshold, utilityLogScales: as in ElectorPopulation, with
+#                                                 one log scale per elector of
+#                                                 every replication
+#    nPrecisionFlags: (nReplications,) array with the number of electors, in
+#                     the last update of each replication, whose two best
+#                     candidates were closer than floating point rounding can
+#                     tell apart
+#
+# A batch runs many small elections at once, replicating the synchronous
+# dynamics only, i.e. runSimulation with updateMode "synchronous", not the
+# default sequential one (in which every elector waits for the switches of the
+# ones before it, so nothing is left to batch). The pivotalities of every
+# (replication, chosen candidate) context are computed as a single stack of
+# Skellam matrices, and only the replications that are still active take part
+# in each iteration, so the ones that stopped early (converged or in a cycle,
+# found by a TallyHistory per replication as in the main loop) stop consuming
+# compute.
+#-----------------------------------------------------------------------------#
+
+import GlobalFuncs
+import Pivotality
+import RandomStreams
+import numpy as np
+from TallyHistory import TallyHistory, CYCLE_REPEATS
+
+class ReplicationBatch(object):
+
+    #overload of class constructor, that initializes batch-owned arrays. Only
+    #the synchronous update mode can be batched:
+    def __init__(self, nReplications, nElectors, nCandidates, logSpace=False, \
+                 approxThreshold=None, maxIterations=100,                     \
+                 updateMode="synchronous", cycleRepeats=CYCLE_REPEATS):
+        if updateMode != "synchronous":
+            raise ValueError("Unknown update mode for a replication batch "   \
+                             + "(only \"synchronous\" is batched, run the "   \
+                             + "others with runSimulation): "                 \
+                             + str(updateMode))
+        self.nReplications = nReplications
+        self.nElectors = nElectors
+        self.nCandidates = nCandidates
+        self.sincereUtilities = np.zeros([nReplications,nElectors,nCandidates])
+        self.strategicUtilities = np.zeros([nReplications,nElectors,nCandidates])
+        self.chosenCandidates = np.zeros([nReplications,nElectors], dtype=int)
+        self.tallies = np.zeros([nReplications,nCandidates], dtype=int)
+        self.lastTallies = np.zeros([nReplications,nCandidates], dtype=int)
+        self.active = np.ones(nReplications, dtype=bool)
+        self.converged = np.zeros(nReplications, dtype=bool)
+        self.nIterations = np.zeros(nReplications, dtype=int)
+        self.maxIterations = maxIterations
+        self.cycleRepeats = cycleRepeats
+        self.histories = [TallyHistory(cycleRepeats)                          \
+                          for replicationID in range(0,nReplications)]
+        self.stopReasons = [None] * nReplications
+        self.logSpace = logSpace
+        self.approxThreshold = approxThreshold
+        self.utilityLogScales = np.zeros([nReplications,nElectors])
+        self.nPrecisionFlags = np.zeros(nReplications, dtype=int)
+
+    #calculate the sincere utilities of all electors of all replications with
+    #a single draw from the global NumPy state, which gives each replication
+    #the rows an ElectorPopulation drawing right after the previous one would
+    #get or, given a SeedSequence, replication r from its child (r,) (see
+    #RandomStreams), i.e. the electorate runSimulation draws with that child:
+    def calcSincereUtilities(self, minPreference, maxPreference, distribution,\
+                             seedSequence=None):
+        if seedSequence is None:
+            utilities = GlobalFuncs.randUtilityMatrix(minPreference,          \
+                                                      maxPreference,          \
+                                                      self.nReplications      \
+                                                      * self.nElectors,       \
+                                                      self.nCandidates,       \
+                                                      distribution)
+        else:
+            utilities = np.concatenate([GlobalFuncs.randUtilityRows(          \
+                minPreference, maxPreference, self.nElectors,                 \
+                self.nCandidates, distribution,                               \
+                RandomStreams.childSequence(seedSequence, replicationID))     \
+                for replicationID in range(0,self.nReplications)])
+        self.sincereUtilities[:] = GlobalFuncs.normalizeUtilities(utilities)  \
+            .reshape(self.sincereUtilities.shape)
+        self.strategicUtilities[:] = self.sincereUtilities
+        self.chosenCandidates[:] = np.argmax(self.sincereUtilities, axis=2)
+        self.tallies[:] = 0
+        self.lastTallies[:] = 0
+        self.active[:] = True
+        self.converged[:] = False
+        self.nIterations[:] = 0
+        self.histories = [TallyHistory(self.cycleRepeats)                     \
+                          for replicationID in range(0,self.nReplications)]
+        self.stopReasons = [None] * self.nReplications
+
+    #find the chosen candidate of every elector of the given replications and
+    #count their tallies, with one bincount over all of them:
+    def countVoteIntentions(self, replicationIDs, iteration):
+        if iteration == 0:
+            utilities = self.sincereUtilities[replicationIDs]
+        else:
+            utilities = self.strategicUtilities[replicationIDs]
+        chosenCandidates = np.argmax(utilities, axis=2)
+        self.chosenCandidates[replicationIDs] = chosenCandidates
+        offsets = np.arange(len(replicationIDs))[:,None] * self.nCandidates
+        self.tallies[replicationIDs] = np.bincount(                           \
+            (chosenCandidates + offsets).ravel(),                             \
+            minlength=len(replicationIDs) * self.nCandidates)                 \
+            .reshape(len(replicationIDs), self.nCandidates)
+        return self.tallies[replicationIDs]
+
+    #give the pivotalities (and their log scales) of every chosen candidate of
+    #the given tallies as a (nTallies, nCandidates, nCandidates, nCandidates)
+    #stack, i.e. one (K, K) matrix per context. Candidates nobody votes for
+    #have no context, and get the one of the whole tally instead:
+    def calcContextPivotalities(self, tallies):
+        nTallies = len(tallies)
+        hasVotes = tallies > 0
+        othersVotes = tallies[:,None,:]                                       \
+                      - np.eye(self.nCandidates, dtype=int) * hasVotes[:,:,None]
+        othersVotes = othersVotes.reshape(-1, self.nCandidates)
+        if self.logSpace:
+            logTieProbs, logPivotalityProbs, logWinnerProbs = Pivotality      \
+                .calcLogProbabilityMatrices(othersVotes, self.approxThreshold)
+            logPivotalities = Pivotality.calcLogPivotalities(logWinnerProbs,  \
+                                                             logPivotalityProbs)
+            logScales = np.max(logPivotalities, axis=(1,2))
+            pivotalities = np.exp(logPivotalities - logScales[:,None,None])
+        else:
+            tieProbs, pivotalityProbs, winnerProbs = Pivotality               \
+                .calcProbabilityMatrices(othersVotes,                         \
+                                         approxThreshold=self.approxThreshold)
+            pivotalities = Pivotality.calcPivotalities(winnerProbs,           \
+                                                       pivotalityProbs)
+            logScales = np.zeros(len(othersVotes))
+        shape = (nTallies, self.nCandidates)
+        return pivotalities.reshape(shape + (self.nCandidates,self.nCandidates)),\
+               logScales.reshape(shape)
+
+    #update the strategic utilities of every active replication at once,
+    #going context by context, i.e. by (replication, chosen candidate) group
+    #of electors, each applying its (K, K) pivotalities with a single matrix
+    #product as ElectorPopulation.updateBlock does, so no step holds more
+    #than one matrix per context (the electors are sorted by context once):
+    def calculateStrategicUtilities(self, MIN_UTIL, iteration):
+        replicationIDs = np.flatnonzero(self.active)
+        self.countVoteIntentions(replicationIDs, iteration)
+        pivotalities, logScales = self.calcContextPivotalities(               \
+            self.tallies[replicationIDs])
+        sincereUtilities = self.sincereUtilities[replicationIDs]
+        if iteration == 0:
+            previousUtilities = sincereUtilities
+        elif self.logSpace:
+            previousUtilities = self.strategicUtilities[replicationIDs]       \
+                * np.exp(self.utilityLogScales[replicationIDs])[:,:,None]
+        else:
+            previousUtilities = self.strategicUtilities[replicationIDs]
+        chosenCandidates = self.chosenCandidates[replicationIDs]
+        nRows = len(replicationIDs) * self.nElectors
+        sincereUtilities = sincereUtilities.reshape(nRows, self.nCandidates)
+        previousUtilities = previousUtilities.reshape(nRows, self.nCandidates)
+        contextIDs = (np.arange(len(replicationIDs))[:,None] * self.nCandidates\
+                      + chosenCandidates).ravel()
+        order = np.argsort(contextIDs, kind="stable")
+        sortedIDs = contextIDs[order]
+        starts = np.flatnonzero(np.r_[True, sortedIDs[1:] != sortedIDs[:-1]])
+        ends = np.r_[starts[1:], nRows]
+        newUtilities = np.zeros(sincereUtilities.shape)
+        newLogScales = np.zeros(nRows)
+        precisionFlags = np.zeros(nRows, dtype=bool)
+        for start, end in zip(starts, ends):
+            rows = order[start:end]
+            row, chosenID = divmod(int(sortedIDs[start]), self.nCandidates)
+            contextPivotalities = pivotalities[row,chosenID]
+            electorSincere = sincereUtilities[rows]
+            ownTerms, sincereTerms = Pivotality.calcUtilityTerms(             \
+                previousUtilities[rows], electorSincere, contextPivotalities)
+            utilities = ownTerms - sincereTerms
+            leastCandidates = np.argmin(electorSincere, axis=1)
+            utilities[np.arange(len(utilities)), leastCandidates] = MIN_UTIL
+            precisionFlags[rows] = Pivotality.precisionLossFlags(             \
+                contextPivotalities, utilities, ownTerms, sincereTerms)
+            newUtilities[rows] = utilities
+            newLogScales[rows] = logScales[row,chosenID]
+        shape = (len(replicationIDs), self.nElectors)
+        self.strategicUtilities[replicationIDs] = newUtilities.reshape(       \
+            shape + (self.nCandidates,))
+        self.utilityLogScales[replicationIDs] = newLogScales.reshape(shape)
+        self.nPrecisionFlags[replicationIDs] = np.sum(                        \
+            precisionFlags.reshape(shape), axis=1)
+        return self.strategicUtilities
+
+    #run one iteration of every active replication, as one pass of the main
+    #simulation loop does, and retire the ones that stopped (by the stop
+    #rules of the main loop, i.e. their TallyHistory) or reached
+    #maxIterations:
+    def iterate(self, MIN_UTIL, iteration):
+        replicationIDs = np.flatnonzero(self.active)
+        self.lastTallies[replicationIDs] = self.tallies[replicationIDs]
+        self.calculateStrategicUtilities(MIN_UTIL, iteration)
+        self.countVoteIntentions(replicationIDs, iteration)
+        self.nIterations[replicationIDs] = iteration
+        for replicationID in replicationIDs:
+            stopReason = self.histories[replicationID].record(                \
+                iteration, self.tallies[replicationID])
+            if stopReason is None and iteration + 1 >= self.maxIterations:
+                stopReason = "maxIterations"
+            if stopReason is not None:
+                self.stopReasons[replicationID] = stopReason
+                self.converged[replicationID] = stopReason == "converged"
+                self.active[replicationID] = False
+        return self.active
+
+    #run every replication until it converges or reaches maxIterations, and
+    #give the final tally and the iteration count of each of them:
+    def run(self, MIN_UTIL):
+        iteration = 0
+        while np.any(self.active):
+            self.iterate(MIN_UTIL, iteration)
+            iteration += 1
+        return self.tallies, self.nIterations
@@ -0,0 +1,130 @@
+#-----------------------------------------------------------------------------#
+# RunProfiler functions:
+#    Runs a function (a whole simulation, see Cox1994Model.runSimulation)
+#    under cProfile and tracemalloc, and writes next to its results, with the
+#    given path prefix:
+#     - prefix + ".pstats": the raw cProfile statistics, for pstats or any
+#       viewer that reads them;
+#     - prefix + ".profile.txt": the functions with the most cumulative time,
+#       then the ones with the most time of their own (N_FUNCTIONS each);
+#     - prefix + ".memory.txt": the memory traced at the peak of the run, then
+#       the lines holding the most memory at each snapshot the run took with
+#       keepSnapshot (N_ALLOCATIONS of them), and the lines whose memory grew
+#       the most from each snapshot to the next. The simulation keeps one
+#       after the setup (where the population arrays and anything allocated
+#       per elector show up) and one after the main loop (so the growth shows
+#       what the iterations left behind, e.g. the contexts of the
+#       PivotalityCache). Temporaries freed within an iteration only count
+#       towards the peak.
+#
+#    Profiling slows a run down several times (tracemalloc the most), so it
+#    is only done on demand: a run is profiled when its config has a
+#    profilePath, and a sweep only profiles one run in every profileEvery (see
+#    isSampled and SweepRunner.runSweep).
+#
+#    cProfile only sees the thread it runs in and tracemalloc only the process
+#    it runs in, so with nThreads > 1 the work of the worker threads shows up
+#    as the time the main thread waits for them, and with nShards > 1 the
+#    memory of the shards is not traced (only their shared arrays, which the
+#    parent allocates).
+#-----------------------------------------------------------------------------#
+import cProfile
+import pstats
+import tracemalloc
+
+#Number of functions listed by each ordering of the profile report:
+N_FUNCTIONS = 30
+
+#Number of allocation sites listed by each part of the memory report:
+N_ALLOCATIONS = 20
+
+#Frames of each allocation kept by tracemalloc (1: the line that allocated):
+N_FRAMES = 1
+
+#Allocations of the profiling machinery itself, left out of the report:
+IGNORED_FILES = [tracemalloc.__file__, pstats.__file__, __file__,            \
+                 "<frozen *>", "<unknown>"]
+
+#Snapshots kept by the run being profiled, as (label, snapshot) pairs, empty
+#when no run is (runs are profiled one at a time in each process):
+SNAPSHOTS = []
+
+#Function that tells whether the run at the given position of a sweep is
+#profiled, when one run in every profileEvery is (None: no run is):
+def isSampled(runID, profileEvery):
+    return profileEvery is not None and runID % profileEvery == 0
+
+#Function that keeps a snapshot of the memory held at this point of the run
+#being profiled, under the given label (does nothing if none is):
+def keepSnapshot(label):
+    if len(SNAPSHOTS) > 0:
+        SNAPSHOTS.append((label, tracemalloc.take_snapshot()))
+
+#Function that runs function(*arguments) under cProfile and tracemalloc,
+#writes the reports with the given path prefix and gives what the function
+#gave. The reports are written even if the function raises:
+def profileCall(reportPrefix, function, *arguments):
+    wasTracing = tracemalloc.is_tracing()
+    if not wasTracing:
+        tracemalloc.start(N_FRAMES)
+    tracemalloc.reset_peak()
+    del SNAPSHOTS[:]
+    SNAPSHOTS.append(("start", tracemalloc.take_snapshot()))
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return function(*arguments)
+    finally:
+        profiler.disable()
+        peakMemory = tracemalloc.get_traced_memory()[1]
+        snapshots = list(SNAPSHOTS)
+        del SNAPSHOTS[:]
+        if not wasTracing:
+            tracemalloc.stop()
+        profiler.dump_stats(reportPrefix + ".pstats")
+        writeProfileReport(reportPrefix + ".profile.txt", profiler)
+        writeMemoryReport(reportPrefix + ".memory.txt", snapshots, peakMemory)
+
+#Function that writes the functions that took the most time, by cumulative
+#time and by time of their own:
+def writeProfileReport(reportPath, profiler):
+    with open(reportPath, "w") as reportFile:
+        stats = pstats.Stats(profiler, stream=reportFile)
+        stats.strip_dirs()
+        for sortKey in ["cumulative", "tottime"]:
+            reportFile.write("Top " + str(N_FUNCTIONS) + " functions by "     \
+                             + sortKey + " time:\n")
+            stats.sort_stats(sortKey).print_stats(N_FUNCTIONS)
+
+#Function that writes the peak memory and, for every snapshot after the first
+#one, the lines holding the most memory and the ones that grew the most since
+#the previous snapshot:
+def writeMemoryReport(reportPath, snapshots, peakMemory):
+    filters = [tracemalloc.Filter(False, fileName)                            \
+               for fileName in IGNORED_FILES]
+    snapshots = [(label, snapshot.filter_traces(filters))                     \
+                 for label, snapshot in snapshots]
+    with open(reportPath, "w") as reportFile:
+        reportFile.write("Traced memory at the peak: "                        \
+                         + formatSize(peakMemory) + "\n")
+        for snapshotID in range(1, len(snapshots)):
+            label, snapshot = snapshots[snapshotID]
+            lastLabel, lastSnapshot = snapshots[snapshotID - 1]
+            reportFile.write("\nTop " + str(N_ALLOCATIONS) + " lines by "     \
+                             + "memory held after " + label + ":\n")
+            for statistic in snapshot.statistics("lineno")[:N_ALLOCATIONS]:
+                reportFile.write(str(statistic) + "\n")
+            reportFile.write("\nTop " + str(N_ALLOCATIONS) + " lines by "     \
+                             + "memory grown from " + lastLabel + " to "      \
+                             + label + ":\n")
+            differences = snapshot.compare_to(lastSnapshot, "lineno")
+            for statistic in differences[:N_ALLOCATIONS]:
+                reportFile.write(str(statistic) + "\n")
+
+#Function that gives a number of bytes as a readable size:
+def formatSize(nBytes):
+    for unit in ["B", "KiB", "MiB"]:
+        if abs(nBytes) < 1024:
+            return "%.1f %s" % (nBytes, unit)
+        nBytes /= 1024.0
+    return "%.1f GiB" % nBytes
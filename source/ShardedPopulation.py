@@ -0,0 +1,114 @@
+#-----------------------------------------------------------------------------#
+# ShardedPopulation-owned Variables (besides those of ElectorPopulation):
+#    nShards: number of shards, i.e. of worker processes
+#    shardBounds: (nShards + 1,) array with the first elector of each shard
+#                 (and nElectors at the end)
+#    sharedMemories: dictionary from array name to the SharedMemory block
+#                    holding it
+#    pool: multiprocessing pool whose workers update the shards
+#
+# A ShardedPopulation is an ElectorPopulation whose arrays live in
+# multiprocessing.shared_memory blocks, split into contiguous shards of
+# electors. Every worker process maps the same blocks, so the parent only
+# sends each shard the few pivotality matrices of the iteration and gets back
+# its per-candidate tally; the utility arrays themselves are never pickled.
+#
+# Only the synchronous updates are split among the shards: in the sequential
+# ones every run of electors waits for the switches before it, so the parent
+# updates them itself, run by run, straight into the shared arrays (only the
+# draw and the count of the tallies are then sharded, and a sequential run is
+# no faster than a serial one). Each elector's new utilities depend only on
+# its own row and on the pivotalities of its context, so every update mode
+# gives exactly the tallies of a serial ElectorPopulation. The legacy draw
+# from the global NumPy state (no SeedSequence) is done by the parent, straight
+# into the shared arrays. Call close() when done, which stops the workers and
+# frees the shared memory.
+#-----------------------------------------------------------------------------#
+
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from ElectorPopulation import ElectorPopulation
+
+#Arrays of the population held in shared memory, with whether they have a
+#column per candidate (their dtype is that of the base population's arrays,
+#see ElectorPopulation.PRECISIONS):
+SHARED_ARRAYS = {
+    "sincereUtilities": True,
+    "strategicUtilities": True,
+    "utilityLogScales": False,
+    "chosenCandidates": False,
+}
+
+#Shared arrays mapped by this worker process, by name:
+workerArrays = {}
+workerMemories = []
+
+#Function run when a worker process starts, mapping the shared arrays given
+#as name -> (shared memory name, shape, dtype):
+def attachSharedArrays(arraySpecs):
+    for arrayName in arraySpecs:
+        memoryName, shape, dtype = arraySpecs[arrayName]
+        memory = shared_memory.SharedMemory(name=memoryName)
+        workerMemories.append(memory)
+        workerArrays[arrayName] = np.ndarray(shape, dtype=dtype,              \
+                                             buffer=memory.buf)
+
+#Function run by the workers for every shard, applying a block function of
+#ElectorPopulation to the shared arrays this worker mapped:
+def applyToWorkerArrays(blockFunction, bounds, blockArguments):
+    return blockFunction(workerArrays, bounds, *blockArguments)
+
+class ShardedPopulation(ElectorPopulation):
+
+    #overload of class constructor, that allocates the population arrays in
+    #shared memory and starts one worker process per shard
+    def __init__(self, nElectors, nCandidates, nShards, logSpace=False,       \
+                 approxThreshold=None, kernel="numpy", precision="float64"):
+        #the base arrays are allocated empty and replaced by shared ones:
+        ElectorPopulation.__init__(self, 0, nCandidates, logSpace,            \
+                                   approxThreshold, kernel, precision)
+        self.nElectors = nElectors
+        self.nShards = nShards
+        self.shardBounds = np.linspace(0, nElectors, nShards + 1).astype(int)
+        self.sharedMemories = {}
+        arraySpecs = {}
+        for arrayName in SHARED_ARRAYS:
+            dtype = getattr(self, arrayName).dtype
+            perCandidate = SHARED_ARRAYS[arrayName]
+            shape = (nElectors, nCandidates) if perCandidate else (nElectors,)
+            nBytes = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+            memory = shared_memory.SharedMemory(create=True, size=nBytes)
+            self.sharedMemories[arrayName] = memory
+            array = np.ndarray(shape, dtype=dtype, buffer=memory.buf)
+            array[:] = 0
+            setattr(self, arrayName, array)
+            arraySpecs[arrayName] = (memory.name, shape, dtype)
+        self.pool = multiprocessing.Pool(nShards, initializer=attachSharedArrays,\
+                                         initargs=(arraySpecs,))
+
+    #give the (first, last + 1) elector of every shard:
+    def blocks(self):
+        return [(int(self.shardBounds[shardID]),                              \
+                 int(self.shardBounds[shardID + 1]))                          \
+                for shardID in range(0,self.nShards)]
+
+    #apply a block function to every shard in the worker processes, sending
+    #them only the function, the bounds and the (small) arguments:
+    def mapBlocks(self, blockFunction, blockArguments, blockBounds=None):
+        if blockBounds is None:
+            blockBounds = self.blocks()
+        return self.pool.starmap(applyToWorkerArrays,                         \
+                                 [(blockFunction, bounds, blockArguments)     \
+                                  for bounds in blockBounds])
+
+    #stop the workers and free the shared memory. The arrays are copied out
+    #first, so the population can still be read afterwards:
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        for arrayName in self.sharedMemories:
+            setattr(self, arrayName, np.array(getattr(self, arrayName)))
+            self.sharedMemories[arrayName].close()
+            self.sharedMemories[arrayName].unlink()
+        self.sharedMemories = {}
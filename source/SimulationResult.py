@@ -0,0 +1,71 @@
+#-----------------------------------------------------------------------------#
+# SimulationResult-owned Variables:
+#    config: complete configuration the simulation ran with (defaults filled)
+#    seed: root seed (SeedSequence entropy) of the run's random streams
+#    firstTallies: vote intentions towards each candidate after iteration 0,
+#                  i.e. the sincere vote
+#    tallies: vote intentions towards each candidate when the loop stopped
+#    nIterations: number of iterations until the loop stopped, as printed by
+#                 the main simulation loop
+#    converged: whether the loop stopped because the tally stopped changing
+#               or a tolerance criterion was met
+#    stopReason: why the loop stopped: "converged", "cycle" (the tallies
+#                repeat with a period longer than one), "maxIterations" or
+#                the tolerance criterion that fired (see
+#                ConvergenceCriteria.CONVERGENCE_CRITERIA)
+#    cyclePeriod: period of the tallies the loop stopped on (1 if converged,
+#                 None if it reached maxIterations)
+#    cycleStates: tallies of one period of that cycle
+#    convergenceMeasures: value of every tolerance criterion in use at the
+#                         last iteration
+#    choiceDifferences: number of electors, after each iteration, whose
+#                       choice differs from that of a float64 run of the
+#                       same electorate (None unless a compact precision was
+#                       run with precisionReference)
+#    nPrecisionFlags: number of electors, in the last iteration, whose choice
+#                     float precision could not determine
+#    regimes: Skellam regimes used by each pair of candidates (see
+#             PivotalityCache.regimeReport)
+#    timings: dictionary with the seconds spent in "setup" (drawing the
+#             electorate), "iterations" (the main loop) and "total"
+#    phaseTimings: seconds per phase and counters, in total and for every
+#                  iteration (see PhaseTimers; None unless config["instrument"])
+#-----------------------------------------------------------------------------#
+
+class SimulationResult(object):
+
+    #overload of class constructor, that stores everything a run produced
+    def __init__(self, config, seed, firstTallies, tallies, nIterations,      \
+                 converged, stopReason, cyclePeriod, cycleStates,             \
+                 convergenceMeasures, choiceDifferences,                      \
+                 nPrecisionFlags, regimes, timings, phaseTimings=None):
+        self.config = config
+        self.seed = seed
+        self.firstTallies = firstTallies
+        self.tallies = tallies
+        self.nIterations = nIterations
+        self.converged = converged
+        self.stopReason = stopReason
+        self.cyclePeriod = cyclePeriod
+        self.cycleStates = cycleStates
+        self.convergenceMeasures = convergenceMeasures
+        self.choiceDifferences = choiceDifferences
+        self.nPrecisionFlags = nPrecisionFlags
+        self.regimes = regimes
+        self.timings = timings
+        self.phaseTimings = phaseTimings
+
+    #give the result as a dictionary of plain values, e.g. to write it as JSON:
+    def asDict(self):
+        return {"config": dict(self.config), "seed": self.seed,               \
+                "firstTallies": list(self.firstTallies),                      \
+                "tallies": list(self.tallies),                                \
+                "nIterations": self.nIterations, "converged": self.converged, \
+                "stopReason": self.stopReason,                                \
+                "cyclePeriod": self.cyclePeriod,                              \
+                "cycleStates": self.cycleStates,                              \
+                "convergenceMeasures": dict(self.convergenceMeasures),        \
+                "choiceDifferences": self.choiceDifferences,                  \
+                "nPrecisionFlags": self.nPrecisionFlags,                      \
+                "regimes": self.regimes, "timings": dict(self.timings),       \
+                "phaseTimings": self.phaseTimings}
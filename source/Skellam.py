@@ -0,0 +1,368 @@
+#-----------------------------------------------------------------------------#
+# Skellam functions:
+#    Batched evaluation of the Skellam terms used by the pivotality
+#    computations, i.e. for X = A - B with A ~ Poisson(ratesA) and
+#    B ~ Poisson(ratesB):
+#        tie:    P(X = 0)
+#        pivot:  P(X = -1)
+#        winner: P(X >= 0) = 1 - P(X <= -1)
+#    for whole arrays of rate pairs, e.g. (K, K) or (B, K, K), in one call.
+#
+#    The pmf is written with exponentially scaled modified Bessel functions,
+#        P(X = k) = exp(-(sqrt(a) - sqrt(b))^2) (a/b)^(k/2) ive(|k|, 2 sqrt(ab))
+#    which neither overflows nor underflows for large rates the way the
+#    unscaled exp(-(a+b)) I_k(2 sqrt(ab)) does. The tail goes straight to the
+#    noncentral chi-square CDF ufunc (chndtr), which is what
+#    scipy.stats.skellam.cdf calls internally for negative arguments.
+#
+#    Agreement with scipy.stats.skellam, checked over rates in [1e-100, 1e6]:
+#    winner is identical; tie and pivot are within a relative error of 1e-12
+#    wherever SciPy gives more than 1e-30. Below that SciPy itself drifts (by
+#    up to 50% near 1e-150), while the Bessel form stays within 1e-12 of a
+#    50-digit mpmath evaluation. Rates must be strictly positive.
+#
+#    Given an approxThreshold, pairs whose two rates are both at least that
+#    large use the saddle point regime instead: the large argument expansion
+#    of ive for the pmf and the Lugannani-Rice formula for the tail. There
+#    chndtr is both the slow part and the fragile one (in the tails it is off
+#    by 20% at 1e-13 for rates around 4e4, where the saddle point agrees with
+#    an exact Poisson convolution to 1e-8).
+#
+#    The log-space winner is not exact everywhere in the exact regime either:
+#    below DEEP_TAIL, 1 - chndtr has lost too many digits, and the pairs with
+#    ratesB <= 4 ratesA (which only get there with both rates above about 18)
+#    use the Lugannani-Rice tail whatever the threshold. Its relative error is
+#    below SADDLEPOINT_ERROR_FACTOR / (2 sqrt(ab)), e.g. about 2.5e-4 at
+#    (40, 150) and 1e-4 at (100, 300); tailApproximatedPairs tells which pairs
+#    these are, and approximationErrors counts them with that estimate when
+#    asked for the log-space errors. The estimate holds for nearly equal rates
+#    too (within 3% of it against exact Poisson convolutions up to 1e8), as
+#    logTailSaddlepoint is written without the cancellation of 1/u - 1/w.
+#
+#    scipy.special is only imported by the functions calling it, as importing
+#    it takes about a quarter second, most of the import of Cox1994Model.
+#-----------------------------------------------------------------------------#
+import numpy as np
+
+#Vote counts of zero are replaced by this value, since the Skellam distribution
+#is only defined for strictly positive rates:
+MIN_RATE = 10**-100
+
+#Winner probabilities below this value have lost too many digits in
+#1 - chndtr to be used in log space, so they come from the deep tail
+#formulas below instead:
+DEEP_TAIL = 10**-8
+#Number of terms of the series used for the deep tail of lopsided pairs:
+TAIL_SERIES_TERMS = 48
+#Bound on the relative error of the Lugannani-Rice tail, times 2 sqrt(ab),
+#measured against exact evaluations for rates from 30 to 1000 (the largest
+#value found was 0.038):
+SADDLEPOINT_ERROR_FACTOR = 0.05
+
+#Function that turns vote counts (..., K) into the (..., K, K) rates of all
+#ordered pairs of candidates, the row candidate being A and the column one B:
+def rateMatrices(othersVotes):
+    rates = np.asarray(othersVotes, dtype=float)
+    rates = np.where(rates == 0, MIN_RATE, rates)
+    return rates[...,:,None], rates[...,None,:]
+
+#Function that tells which pairs of rates use the saddle point regime:
+def approximatedPairs(ratesA, ratesB, approxThreshold):
+    ratesA, ratesB = np.broadcast_arrays(ratesA, ratesB)
+    if approxThreshold is None:
+        return np.zeros(ratesA.shape, dtype=bool)
+    return np.minimum(ratesA, ratesB) >= approxThreshold
+
+#Function that evaluates exactFunc on the pairs of rates below the threshold
+#and approxFunc on the rest, each on its own pairs only:
+def byRegime(exactFunc, approxFunc, ratesA, ratesB, approxThreshold):
+    ratesA, ratesB = np.broadcast_arrays(np.asarray(ratesA, dtype=float),     \
+                                         np.asarray(ratesB, dtype=float))
+    if approxThreshold is None:
+        return exactFunc(ratesA, ratesB)
+    approximated = approximatedPairs(ratesA, ratesB, approxThreshold)
+    exact = ~approximated
+    values = np.empty(ratesA.shape)
+    values[exact] = exactFunc(ratesA[exact], ratesB[exact])
+    values[approximated] = approxFunc(ratesA[approximated],                   \
+                                      ratesB[approximated])
+    return values
+
+#P(X = 0) for every pair of rates:
+def tieProbs(ratesA, ratesB, approxThreshold=None):
+    return byRegime(besselTieProbs, saddlepointTieProbs, ratesA, ratesB,      \
+                    approxThreshold)
+
+#P(X = -1) for every pair of rates:
+def pivotProbs(ratesA, ratesB, approxThreshold=None):
+    return byRegime(besselPivotProbs, saddlepointPivotProbs, ratesA, ratesB,  \
+                    approxThreshold)
+
+#P(X >= 0) for every pair of rates:
+def winnerProbs(ratesA, ratesB, approxThreshold=None):
+    return byRegime(chndtrWinnerProbs, saddlepointWinnerProbs, ratesA, ratesB,\
+                    approxThreshold)
+
+#Function that gives tieProbs, pivotalityProbs and winnerProbs of all ordered
+#pairs of candidates for vote counts (..., K), with ones on the diagonal as
+#Pivotality.calcProbabilityMatrices:
+def probabilityMatrices(othersVotes, approxThreshold=None):
+    ratesA, ratesB = rateMatrices(othersVotes)
+    diagonal = np.arange(ratesA.shape[-2])
+    matrices = (tieProbs(ratesA, ratesB, approxThreshold),                    \
+                pivotProbs(ratesA, ratesB, approxThreshold),                  \
+                winnerProbs(ratesA, ratesB, approxThreshold))
+    for matrix in matrices:
+        matrix[...,diagonal,diagonal] = 1
+    return matrices
+
+#Function that tells which pairs of rates of the exact regime get their
+#log-space winner from the Lugannani-Rice tail (see chndtrLogWinnerProbs):
+def tailApproximatedPairs(ratesA, ratesB, approxThreshold):
+    ratesA, ratesB = np.broadcast_arrays(np.asarray(ratesA, dtype=float),     \
+                                         np.asarray(ratesB, dtype=float))
+    exact = ~approximatedPairs(ratesA, ratesB, approxThreshold)
+    tailPairs = np.zeros(ratesA.shape, dtype=bool)
+    tailPairs[exact] = balancedDeepTail(ratesA[exact], ratesB[exact],         \
+                                        chndtrWinnerProbs(ratesA[exact],      \
+                                                          ratesB[exact]))
+    return tailPairs
+
+#Function that gives the estimated relative error of the approximated pairs
+#of rates (zero for the exact ones), the largest of the pmf and tail errors.
+#With logSpace, the pairs of the exact regime whose log-space winner comes
+#from the Lugannani-Rice tail get the error of that tail (those of
+#tailApproximatedPairs, unless already known from logWinnerProbs):
+def approximationErrors(ratesA, ratesB, approxThreshold, logSpace=False,      \
+                        tailPairs=None):
+    ratesA, ratesB = np.broadcast_arrays(np.asarray(ratesA, dtype=float),     \
+                                         np.asarray(ratesB, dtype=float))
+    approximated = approximatedPairs(ratesA, ratesB, approxThreshold)
+    errors = np.zeros(ratesA.shape)
+    sqrtA = np.sqrt(ratesA[approximated])
+    sqrtB = np.sqrt(ratesB[approximated])
+    besselArg = 2 * sqrtA * sqrtB
+    pmfErrors = np.maximum(iveAsymptotic(0, besselArg)[1],                    \
+                           iveAsymptotic(1, besselArg)[1])
+    tailErrors = SADDLEPOINT_ERROR_FACTOR / besselArg
+    errors[approximated] = np.maximum(pmfErrors, tailErrors)
+    if logSpace:
+        if tailPairs is None:
+            tailPairs = tailApproximatedPairs(ratesA, ratesB, approxThreshold)
+        errors[tailPairs] = SADDLEPOINT_ERROR_FACTOR                          \
+            / (2 * np.sqrt(ratesA[tailPairs] * ratesB[tailPairs]))
+    return errors
+
+
+#-----------------------------------------------------------------------------#
+# Exact regime.
+#-----------------------------------------------------------------------------#
+
+#P(X = 0) through ive:
+def besselTieProbs(ratesA, ratesB):
+    from scipy import special
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return np.exp(-(sqrtA - sqrtB)**2) * special.ive(0, 2 * sqrtA * sqrtB)
+
+#P(X = -1) through ive:
+def besselPivotProbs(ratesA, ratesB):
+    from scipy import special
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return np.exp(-(sqrtA - sqrtB)**2) * (sqrtB / sqrtA)                      \
+           * special.ive(1, 2 * sqrtA * sqrtB)
+
+#P(X >= 0) through chndtr:
+def chndtrWinnerProbs(ratesA, ratesB):
+    from scipy import special
+    return 1 - special.chndtr(2 * ratesB, 2, 2 * ratesA)
+
+
+#-----------------------------------------------------------------------------#
+# Saddle point regime, for pairs of large rates.
+#-----------------------------------------------------------------------------#
+
+#Large argument expansion of ive(order, x) up to its third term, together
+#with the relative size of the first term left out as an error estimate:
+def iveAsymptotic(order, besselArg):
+    mu = 4.0 * order**2
+    z = 8.0 * besselArg
+    term1 = (mu - 1) / z
+    term2 = term1 * (mu - 9) / (2 * z)
+    term3 = term2 * (mu - 25) / (3 * z)
+    term4 = term3 * (mu - 49) / (4 * z)
+    return (1 - term1 + term2 - term3) / np.sqrt(2 * np.pi * besselArg),      \
+           np.abs(term4)
+
+#P(X = 0) through the expansion of ive:
+def saddlepointTieProbs(ratesA, ratesB):
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return np.exp(-(sqrtA - sqrtB)**2)                                        \
+           * iveAsymptotic(0, 2 * sqrtA * sqrtB)[0]
+
+#P(X = -1) through the expansion of ive:
+def saddlepointPivotProbs(ratesA, ratesB):
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return np.exp(-(sqrtA - sqrtB)**2) * (sqrtB / sqrtA)                      \
+           * iveAsymptotic(1, 2 * sqrtA * sqrtB)[0]
+
+#P(X >= 0) through the Lugannani-Rice formula, which holds for ratesA <
+#ratesB. The other side uses P(X >= 0) = 1 - P(-X >= 0) + P(X = 0), and equal
+#rates the symmetry P(X >= 0) = (1 + P(X = 0)) / 2:
+def saddlepointWinnerProbs(ratesA, ratesB):
+    probs = np.empty(ratesA.shape)
+    below = ratesA < ratesB
+    above = ratesA > ratesB
+    equal = ~below & ~above
+    probs[below] = np.exp(logTailSaddlepoint(ratesA[below], ratesB[below]))
+    probs[above] = 1 - np.exp(logTailSaddlepoint(ratesB[above],ratesA[above]))\
+                   + saddlepointTieProbs(ratesA[above], ratesB[above])
+    probs[equal] = (1 + saddlepointTieProbs(ratesA[equal], ratesB[equal])) / 2
+    return probs
+
+#log P(X >= 0) by the Lugannani-Rice saddle point approximation (with the
+#continuity correction for lattice variables), for ratesA < ratesB. The
+#saddle point of the Skellam cumulant generating function is exp(t) =
+#sqrt(ratesB / ratesA), so everything has a closed form. The formula's
+#millsRatio - 1/w + 1/u cancels catastrophically for nearly equal rates,
+#where both 1/w and 1/u blow up (a relative error of 1e-4 at (1e8, 1e8 + 1)),
+#so it is taken as millsRatio + (sqrt(sqrtB / sqrtA) - 1) / w, a sum of two
+#positive terms, with the square root through expm1/log1p and sqrtB - sqrtA
+#as (ratesB - ratesA) / (sqrtA + sqrtB). Rounding then stays within a few
+#ulps for any w, and the error is that of the approximation itself (see
+#SADDLEPOINT_ERROR_FACTOR); the normal tail is taken through erfcx so that it
+#does not underflow:
+def logTailSaddlepoint(ratesA, ratesB):
+    from scipy import special
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    sqrtGap = (ratesB - ratesA) / (sqrtA + sqrtB)
+    w = np.sqrt(2) * sqrtGap
+    millsRatio = np.sqrt(np.pi / 2) * special.erfcx(sqrtGap)
+    inverseGap = np.expm1(0.5 * np.log1p(sqrtGap / sqrtA)) / w
+    return -sqrtGap**2 - 0.5 * np.log(2 * np.pi)                              \
+           + np.log(millsRatio + inverseGap)
+
+#-----------------------------------------------------------------------------#
+# Log-space versions, which stay finite where the probabilities themselves
+# underflow, e.g. for the tallies of electorates of 10^6 to 10^8 electors.
+#-----------------------------------------------------------------------------#
+
+#log P(X = 0) for every pair of rates:
+def logTieProbs(ratesA, ratesB, approxThreshold=None):
+    return byRegime(besselLogTieProbs, saddlepointLogTieProbs, ratesA, ratesB,\
+                    approxThreshold)
+
+#log P(X = -1) for every pair of rates:
+def logPivotProbs(ratesA, ratesB, approxThreshold=None):
+    return byRegime(besselLogPivotProbs, saddlepointLogPivotProbs, ratesA,    \
+                    ratesB, approxThreshold)
+
+#log P(X >= 0) for every pair of rates and, with withTailPairs, the pairs of
+#the exact regime that got it from the Lugannani-Rice tail (what
+#tailApproximatedPairs gives, without another chndtr pass):
+def logWinnerProbs(ratesA, ratesB, approxThreshold=None, withTailPairs=False):
+    ratesA, ratesB = np.broadcast_arrays(np.asarray(ratesA, dtype=float),     \
+                                         np.asarray(ratesB, dtype=float))
+    exact = ~approximatedPairs(ratesA, ratesB, approxThreshold)
+    logProbs = np.empty(ratesA.shape)
+    tailPairs = np.zeros(ratesA.shape, dtype=bool)
+    logProbs[exact], tailPairs[exact] = chndtrLogWinnerProbs(ratesA[exact],   \
+                                                             ratesB[exact])
+    logProbs[~exact] = saddlepointLogWinnerProbs(ratesA[~exact],              \
+                                                 ratesB[~exact])
+    if withTailPairs:
+        return logProbs, tailPairs
+    return logProbs
+
+#Function that gives the logs of tieProbs, pivotalityProbs and winnerProbs of
+#all ordered pairs of candidates for vote counts (..., K), with zeros (log 1)
+#on the diagonal, followed with withTailPairs by the tail pairs of
+#logWinnerProbs:
+def logProbabilityMatrices(othersVotes, approxThreshold=None,                 \
+                           withTailPairs=False):
+    ratesA, ratesB = rateMatrices(othersVotes)
+    diagonal = np.arange(ratesA.shape[-2])
+    winnerMatrix, tailPairs = logWinnerProbs(ratesA, ratesB, approxThreshold, \
+                                             withTailPairs=True)
+    matrices = (logTieProbs(ratesA, ratesB, approxThreshold),                 \
+                logPivotProbs(ratesA, ratesB, approxThreshold), winnerMatrix)
+    for matrix in matrices:
+        matrix[...,diagonal,diagonal] = 0
+    if withTailPairs:
+        tailPairs[...,diagonal,diagonal] = False
+        return matrices + (tailPairs,)
+    return matrices
+
+#log P(X = 0) through ive:
+def besselLogTieProbs(ratesA, ratesB):
+    from scipy import special
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return -(sqrtA - sqrtB)**2 + np.log(special.ive(0, 2 * sqrtA * sqrtB))
+
+#log P(X = -1) through ive:
+def besselLogPivotProbs(ratesA, ratesB):
+    from scipy import special
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return -(sqrtA - sqrtB)**2 + np.log(sqrtB) - np.log(sqrtA)                \
+           + np.log(special.ive(1, 2 * sqrtA * sqrtB))
+
+#log P(X >= 0) through chndtr, with the pairs that got it from the saddle
+#point. Only pairs with ratesA < ratesB can fall in the deep tail; those with
+#ratesA < ratesB / 4 sum the series P(X >= 0) = sum_k P(X = k), whose terms
+#shrink at least by half each time, and the rest, which only get there with
+#large rates, use the saddle point (with its error, see the header):
+def chndtrLogWinnerProbs(ratesA, ratesB):
+    probs = chndtrWinnerProbs(ratesA, ratesB)
+    with np.errstate(divide="ignore"):
+        logProbs = np.log(probs)
+    balanced = balancedDeepTail(ratesA, ratesB, probs)
+    lopsided = (probs < DEEP_TAIL) & ~balanced
+    logProbs[lopsided] = logTailSeries(ratesA[lopsided], ratesB[lopsided])
+    logProbs[balanced] = logTailSaddlepoint(ratesA[balanced], ratesB[balanced])
+    return logProbs, balanced
+
+#Function that tells which pairs of rates, given their 1 - chndtr winner
+#probabilities, are in the deep tail without being lopsided:
+def balancedDeepTail(ratesA, ratesB, winnerProbs):
+    return (winnerProbs < DEEP_TAIL) & (4 * ratesA >= ratesB)
+
+#log P(X >= 0) as log P(X = 0) plus the log of the first TAIL_SERIES_TERMS
+#terms of sum_k P(X = k) / P(X = 0):
+def logTailSeries(ratesA, ratesB):
+    from scipy import special
+    besselArg = 2 * np.sqrt(ratesA * ratesB)
+    orders = np.arange(TAIL_SERIES_TERMS)[:,None]
+    terms = (ratesA / ratesB)**(orders / 2.0) * special.ive(orders, besselArg)\
+            / special.ive(0, besselArg)
+    return besselLogTieProbs(ratesA, ratesB) + np.log(np.sum(terms, axis=0))
+
+#log P(X = 0) through the expansion of ive:
+def saddlepointLogTieProbs(ratesA, ratesB):
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return -(sqrtA - sqrtB)**2                                                \
+           + np.log(iveAsymptotic(0, 2 * sqrtA * sqrtB)[0])
+
+#log P(X = -1) through the expansion of ive:
+def saddlepointLogPivotProbs(ratesA, ratesB):
+    sqrtA = np.sqrt(ratesA)
+    sqrtB = np.sqrt(ratesB)
+    return -(sqrtA - sqrtB)**2 + np.log(sqrtB) - np.log(sqrtA)                \
+           + np.log(iveAsymptotic(1, 2 * sqrtA * sqrtB)[0])
+
+#log P(X >= 0) through the Lugannani-Rice formula (see
+#saddlepointWinnerProbs), which stays finite in the deep tail:
+def saddlepointLogWinnerProbs(ratesA, ratesB):
+    logProbs = np.empty(ratesA.shape)
+    below = ratesA < ratesB
+    notBelow = ~below
+    logProbs[below] = logTailSaddlepoint(ratesA[below], ratesB[below])
+    logProbs[notBelow] = np.log(saddlepointWinnerProbs(ratesA[notBelow],      \
+                                                       ratesB[notBelow]))
+    return logProbs
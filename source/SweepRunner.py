@@ -0,0 +1,243 @@
+#-----------------------------------------------------------------------------#
+# SweepRunner functions:
+#    Parameter sweeps over Cox1994Model.runSimulation. A sweep is a list of
+#    configs (or a grid of parameter values expanded into one) fanned out over
+#    a pool of worker processes, one per core by default. Every finished run
+#    is written right away as one JSON line of the output file, so a sweep
+#    that is stopped halfway keeps all the runs it finished.
+#
+#    A worker process that dies (e.g. killed for using too much memory) breaks
+#    the whole pool, and every run not finished yet fails with it, without
+#    telling which one caused it. Every run flags when it starts (in a shared
+#    array), so only the runs that had started are suspects: each of them is
+#    charged an attempt and run again alone, in a pool of its own, up to
+#    maxRetries times, and recorded as "crashed" after that. The runs that
+#    were still queued are resubmitted with the next pool without being
+#    charged, so a single crashing config cannot take healthy runs down with
+#    it. Runs that raise an exception are recorded as "error" right away,
+#    since running them again would raise it again.
+#
+#    Configs without a seed get the root seed of the sweep and their position
+#    in it as spawn key (see RandomStreams), so every run draws the same
+#    electorate whatever the number of workers, the order the runs finish in
+#    or how many times they were retried.
+#
+#    Sweeps using the "numba" kernel compile it once in the parent, so the
+#    workers only load it from Numba's disk cache.
+#
+#    With profileEvery, one run in every profileEvery (by position in the
+#    sweep) is profiled (see RunProfiler), its reports written next to the
+#    output file as <outputPath>.run<runID>.*; runs whose config already has
+#    a profilePath are profiled regardless.
+#
+#    summarizeSweep groups the records of a sweep by a config parameter and
+#    gives the iteration and wall-clock cost of each value, e.g. of each
+#    update schedule (updateMode) over the same electorates.
+#
+# Usage as a script:
+#    python SweepRunner.py sweep.json results.jsonl [nWorkers] [rootSeed]
+#                          [profileEvery]
+#    where sweep.json holds either a list of configs or a grid, i.e. a
+#    dictionary from parameter names to lists of values, or
+#    python SweepRunner.py --summary results.jsonl [parameter]
+#    to print the summary of a sweep by parameter (default: updateMode).
+#-----------------------------------------------------------------------------#
+import sys
+import json
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import Cox1994Model
+import RandomStreams
+import RunProfiler
+
+#Function that expands a grid, i.e. a dictionary from parameter names to the
+#list of values each takes, into the list of configs of all combinations:
+def expandGrid(grid):
+    names = sorted(grid)
+    return [dict(zip(names, values))                                          \
+            for values in itertools.product(*[grid[name] for name in names])]
+
+#Flags of the runs of the sweep that started, shared with the workers (see
+#initWorker):
+STARTED = None
+
+#Function run by every worker process as it starts, keeping the shared flags:
+def initWorker(startedFlags):
+    global STARTED
+    STARTED = startedFlags
+
+#Function run by the worker processes, flagging the run as started and giving
+#the result as plain values so that sending it back to the parent is cheap:
+def runSweepJob(runID, config):
+    STARTED[runID] = 1
+    config = dict(config)
+    config["verbose"] = False
+    return Cox1994Model.runSimulation(config).asDict()
+
+#Function that writes one record of the sweep as a JSON line, flushing it so
+#it reaches the disk as soon as the run is over:
+def writeRecord(outputFile, record):
+    outputFile.write(json.dumps(record) + "\n")
+    outputFile.flush()
+
+#Function that runs every config (or every combination of a grid) over nWorkers
+#processes (None: one per core), streaming the records to outputPath. Gives
+#the number of runs recorded with each status ("ok", "error", "crashed").
+#One run in every profileEvery is profiled (None: none):
+def runSweep(configs, outputPath, nWorkers=None, maxRetries=2, rootSeed=None, \
+             profileEvery=None):
+    if isinstance(configs, dict):
+        configs = expandGrid(configs)
+    configs = [Cox1994Model.completeConfig(config) for config in configs]
+    rootSeed = RandomStreams.seedSequence(rootSeed).entropy
+    for runID in range(0,len(configs)):
+        if configs[runID]["seed"] is None:
+            configs[runID]["seed"] = rootSeed
+            configs[runID]["spawnKey"] = (runID,)
+        if RunProfiler.isSampled(runID, profileEvery)                         \
+           and configs[runID]["profilePath"] is None:
+            configs[runID]["profilePath"] = outputPath + ".run" + str(runID)
+    if any(config["kernel"] == "numba" for config in configs):
+        import NumbaKernels
+        NumbaKernels.warmUp()
+    sweep = {"configs": configs, "attempts": [0] * len(configs),              \
+             "maxRetries": maxRetries,                                        \
+             "startedFlags": multiprocessing.Array("b", len(configs),         \
+                                                   lock=False),               \
+             "statusCounts": {"ok": 0, "error": 0, "crashed": 0}}
+    pendingIDs = list(range(0,len(configs)))
+    suspectIDs = []
+    with open(outputPath, "w") as outputFile:
+        sweep["outputFile"] = outputFile
+        while len(pendingIDs) > 0 or len(suspectIDs) > 0:
+            retryIDs = []
+            for runID in suspectIDs:
+                retryIDs += runPool(sweep, [runID], 1)[0]
+            suspectIDs = retryIDs
+            if len(pendingIDs) > 0:
+                newSuspectIDs, pendingIDs = runPool(sweep, pendingIDs,        \
+                                                    nWorkers)
+                suspectIDs += newSuspectIDs
+    return sweep["statusCounts"]
+
+#Function that runs the given runs of a sweep in a new pool of nWorkers
+#processes and records those that finished. Gives the runs to retry alone
+#(suspects of breaking the pool) and the runs to resubmit uncharged (queued
+#when it broke). A pool that breaks before any run started charges all of
+#them, as does a pool of a single run, so no run is resubmitted forever:
+def runPool(sweep, runIDs, nWorkers):
+    configs = sweep["configs"]
+    attempts = sweep["attempts"]
+    startedFlags = sweep["startedFlags"]
+    for runID in runIDs:
+        startedFlags[runID] = 0
+    executor = ProcessPoolExecutor(max_workers=nWorkers,                      \
+                                   initializer=initWorker,                    \
+                                   initargs=(startedFlags,))
+    futures = {}
+    for runID in runIDs:
+        futures[executor.submit(runSweepJob, runID, configs[runID])] = runID
+    brokenIDs = []
+    for future in as_completed(futures):
+        runID = futures[future]
+        record = {"runID": runID, "config": configs[runID]}
+        try:
+            record["result"] = future.result()
+            record["status"] = "ok"
+        except BrokenProcessPool:
+            brokenIDs.append(runID)
+            continue
+        except Exception as error:
+            record["status"] = "error"
+            record["error"] = repr(error)
+        attempts[runID] += 1
+        record["attempts"] = attempts[runID]
+        sweep["statusCounts"][record["status"]] += 1
+        writeRecord(sweep["outputFile"], record)
+    executor.shutdown(wait=True)
+    startedIDs = [runID for runID in brokenIDs if startedFlags[runID]]
+    if len(runIDs) == 1 or len(startedIDs) == 0:
+        startedIDs = brokenIDs
+    suspectIDs = []
+    for runID in sorted(startedIDs):
+        attempts[runID] += 1
+        if attempts[runID] <= sweep["maxRetries"]:
+            suspectIDs.append(runID)
+            continue
+        sweep["statusCounts"]["crashed"] += 1
+        writeRecord(sweep["outputFile"], {"runID": runID,                     \
+                                          "attempts": attempts[runID],        \
+                                          "config": configs[runID],           \
+                                          "status": "crashed"})
+    queuedIDs = sorted(set(brokenIDs) - set(startedIDs))
+    return suspectIDs, queuedIDs
+
+#Function that reads the records of a sweep and gives, for every value the
+#given config parameter takes, the number of runs, how many of them
+#converged, their mean number of iterations and their mean seconds of
+#iterations, in total and per iteration (runs that failed are left out):
+def summarizeSweep(recordsPath, parameter="updateMode"):
+    groups = {}
+    with open(recordsPath) as recordsFile:
+        for line in recordsFile:
+            record = json.loads(line)
+            if record["status"] != "ok":
+                continue
+            result = record["result"]
+            group = groups.setdefault(str(record["config"][parameter]),      \
+                                      {"nRuns": 0, "nConverged": 0,           \
+                                       "nIterations": 0, "seconds": 0.0})
+            group["nRuns"] += 1
+            group["nConverged"] += int(result["converged"])
+            group["nIterations"] += result["nIterations"]
+            group["seconds"] += result["timings"]["iterations"]
+    summary = {}
+    for value in groups:
+        group = groups[value]
+        summary[value] = {"nRuns": group["nRuns"],                            \
+                          "nConverged": group["nConverged"],                  \
+                          "meanIterations": float(group["nIterations"])       \
+                                            / group["nRuns"],                 \
+                          "meanSeconds": group["seconds"] / group["nRuns"],   \
+                          "secondsPerIteration": group["seconds"]             \
+                              / max(group["nIterations"] + group["nRuns"], 1)}
+    return summary
+
+
+#-----------------------------------------------------------------------------#
+# Running as a script:
+#-----------------------------------------------------------------------------#
+
+if __name__ == "__main__" and len(sys.argv) < 3:
+    print("Usage: python SweepRunner.py sweep.json results.jsonl [nWorkers] " \
+          + "[rootSeed] [profileEvery]\n"                                     \
+          + "       python SweepRunner.py --summary results.jsonl [parameter]")
+    sys.exit(2)
+elif __name__ == "__main__" and sys.argv[1] == "--summary":
+    parameter = "updateMode"
+    if len(sys.argv) > 3:
+        parameter = sys.argv[3]
+    summary = summarizeSweep(sys.argv[2], parameter)
+    for value in sorted(summary):
+        print(value + ": " + json.dumps(summary[value], sort_keys=True))
+elif __name__ == "__main__":
+    with open(sys.argv[1]) as sweepFile:
+        sweep = json.load(sweepFile)
+    nWorkers = None
+    rootSeed = None
+    profileEvery = None
+    if len(sys.argv) > 3:
+        nWorkers = int(sys.argv[3])
+    if len(sys.argv) > 4:
+        rootSeed = int(sys.argv[4])
+    if len(sys.argv) > 5:
+        profileEvery = int(sys.argv[5])
+    print(runSweep(sweep, sys.argv[2], nWorkers, rootSeed=rootSeed,          \
+                   profileEvery=profileEvery))
+
+#-----------------------------------------------------------------------------#
+# End of file
+#-----------------------------------------------------------------------------#
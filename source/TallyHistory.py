@@ -0,0 +1,76 @@
+#-----------------------------------------------------------------------------#
+# TallyHistory-owned Variables:
+#    cycleRepeats: number of times a cycle of tallies has to go round in a
+#                  row before the loop is stopped on it
+#    tallies: list with the tally counted at the end of every iteration
+#    matchRuns: dictionary from a candidate period to the number of
+#               iterations in a row whose tally matched the one that period
+#               earlier
+#    cyclePeriod: period of the cycle the loop stopped on (1 when the tally
+#                 stopped changing), None before
+#    cycleStates: list with the tallies of one period of that cycle
+#
+# The main loop used to stop only when two consecutive tallies were equal, so
+# an electorate oscillating between two or more tallies never stopped. Every
+# new tally is compared with the one each candidate period earlier, so a
+# cycle is found whatever its period, even one that goes through the same
+# tally more than once per period (A B A C A B A C ...), which the last
+# occurrence of each tally alone would take for a mix of shorter periods.
+# A repeated tally is not a repeated state, though: the strategic
+# utilities behind it keep drifting, and tallies often go round a cycle a few
+# times and then converge (in 480 runs of 60 and 300 electors, up to 9 times
+# before converging). A cycle only stops the loop once it went round
+# cycleRepeats times in a row. Iteration 0 is left out of the cycles, as its
+# tally is the sincere vote, which later iterations reaching it again do not
+# repeat; the loop still stops as converged when the tally of iteration 1 is
+# the same as the one of iteration 0 (see tallyUnchanged), as it always did.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+
+#Times a cycle has to go round before the loop is stopped on it:
+CYCLE_REPEATS = 10
+
+#Function that gives whether the tally of the given iteration is the same as
+#the one of the previous iteration, i.e. the stop rule of the main loop (and
+#of ReplicationBatch, which passes whole stacks of tallies, compared along
+#their last axis):
+def tallyUnchanged(iteration, lastTally, tally):
+    return (iteration >= 1) & np.all(np.asarray(lastTally)                    \
+                                     == np.asarray(tally), axis=-1)
+
+class TallyHistory(object):
+
+    #overload of class constructor, that initializes history-owned variables
+    def __init__(self, cycleRepeats=CYCLE_REPEATS):
+        self.cycleRepeats = cycleRepeats
+        self.tallies = []
+        self.matchRuns = {}
+        self.cyclePeriod = None
+        self.cycleStates = None
+
+    #record the tally counted at the end of the given iteration, and give
+    #"converged" if it is the same as the previous one, "cycle" if the
+    #tallies went round a longer cycle cycleRepeats times (see cyclePeriod
+    #and cycleStates), or None otherwise:
+    def record(self, iteration, tally):
+        tally = list(tally)
+        self.tallies.append(tally)
+        if iteration < 1:
+            return None
+        if tallyUnchanged(iteration, self.tallies[-2], tally):
+            self.cyclePeriod = 1
+            self.cycleStates = [tally]
+            return "converged"
+        for period in range(2, iteration):
+            if self.tallies[iteration - period] == tally:
+                self.matchRuns[period] = self.matchRuns.get(period, 0) + 1
+            else:
+                self.matchRuns[period] = 0
+        for period in range(2, iteration):
+            if self.matchRuns[period] >= period * (self.cycleRepeats - 1):
+                self.cyclePeriod = period
+                self.cycleStates = self.tallies[iteration - period + 1:       \
+                                                iteration + 1]
+                return "cycle"
+        return None
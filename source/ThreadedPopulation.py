@@ -0,0 +1,126 @@
+#-----------------------------------------------------------------------------#
+# ThreadedPopulation-owned Variables (besides those of ElectorPopulation):
+#    nThreads: number of worker threads
+#    blockSize: number of electors in each block
+#    executor: ThreadPoolExecutor whose threads update the blocks
+#
+# A ThreadedPopulation is an ElectorPopulation whose electorate is split into
+# cache-sized blocks (BLOCK_BYTES of utilities each), counted and updated by a
+# pool of threads. The threads work on the population arrays themselves, so
+# there is nothing to copy or pickle, and the NumPy kernels they spend their
+# time in (argmax, bincount, the matrix products and elementwise arithmetic of
+# the update) release the GIL. Pivotalities are still computed once per
+# context by the calling thread. Tallies are exactly those of the serial path.
+#
+# The sequential updates go a run of electors at a time (see ElectorPopulation.
+# updateSequential), and only the runs longer than a block are split among the
+# threads: those of the late iterations, where few electors still switch. In
+# the early ones, where many do, a sequential iteration takes about as long
+# as a serial one, so the thresholds below are those of the synchronous
+# updates, and the threads pay off with the sequential ones only as the run
+# settles.
+#
+# Which backend to use, given the costs of one synchronous iteration measured
+# on a single core with 4 candidates in log space: about 0.5 microseconds per
+# elector, plus a fixed 2.5 milliseconds for the pivotalities of the contexts
+# (never parallelized). Thread blocks add no measurable cost (cache-sized
+# blocks are even a little faster: 0.71 s instead of 0.99 s per iteration
+# with 2*10^6 electors), while the process pool costs about 2 milliseconds per
+# round trip, three per iteration, plus 15 to 130 milliseconds to start it and
+# map the shared memory:
+#  - serial ElectorPopulation below THREADED_MIN_ELECTORS electors, where
+#    the fixed cost of the contexts is most of the iteration;
+#  - ThreadedPopulation from THREADED_MIN_ELECTORS up, where every thread gets
+#    whole blocks and the update takes over 10 milliseconds;
+#  - ShardedPopulation from SHARDED_MIN_ELECTORS up, where an iteration takes
+#    about a second serially, so the process costs are negligible, and the
+#    parts of the update that hold the GIL (fancy indexing, Python glue
+#    between kernels) would otherwise serialize the threads.
+# suggestBackend applies these thresholds.
+#-----------------------------------------------------------------------------#
+
+from concurrent.futures import ThreadPoolExecutor
+import RandomStreams
+import numpy as np
+from ElectorPopulation import ElectorPopulation, calcRunBlock
+
+#Bytes of utilities per block, so that the arrays a block touches fit in a
+#core's L2 cache:
+BLOCK_BYTES = 2**18
+
+#Electorate sizes from which the threaded and the multiprocess backends pay
+#off (see the header):
+THREADED_MIN_ELECTORS = 2 * 10**4
+SHARDED_MIN_ELECTORS = 2 * 10**6
+
+#Function that gives the backend suggested for an electorate ("serial",
+#"threads" or "processes"):
+def suggestBackend(nElectors, nCores):
+    if nCores <= 1 or nElectors < THREADED_MIN_ELECTORS:
+        return "serial"
+    elif nElectors < SHARDED_MIN_ELECTORS:
+        return "threads"
+    else:
+        return "processes"
+
+class ThreadedPopulation(ElectorPopulation):
+
+    #overload of class constructor, that initializes the population arrays
+    #and starts the thread pool
+    def __init__(self, nElectors, nCandidates, nThreads, logSpace=False,      \
+                 approxThreshold=None, kernel="numpy", blockSize=None,        \
+                 precision="float64"):
+        ElectorPopulation.__init__(self, nElectors, nCandidates, logSpace,    \
+                                   approxThreshold, kernel, precision)
+        self.nThreads = nThreads
+        if blockSize is None:
+            blockSize = max(BLOCK_BYTES // (self.sincereUtilities.itemsize    \
+                                            * nCandidates), 1)
+        self.blockSize = blockSize
+        self.executor = ThreadPoolExecutor(max_workers=nThreads)
+
+    #give the (first, last + 1) elector of every cache-sized block:
+    def blocks(self):
+        return [(firstElector, min(firstElector + self.blockSize,             \
+                                   self.nElectors))                           \
+                for firstElector in range(0, self.nElectors, self.blockSize)]
+
+    #give blocks aligned to the random streams, so no stream is drawn twice:
+    def drawBlocks(self):
+        return [(firstElector, min(firstElector + RandomStreams.ELECTOR_BLOCK,\
+                                   self.nElectors))                           \
+                for firstElector in range(0, self.nElectors,                  \
+                                          RandomStreams.ELECTOR_BLOCK)]
+
+    #apply a block function to every block in the thread pool:
+    def mapBlocks(self, blockFunction, blockArguments, blockBounds=None):
+        if blockBounds is None:
+            blockBounds = self.blocks()
+        arrays = self.populationArrays()
+        futures = [self.executor.submit(blockFunction, arrays, bounds,        \
+                                        *blockArguments)                      \
+                   for bounds in blockBounds]
+        return [future.result() for future in futures]
+
+    #overload of the utilities of a run of the sequential update, splitting
+    #runs longer than a block among the threads (their contexts are computed
+    #once, by the calling thread):
+    def calcRunUtilities(self, electorIDs, MIN_UTIL, iteration):
+        if len(electorIDs) <= self.blockSize:
+            return ElectorPopulation.calcRunUtilities(self, electorIDs,       \
+                                                      MIN_UTIL, iteration)
+        arrays = self.populationArrays()
+        contexts = self.runContexts(electorIDs)
+        futures = [self.executor.submit(calcRunBlock, arrays,                 \
+                                        electorIDs[first:first                \
+                                                   + self.blockSize],         \
+                                        contexts, MIN_UTIL, iteration,        \
+                                        self.logSpace)                        \
+                   for first in range(0, len(electorIDs), self.blockSize)]
+        results = [future.result() for future in futures]
+        return tuple(np.concatenate([result[part] for result in results])     \
+                     for part in range(0,3))
+
+    #stop the threads:
+    def close(self):
+        self.executor.shutdown(wait=True)
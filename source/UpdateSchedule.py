@@ -0,0 +1,119 @@
+#-----------------------------------------------------------------------------#
+# UpdateSchedule-owned Variables:
+#    updateFraction: fraction of the electors that update their strategic
+#                    utilities in each iteration of the "partial" mode
+#    damping: fraction of the previous strategic utilities each elector keeps
+#             in each iteration of the "damped" mode
+#    seedSequence: SeedSequence every random draw of the schedule comes from;
+#                  iteration i draws from its child (i,)
+#
+# In the synchronous update every elector reacts to the same tally at once,
+# which often swings whole groups of electors from one candidate to another
+# and back. The schedules below slow those swings down:
+#  - "partial": only a random updateFraction of the electors, drawn anew each
+#    iteration, update; the others keep their utilities (and vote) as they
+#    were;
+#  - "damped": every elector updates, but keeps damping times its previous
+#    strategic utilities, i.e. new = damping * previous + (1 - damping) *
+#    update, with the previous utilities brought to the scale (largest
+#    absolute utility) of the update first. Each update shrinks the utilities
+#    by the pivotalities, so blending them as they are would let the previous
+#    ones outweigh the update by orders of magnitude and freeze every vote;
+#    blending rows of the same scale damps the choices only, and keeps the
+#    scale the update would give. The first update (iteration 0) is left
+#    undamped, as the utilities before it are the sincere ones;
+#  - "randomSequential": the sequential update, going through the electors
+#    in a random order drawn anew each iteration.
+# "partial" and "damped" run the update of the chosen kernel on a whole block
+# and then restore or blend its rows with a few array operations (see
+# scheduleBlock), so they work with every kernel and backend. The electors
+# that update are drawn by blocks of RandomStreams.ELECTOR_BLOCK, so a shard
+# draws exactly the ones the whole electorate would.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import RandomStreams
+
+#Fraction of electors updating in each iteration of the "partial" mode:
+UPDATE_FRACTION = 0.5
+
+#Fraction of the previous utilities kept in the "damped" mode:
+DAMPING = 0.5
+
+#Update modes whose block update goes through scheduleBlock:
+BLOCK_SCHEDULES = ["partial", "damped"]
+
+class UpdateSchedule(object):
+
+    #overload of class constructor, that initializes schedule-owned variables
+    def __init__(self, updateFraction=UPDATE_FRACTION, damping=DAMPING,       \
+                 seedSequence=None):
+        if not 0 < updateFraction <= 1:
+            raise ValueError("Unknown update fraction: " + str(updateFraction))
+        if not 0 <= damping < 1:
+            raise ValueError("Unknown damping: " + str(damping))
+        if seedSequence is None:
+            seedSequence = RandomStreams.seedSequence()
+        self.updateFraction = updateFraction
+        self.damping = damping
+        self.seedSequence = seedSequence
+
+    #give a (lastElector - firstElector,) bool array telling which electors of
+    #the range update in the given iteration of the "partial" mode:
+    def updatingElectors(self, iteration, nElectors, firstElector,            \
+                         lastElector):
+        return RandomStreams.drawRowBlocks(                                   \
+            RandomStreams.childSequence(self.seedSequence, iteration),        \
+            nElectors,                                                        \
+            lambda randomState, nRows: randomState.random(nRows)              \
+                                       < self.updateFraction,                 \
+            firstElector, lastElector)
+
+    #give the order electors are updated in, in the given iteration of the
+    #"randomSequential" mode:
+    def electorOrder(self, iteration, nElectors):
+        randomState = np.random.default_rng(                                  \
+            RandomStreams.childSequence(self.seedSequence, iteration))
+        return randomState.permutation(nElectors)
+
+
+#Block function (see ElectorPopulation.mapBlocks) that updates a block with
+#the given block update function and then applies the "partial" or "damped"
+#schedule to its rows. Gives what the update function gave:
+def scheduleBlock(arrays, bounds, updateBlockFunction, update, schedule,      \
+                  contexts, MIN_UTIL, iteration, logSpace):
+    block = slice(bounds[0], bounds[1])
+    if bounds[1] <= bounds[0] or (update == "damped" and iteration == 0):
+        return updateBlockFunction(arrays, bounds, contexts, MIN_UTIL,        \
+                                   iteration, logSpace)
+    lastUtilities = np.array(arrays["strategicUtilities"][block])
+    lastLogScales = np.array(arrays["utilityLogScales"][block])
+    nPrecisionFlags = updateBlockFunction(arrays, bounds, contexts, MIN_UTIL, \
+                                          iteration, logSpace)
+    utilities = arrays["strategicUtilities"][block]
+    logScales = arrays["utilityLogScales"][block]
+    if update == "partial":
+        kept = ~schedule.updatingElectors(iteration,                          \
+                                          arrays["sincereUtilities"].shape[0],\
+                                          bounds[0], bounds[1])
+        utilities[kept] = lastUtilities[kept]
+        logScales[kept] = lastLogScales[kept]
+    elif update == "damped":
+        utilities[:] = dampUtilities(lastUtilities, utilities,                \
+                                     schedule.damping, MIN_UTIL)
+    return nPrecisionFlags
+
+#Function that gives damping * last + (1 - damping) * new for rows of
+#utilities, each row of the last ones brought to the largest absolute utility
+#of the new one (rows of zeros are left out). The entries set to MIN_UTIL
+#stay so:
+def dampUtilities(lastUtilities, utilities, damping, MIN_UTIL):
+    kept = (utilities != MIN_UTIL) & (lastUtilities != MIN_UTIL)
+    lastScales = np.max(np.where(kept, np.abs(lastUtilities), 0), axis=1)
+    scales = np.max(np.where(kept, np.abs(utilities), 0), axis=1)
+    factors = np.where(lastScales > 0, scales / np.where(lastScales > 0,      \
+                                                         lastScales, 1), 0)
+    dampedUtilities = damping * lastUtilities * factors[:,None]               \
+                      + (1 - damping) * utilities
+    dampedUtilities[~kept] = utilities[~kept]
+    return dampedUtilities
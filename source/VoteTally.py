@@ -0,0 +1,49 @@
+#-----------------------------------------------------------------------------#
+# VoteTally-owned Variables:
+#    nCandidates: number of candidates
+#    votes: array with the current vote intention towards each candidate
+#
+# The tally is counted once per iteration and then kept up to date in O(1)
+# whenever an elector switches candidates, so electors can read the vote
+# intentions of everybody else without recounting the whole electorate and
+# without touching Candidate.voteIntention.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+
+class VoteTally(object):
+
+    #overload of class constructor, that initializes tally-owned variables
+    def __init__(self, nCandidates):
+        self.nCandidates = nCandidates
+        self.votes = np.zeros(nCandidates, dtype=int)
+
+    #count the tally from scratch, given the ID of the candidate each elector
+    #currently intends to vote for:
+    def recount(self, chosenCandidates):
+        self.votes[:] = np.bincount(chosenCandidates, minlength=self.nCandidates)
+        return self.votes
+
+    #count the tally from scratch from a list of Elector objects, using the
+    #same choice rule as GlobalFuncs.countVoteIntentions:
+    def recountElectors(self, passedElectors, passedCandidates, iteration):
+        self.votes[:] = 0
+        for elector in passedElectors:
+            self.votes[elector.chooseCandidate(passedCandidates, iteration).ID] += 1
+        return self.votes
+
+    #move one vote from a candidate to another one:
+    def switch(self, fromCandidateID, toCandidateID):
+        self.votes[fromCandidateID] -= 1
+        self.votes[toCandidateID] += 1
+
+    #give the vote intentions of everybody except one elector currently
+    #intending to vote for chosenCandidateID:
+    def othersVotes(self, chosenCandidateID):
+        othersVotes = self.votes.tolist()
+        othersVotes[chosenCandidateID] = othersVotes[chosenCandidateID] - 1
+        return othersVotes
+
+    #give the current tally as a plain list, as GlobalFuncs.countVoteIntentions:
+    def asList(self):
+        return self.votes.tolist()
@@ -0,0 +1,199 @@
+#-----------------------------------------------------------------------------#
+# Tests of the model's building blocks, run with pytest from this directory.
+#-----------------------------------------------------------------------------#
+
+import numpy as np
+import pytest
+from scipy.stats import skellam
+
+import Cox1994Model
+import RandomStreams
+import Skellam
+from Candidate import Candidate
+from ElectorPopulation import ElectorPopulation
+from ReplicationBatch import ReplicationBatch
+from TallyHistory import TallyHistory
+
+#Vote counts the Skellam terms are checked on, from even to lopsided:
+SKELLAM_TALLIES = [[10, 12, 9, 15], [40, 150, 3, 7], [250, 260, 1, 489],      \
+                   [1000, 1200, 900, 30]]
+
+#Smallest tie and pivot probabilities scipy.stats.skellam is compared on, as
+#below it drifts, and smallest winner probabilities, as below them its 1 -
+#chndtr has lost too many digits (see the header of Skellam):
+SCIPY_FLOORS = (10**-30, 10**-30, Skellam.DEEP_TAIL)
+
+#Function that gives the tie, pivot and winner probabilities of every ordered
+#pair of candidates by scipy.stats.skellam, with ones on the diagonal:
+def scipyProbabilityMatrices(othersVotes):
+    ratesA, ratesB = Skellam.rateMatrices(othersVotes)
+    ratesA, ratesB = np.broadcast_arrays(ratesA, ratesB)
+    matrices = (skellam.pmf(0, ratesA, ratesB),                               \
+                skellam.pmf(-1, ratesA, ratesB),                              \
+                skellam.sf(-1, ratesA, ratesB))
+    for matrix in matrices:
+        np.fill_diagonal(matrix, 1)
+    return matrices
+
+#Function that checks the given matrices against scipy.stats.skellam within
+#the given relative errors, where scipy gives more than SCIPY_FLOORS:
+def assertMatchesScipy(matrices, othersVotes, errors):
+    for matrix, expected, floor in zip(matrices,                              \
+                                       scipyProbabilityMatrices(othersVotes), \
+                                       SCIPY_FLOORS):
+        compared = expected > floor
+        assert np.all(np.abs(matrix[compared] / expected[compared] - 1)       \
+                      <= errors[compared])
+
+#the Bessel backend gives the terms of scipy.stats.skellam:
+@pytest.mark.parametrize("othersVotes", SKELLAM_TALLIES)
+def testSkellamMatchesScipy(othersVotes):
+    assertMatchesScipy(Skellam.probabilityMatrices(othersVotes), othersVotes, \
+                       np.full((4,4), 1e-10))
+
+#the log-space backend gives the logs of the same terms, but for the winner
+#of the pairs it takes from the Lugannani-Rice tail, within its estimate:
+@pytest.mark.parametrize("othersVotes", SKELLAM_TALLIES)
+def testLogSkellamMatchesScipy(othersVotes):
+    ratesA, ratesB = Skellam.rateMatrices(othersVotes)
+    errors = Skellam.approximationErrors(ratesA, ratesB, None, logSpace=True)
+    logMatrices = Skellam.logProbabilityMatrices(othersVotes)
+    assertMatchesScipy([np.exp(logMatrix) for logMatrix in logMatrices],      \
+                       othersVotes, errors + 1e-8)
+
+#the saddle point regime stays within its estimated error of scipy:
+@pytest.mark.parametrize("othersVotes", SKELLAM_TALLIES[2:])
+def testSaddlepointWithinEstimatedError(othersVotes):
+    approxThreshold = 200
+    ratesA, ratesB = Skellam.rateMatrices(othersVotes)
+    errors = Skellam.approximationErrors(ratesA, ratesB, approxThreshold)
+    assert np.any(errors > 0)
+    assertMatchesScipy(Skellam.probabilityMatrices(othersVotes,               \
+                                                   approxThreshold),          \
+                       othersVotes, errors + 1e-10)
+
+#the Lugannani-Rice tail of nearly equal large rates keeps its precision:
+def testSaddlepointTailNearlyEqualRates():
+    ratesA, ratesB = np.array([1e8]), np.array([1e8 + 1])
+    expected = skellam.sf(-1, ratesA, ratesB)
+    probs = np.exp(Skellam.logTailSaddlepoint(ratesA, ratesB))
+    assert np.abs(probs / expected - 1)[0] < 1e-10
+
+
+#Function that records the given tallies, one per iteration, and gives the
+#first iteration the history stopped on with its stop reason (or None):
+def recordTallies(history, tallies):
+    for iteration in range(0,len(tallies)):
+        stopReason = history.record(iteration, tallies[iteration])
+        if stopReason is not None:
+            return iteration, stopReason
+    return None
+
+#two equal tallies in a row stop the loop as converged:
+def testTallyHistoryConverged():
+    history = TallyHistory(cycleRepeats=3)
+    assert recordTallies(history, [[5,5], [6,4], [7,3], [7,3]])               \
+        == (3, "converged")
+    assert history.cyclePeriod == 1
+
+#a cycle of period 2 stops the loop once it went round cycleRepeats times:
+def testTallyHistoryCycle():
+    history = TallyHistory(cycleRepeats=3)
+    A, B = [6,4], [4,6]
+    assert recordTallies(history, [[5,5]] + [A,B] * 3) == (6, "cycle")
+    assert history.cyclePeriod == 2
+    assert history.cycleStates == [A,B]
+
+#a cycle going through the same tally twice per period (A B A C) is found
+#with its whole period, not as shorter cycles:
+def testTallyHistoryRepeatedStateInCycle():
+    history = TallyHistory(cycleRepeats=3)
+    A, B, C = [6,4], [4,6], [3,7]
+    assert recordTallies(history, [[5,5]] + [A,B,A,C] * 3) == (12, "cycle")
+    assert history.cyclePeriod == 4
+    assert history.cycleStates == [A,B,A,C]
+
+#a cycle that is left before going round cycleRepeats times does not stop
+#the loop:
+def testTallyHistoryCycleLeft():
+    history = TallyHistory(cycleRepeats=3)
+    A, B, C = [6,4], [4,6], [3,7]
+    assert recordTallies(history, [[5,5]] + [A,B] * 2 + [C,A,B]) is None
+
+
+#every backend runs every update mode, with the tallies of a serial run:
+@pytest.mark.parametrize("updateMode", ["sequential", "randomSequential",     \
+                                        "synchronous"])
+@pytest.mark.parametrize("backend", [{"nThreads": 2}, {"nShards": 2}])
+def testBackendsRunEveryUpdateMode(updateMode, backend):
+    config = {"nElectors": 200, "seed": 5, "updateMode": updateMode}
+    serial = Cox1994Model.runSimulation(config)
+    parallel = Cox1994Model.runSimulation(dict(config, **backend))
+    assert parallel.tallies == serial.tallies
+    assert parallel.nIterations == serial.nIterations
+    assert parallel.nPrecisionFlags == serial.nPrecisionFlags
+
+#a replication batch only runs the synchronous dynamics:
+def testReplicationBatchRefusesSequential():
+    with pytest.raises(ValueError):
+        ReplicationBatch(2, 10, 4, updateMode="sequential")
+
+
+#Function that gives a population of the given kind after a few synchronous
+#iterations, with the true strategic utilities of its electors:
+def iteratedPopulation(**arguments):
+    allCandidates = [Candidate(candidateID) for candidateID in range(0,4)]
+    population = ElectorPopulation(300, 4, **arguments)
+    population.calcSincereUtilities(allCandidates, 0, 100, "uniform",         \
+                                    RandomStreams.seedSequence(1))
+    for iteration in range(0,3):
+        population.calculateStrategicUtilities(allCandidates,                 \
+                                               Cox1994Model.MIN_UTIL,         \
+                                               iteration, "synchronous")
+        population.countVoteIntentions(allCandidates, iteration)
+    utilities = population.strategicUtilities.astype(float)                   \
+                * np.exp(population.utilityLogScales)[:,None]
+    return population, utilities
+
+#views read the true utilities of scaled populations and write them back
+#unchanged:
+@pytest.mark.parametrize("arguments", [{"logSpace": True},                    \
+                                       {"precision": "float32"},              \
+                                       {"precision": "float32",               \
+                                        "logSpace": True}])
+def testElectorViewScaledPopulations(arguments):
+    population, utilities = iteratedPopulation(**arguments)
+    assert np.any(population.utilityLogScales != 0)
+    for electorID in [0, 7, 299]:
+        view = population.elector(electorID)
+        kept = np.arange(4) != np.argmin(view.sincereUtilities)
+        read = np.array(view.strategicUtilities)
+        np.testing.assert_allclose(read[kept], utilities[electorID][kept],    \
+                                   rtol=1e-6)
+        assert read[~kept][0] == Cox1994Model.MIN_UTIL
+        assert np.argmax(read) == population.chosenCandidates[electorID]
+        view.strategicUtilities = read
+        np.testing.assert_allclose(np.array(view.strategicUtilities)[kept],   \
+                                   read[kept], rtol=1e-6)
+
+#writing into a scaled row read through a view fails instead of being lost:
+def testElectorViewScaledRowReadOnly():
+    population, utilities = iteratedPopulation(precision="float32")
+    with pytest.raises(ValueError):
+        population.elector(0).strategicUtilities[0] = 1
+
+
+#a replication batch gives each replication the run runSimulation gives with
+#the synchronous update and that replication's spawn key:
+def testReplicationBatchMatchesRunSimulation():
+    batch = ReplicationBatch(4, 100, 4,                                       \
+                             maxIterations=Cox1994Model.MAX_ITERATION)
+    batch.calcSincereUtilities(0, 100, "uniform", RandomStreams.seedSequence(3))
+    tallies, nIterations = batch.run(Cox1994Model.MIN_UTIL)
+    for replicationID in range(0,4):
+        result = Cox1994Model.runSimulation({"nElectors": 100, "seed": 3,     \
+                                             "spawnKey": (replicationID,),    \
+                                             "updateMode": "synchronous"})
+        assert list(tallies[replicationID]) == result.tallies
+        assert nIterations[replicationID] == result.nIterations
+        assert batch.stopReasons[replicationID] == result.stopReason